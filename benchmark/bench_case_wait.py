@@ -0,0 +1,64 @@
+"""_summary_
+Caseの待機方式のベンチマーク。
+固定sleep(旧実装)とready_conditionによる待機とで、複数ステップのCaseの所要時間を比較する。
+
+    Usage:
+        python -m benchmark.bench_case_wait
+"""
+import time
+
+from benchmark.fixture_server import FixtureServer
+from lib.case import Case
+from lib.e2e_util import Util
+from lib.operation import Click, Get, Input, Submit
+
+
+class FixedSleepCase(Case):
+    """比較用: 旧実装と同じく各Operationの前に1秒、最後に2秒sleepする"""
+
+    def exec_operation(self, driver=None):
+        for operation in self.operations:
+            time.sleep(1)
+            operation.exec()
+        time.sleep(2)
+        if driver != None:
+            return driver.page_source
+
+
+def build_case(case_class, driver, server):
+    return case_class(
+        Get(driver, server.url("/login")),
+        Input(driver, "//*[@name='login_id']", "user01"),
+        Input(driver, "//*[@name='password']", "password"),
+        Submit(driver, "//form[@name='login_form']"),
+        Click(driver, "//a[@id='items_link']"),
+        Get(driver, server.url("/items?rows=200")),
+    )
+
+
+def measure(case_class, driver, server, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        case = build_case(case_class, driver, server)
+        started = time.perf_counter()
+        case.exec_operation(driver)
+        elapsed.append(time.perf_counter() - started)
+    return case, elapsed
+
+
+def main(repeat=3):
+    with FixtureServer() as server:
+        driver = Util.create_driver(True, True)
+        try:
+            _, fixed = measure(FixedSleepCase, driver, server, repeat)
+            case, adaptive = measure(Case, driver, server, repeat)
+        finally:
+            driver.quit()
+
+    print(f"fixed sleep : avg {sum(fixed) / len(fixed):.3f}s  {fixed}")
+    print(f"adaptive    : avg {sum(adaptive) / len(adaptive):.3f}s  {adaptive}")
+    print(case.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""_summary_
+SpreadsheetWriterの一括削除のAPI呼び出し回数のベンチマーク。
+fakeのDrive APIに大量のファイルを作成し、ページングとバッチ削除の呼び出し回数を確認する。
+
+    Usage:
+        python -m benchmark.bench_drive_delete
+"""
+import time
+
+from lib.spreadsheet_writer import SpreadsheetWriter
+from testing.fake_google import FakeDriveService, FakeGspreadClient
+
+
+def main(files=5000):
+    drive = FakeDriveService(rate_limit_every=50)
+    writer = SpreadsheetWriter(None, "bench", client=FakeGspreadClient(), drive_service=drive)
+    # fakeなので待機しない
+    writer.BACKOFF_BASE = 0.0
+    for i in range(files):
+        drive.add_file(f"sheet{i}")
+
+    started = time.perf_counter()
+    result = writer.delete_all_spreadsheets()
+    elapsed = time.perf_counter() - started
+
+    assert not drive.files_by_id, len(drive.files_by_id)
+    print(f"files            : {files}")
+    print(f"one-by-one calls : {files + 1} (first page only: 100 files)")
+    print(f"batched calls    : {dict(drive.calls)}")
+    print(f"result           : {result}")
+    print(f"elapsed          : {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""_summary_
+BeautifulSoup(html.parser)とlib.extractor(lxml)の抽出速度・メモリ使用量のベンチマーク。
+
+    Usage:
+        python -m benchmark.bench_extract
+"""
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from benchmark.fixture_server import items_page
+from lib.extractor import Extractor, Field
+
+
+def extract_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    rows = []
+    for tr in soup.find("table", id="items").find_all("tr"):
+        tds = tr.find_all("td")
+        if tds:
+            rows.append({"id": tds[0].get_text(strip=True), "name": tds[1].get_text(strip=True)})
+    return rows
+
+
+EXTRACTOR = Extractor("//table[@id='items']//tr[td]", [Field("id", "td[1]"), Field("name", "td[2]")])
+
+
+def extract_lxml(html):
+    return EXTRACTOR.extract(html)
+
+
+def extract_iterparse(html):
+    return list(EXTRACTOR.iterextract(html, tag="tr", row_filter="td"))
+
+
+def extract_iterparse_count(html):
+    # レコードを溜めずに処理する場合
+    return sum(1 for _ in EXTRACTOR.iterextract(html, tag="tr", row_filter="td"))
+
+
+def measure(func, html):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(html)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main(rows=20000):
+    html = items_page(rows)
+    print(f"page: {len(html) / 1024 / 1024:.1f}MB, {rows} rows")
+    for func in (extract_bs4, extract_lxml, extract_iterparse, extract_iterparse_count):
+        elapsed, peak, result = measure(func, html)
+        count = result if isinstance(result, int) else len(result)
+        print(f"{func.__name__:<24} {elapsed * 1000:9.1f}ms  peak {peak / 1024 / 1024:7.1f}MB  rows {count}")
+
+
+if __name__ == "__main__":
+    main()
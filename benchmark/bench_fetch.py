@@ -0,0 +1,43 @@
+"""_summary_
+Selenium(Get)とHTTPの高速パス(Fetch)で同じページを取得する時間のベンチマーク。
+
+    Usage:
+        python -m benchmark.bench_fetch
+"""
+import time
+
+from benchmark.fixture_server import FixtureServer
+from lib.case import Case
+from lib.e2e_util import Util
+from lib.http_session import HttpSession
+from lib.operation import Fetch, Get
+
+
+def measure(case, driver, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        html = case.exec_operation(driver)
+    return (time.perf_counter() - started) / repeat, len(html)
+
+
+def main(repeat=20, use_browser=True):
+    with FixtureServer() as server:
+        url = server.url("/items?rows=500")
+
+        session = HttpSession()
+        http_time, http_size = measure(Case(Fetch(session, url)), session, repeat)
+        print(f"fetch    : {http_time * 1000:8.2f}ms/page  {http_size} chars"
+              f"  (304: {session.not_modified}/{repeat})")
+        session.close()
+
+        if use_browser:
+            driver = Util.create_driver(True, True)
+            try:
+                selenium_time, selenium_size = measure(Case(Get(driver, url)), driver, repeat)
+            finally:
+                driver.quit()
+            print(f"selenium : {selenium_time * 1000:8.2f}ms/page  {selenium_size} chars")
+
+
+if __name__ == "__main__":
+    main()
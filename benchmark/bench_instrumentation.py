@@ -0,0 +1,46 @@
+"""_summary_
+lib.instrumentationによるOperation.execのラップのオーバーヘッドを測る。
+ブラウザは使わず、何もしないOperationを繰り返し実行する。
+
+    Usage:
+        python -m benchmark.bench_instrumentation
+"""
+import time
+
+from lib.instrumentation import tracer
+from lib.operation import Operation
+
+
+class Noop(Operation):
+    def exec(self):
+        pass
+
+
+def raw_exec(self):
+    pass
+
+
+def measure(func, operation, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        func(operation)
+    return (time.perf_counter() - started) / n * 1e9
+
+
+def main(n=200000):
+    operation = Noop(None)
+    raw = measure(raw_exec, operation, n)
+    tracer.disable()
+    disabled = measure(Noop.exec, operation, n)
+    tracer.enable()
+    enabled = measure(Noop.exec, operation, n)
+    tracer.disable()
+    tracer.reset()
+
+    print(f"{'raw':<10} {raw:8.0f} ns/call")
+    print(f"{'disabled':<10} {disabled:8.0f} ns/call  (+{disabled - raw:.0f} ns)")
+    print(f"{'enabled':<10} {enabled:8.0f} ns/call  (+{enabled - raw:.0f} ns)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""_summary_
+要素検索のベンチマーク。
+操作ごとにWebDriverWaitを作成してXPathを探し直す従来の方法(+implicitly_wait)と、
+lib.lookup.ElementLookup(WebDriverWaitの使い回し・要素のキャッシュ・明示的な待機のみ)を比べる。
+
+ブラウザを使わず、コマンド1回ごとにlatency秒かかる疑似driverで
+WebDriverとの往復回数の差を測る。use_browser=Trueなら実ブラウザでも測る。
+
+    Usage:
+        python -m benchmark.bench_lookup
+"""
+import time
+
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from benchmark.fixture_server import FixtureServer
+from lib.e2e_util import Util
+from lib.lookup import ElementLookup
+
+
+class FakeElement:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def is_displayed(self):
+        self.driver.command()
+        return True
+
+    def send_keys(self, value):
+        self.driver.command()
+
+    def click(self):
+        self.driver.command()
+
+
+class FakeDriver:
+    """コマンドごとにlatency秒かかり、暗黙の待機(implicit_wait)を再現するdriver"""
+
+    def __init__(self, latency=0.002, implicit_wait=0.0, elements=()):
+        self.latency = latency
+        self.implicit_wait = implicit_wait
+        self.elements = set(elements)
+        self.commands = 0
+
+    def command(self):
+        self.commands += 1
+        time.sleep(self.latency)
+
+    def find_element(self, by, value):
+        self.command()
+        if value not in self.elements:
+            time.sleep(self.implicit_wait)
+            raise NoSuchElementException(value)
+        return FakeElement(self)
+
+
+FORM = ["//input[@name='q']", "//input[@name='from']", "//input[@name='to']", "//button[@id='search']"]
+
+
+def legacy_steps(driver, repeat):
+    # 従来のOperation.exec: 操作ごとにWebDriverWaitを作成し、毎回探し直す
+    for _ in range(repeat):
+        for xpath in FORM:
+            wait = WebDriverWait(driver, 10)
+            element = wait.until(EC.visibility_of_element_located((By.XPATH, xpath)))
+            element.send_keys("x")
+
+
+def lookup_steps(driver, repeat):
+    lookup = ElementLookup.of(driver)
+    for _ in range(repeat):
+        for xpath in FORM:
+            lookup.perform(xpath, lambda element: element.send_keys("x"), visible=True)
+
+
+def legacy_missing(driver, timeout):
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, "//missing"))
+        )
+    except TimeoutException:
+        pass
+
+
+def lookup_missing(driver, timeout):
+    try:
+        ElementLookup.of(driver).find("//missing", timeout=timeout)
+    except TimeoutException:
+        pass
+
+
+def measure(func, driver, *args):
+    started = time.perf_counter()
+    func(driver, *args)
+    return time.perf_counter() - started
+
+
+def main(repeat=50, latency=0.002, use_browser=False):
+    steps = repeat * len(FORM)
+
+    legacy = FakeDriver(latency, elements=FORM)
+    legacy_time = measure(legacy_steps, legacy, repeat)
+    cached = FakeDriver(latency, elements=FORM)
+    cached_time = measure(lookup_steps, cached, repeat)
+    for name, elapsed, driver in (("legacy", legacy_time, legacy), ("lookup", cached_time, cached)):
+        print(f"{name:<8} {elapsed / steps * 1000:7.2f}ms/step"
+              f"  {driver.commands / steps:.2f} commands/step")
+
+    # 要素が無い場合: implicitly_waitが明示的な待機より長いと、失敗までimplicitly_waitの分待たされる
+    # (従来はimplicitly_wait(10)とWebDriverWait(driver, 3)の組み合わせがあった。1/10に縮めて再現)
+    implicit_wait, timeout = 1.0, 0.3
+    legacy_fail = measure(legacy_missing, FakeDriver(latency, implicit_wait=implicit_wait), timeout)
+    lookup_fail = measure(lookup_missing, FakeDriver(latency), timeout)
+    print(f"missing element (timeout={timeout}s):"
+          f" legacy {legacy_fail:.2f}s, lookup {lookup_fail:.2f}s")
+
+    if use_browser:
+        with FixtureServer() as server:
+            driver = Util.create_driver(True, True)
+            try:
+                driver.get(server.url("/login"))
+                xpaths = ["//input[@name='login_id']", "//input[@name='password']"]
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    for xpath in xpaths:
+                        WebDriverWait(driver, 10).until(
+                            EC.visibility_of_element_located((By.XPATH, xpath))
+                        ).send_keys("x")
+                legacy_time = time.perf_counter() - started
+                lookup = ElementLookup.of(driver)
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    for xpath in xpaths:
+                        lookup.perform(xpath, lambda element: element.send_keys("x"), visible=True)
+                lookup_time = time.perf_counter() - started
+            finally:
+                driver.quit()
+        browser_steps = repeat * len(xpaths)
+        print(f"browser  legacy {legacy_time / browser_steps * 1000:.2f}ms/step,"
+              f" lookup {lookup_time / browser_steps * 1000:.2f}ms/step")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""_summary_
+通常のプロファイルとLeanProfileで、重いページ(画像・フォント・動画・トラッカー)の
+読み込み時間と転送量を比べる。ChromeまたはFirefoxが必要。
+
+    Usage:
+        python -m benchmark.bench_profile
+"""
+import time
+
+from benchmark.fixture_server import FixtureServer
+from lib.browser_profile import DEFAULT_BLOCKED_URLS, LeanProfile
+from lib.e2e_util import Util
+
+
+# ナビゲーションと、読み込まれたリソースの転送量の合計(bytes)
+TRANSFER_SCRIPT = """
+var entries = performance.getEntriesByType('navigation')
+  .concat(performance.getEntriesByType('resource'));
+var total = 0;
+for (var i = 0; i < entries.length; i++) total += entries[i].transferSize || 0;
+return [total, entries.length];
+"""
+
+
+def measure(driver, url, repeat):
+    elapsed, transferred, requests = 0.0, 0, 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        driver.get(url)
+        elapsed += time.perf_counter() - started
+        total, count = driver.execute_script(TRANSFER_SCRIPT)
+        transferred += total
+        requests += count
+    return elapsed / repeat, transferred / repeat, requests / repeat
+
+
+def main(repeat=5, is_chrome=True):
+    # ローカルのトラッカー(/tracker/)もサードパーティとして扱う
+    lean = LeanProfile(block_urls=DEFAULT_BLOCKED_URLS + ("*/tracker/*",))
+    with FixtureServer() as server:
+        url = server.url("/heavy")
+        for name, profile in (("default", None), ("lean", lean)):
+            driver = Util.create_driver(is_chrome, True, profile)
+            try:
+                driver.get(server.url("/login"))  # 起動直後の初回読み込みを除く
+                elapsed, transferred, requests = measure(driver, url, repeat)
+            finally:
+                driver.quit()
+            print(f"{name:<8} {elapsed * 1000:8.1f}ms/page  {transferred / 1024:9.1f}KiB"
+                  f"  {requests:5.1f} requests")
+
+
+if __name__ == "__main__":
+    main()
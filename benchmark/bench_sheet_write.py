@@ -0,0 +1,39 @@
+"""_summary_
+SpreadsheetWriter.writeのAPI呼び出し回数のベンチマーク。
+fakeのgspreadクライアントに書き込み、1行ずつappend_rowした場合と比較する。
+
+    Usage:
+        python -m benchmark.bench_sheet_write
+"""
+import time
+
+from lib.spreadsheet_writer import SpreadsheetWriter
+from testing.fake_google import FakeGspreadClient
+
+
+def records(n):
+    for i in range(n):
+        yield {"id": i, "name": f"item{i}", "price": i * 100}
+
+
+def main(rows=5000):
+    client = FakeGspreadClient(fail_every=7)
+    writer = SpreadsheetWriter(None, "bench", client=client)
+    # fakeなので待機しない
+    writer.BACKOFF_BASE = 0.0
+    client.calls.clear()
+
+    started = time.perf_counter()
+    written = writer.write_stream(records(rows))
+    elapsed = time.perf_counter() - started
+
+    sheet = writer.sheet
+    assert len(sheet.rows) == rows + 1, len(sheet.rows)
+    print(f"rows            : {written}")
+    print(f"row-by-row calls: {rows + 1}")
+    print(f"batched calls   : {dict(client.calls)}")
+    print(f"elapsed         : {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
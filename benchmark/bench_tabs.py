@@ -0,0 +1,82 @@
+"""_summary_
+scraperごとにブラウザを1つ使う方法と、TabRunnerで1つのブラウザの複数タブを使う方法で、
+同時に実行するCaseあたりのメモリ使用量(RSS)とスループットを比べる。Chromeが必要。
+
+    Usage:
+        python -m benchmark.bench_tabs
+"""
+import threading
+import time
+
+from benchmark.fixture_server import FixtureServer
+from lib.browser_profile import LeanProfile
+from lib.case import Case
+from lib.e2e_util import Util
+from lib.operation import Get
+from lib.tab_runner import TabRunner, driver_rss
+
+
+# TabRunnerは読み込み完了を待たないpageLoadStrategyで使う。比較のため両方同じ設定にする
+PROFILE = LeanProfile(block_types=(), block_urls=(), page_load_strategy="none")
+
+
+def scrape(driver, server, i):
+    return Case(
+        Get(driver, server.url("/home")),
+        Get(driver, server.url(f"/items?rows={100 + i}")),
+    ).exec_operation(driver)
+
+
+def per_browser(server, concurrency, jobs):
+    drivers = Util.create_drivers(concurrency, True, True, lean=PROFILE)
+    try:
+        pending = list(range(jobs))
+        lock = threading.Lock()
+
+        def worker(driver):
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    i = pending.pop()
+                scrape(driver, server, i)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(driver,)) for driver in drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        rss = sum(driver_rss(driver) or 0 for driver in drivers)
+    finally:
+        for driver in drivers:
+            driver.quit()
+    return elapsed, rss
+
+
+def tabs(server, concurrency, jobs):
+    driver = Util.create_driver(True, True, lean=PROFILE)
+    try:
+        runner = TabRunner(driver, tabs=concurrency)
+        started = time.perf_counter()
+        runner.run([lambda tab, i=i: scrape(tab, server, i) for i in range(jobs)])
+        elapsed = time.perf_counter() - started
+        rss = driver_rss(driver) or 0
+        runner.close()
+    finally:
+        driver.quit()
+    return elapsed, rss
+
+
+def main(concurrency=4, jobs=16):
+    with FixtureServer() as server:
+        for name, model in (("browser/scraper", per_browser), ("tabs", tabs)):
+            elapsed, rss = model(server, concurrency, jobs)
+            print(f"{name:<16} {jobs / elapsed:6.2f} cases/s"
+                  f"  RSS {rss / 1024 ** 2:8.1f}MiB"
+                  f"  {rss / concurrency / 1024 ** 2:7.1f}MiB per concurrent case")
+
+
+if __name__ == "__main__":
+    main()
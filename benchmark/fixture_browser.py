@@ -0,0 +1,216 @@
+"""_summary_
+ブラウザを使わずにフィクスチャのサイト(benchmark.fixture_server)を操作する、WebDriverのfake。
+ページはHTTPで取得してlxmlで解析する。JavaScriptは実行しないので、
+ログインフォーム・リンク・ページングされたテーブルのような静的なページだけを扱える。
+
+    * WebDriverのサブクラスで、コマンド(execute)だけを置き換えている。
+      WebElementもそのまま使えるので、OperationやRecordingDriverを変更せずに使える
+    * execute_scriptはフォームの送信・表示判定・lib.bulk_queryのスクリプトだけに対応する
+    * get・送信が返った時点で読み込みは終わっているので、Caseは待機条件を待たない
+    * 実行したコマンド数をcommandsに記録する
+
+        Usage:
+            with FixtureServer() as server:
+                driver = FixtureBrowser()
+                Case(Get(driver, server.url("/login"))).exec_operation()
+                print(driver.commands)
+"""
+from collections import Counter
+from urllib.parse import urljoin
+
+import requests
+from lxml import etree
+from selenium.common.exceptions import (
+    JavascriptException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    WebDriverException,
+)
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.locator_converter import LocatorConverter
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.remote.webelement import WebElement
+
+from lib.bulk_query import BULK_QUERY_SCRIPT
+from lib.extractor import compile_selector, parse_html
+
+
+class FixtureBrowser(WebDriver):
+
+    # lib.wait.wait_until_readyが参照する
+    skip_ready_wait = True
+
+    def __init__(self, timeout=10):
+        # WebDriver.__init__はセッションを開始するので呼ばない
+        self.session_id = "fixture"
+        self.locator_converter = LocatorConverter()
+        self._web_element_cls = WebElement
+        self._is_remote = False
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.commands = Counter()
+
+        self._url = "about:blank"
+        self._source = "<html><head></head><body></body></html>"
+        self._document = parse_html(self._source)
+        self._generation = 0
+        self._elements = {}  # 要素ID -> lxmlの要素
+        self._ids = {}  # lxmlの要素 -> 要素ID
+
+    def execute(self, driver_command, params=None):
+        params = params or {}
+        self.commands[driver_command] += 1
+        handler = self.HANDLERS.get(driver_command)
+        if handler is None:
+            raise WebDriverException(f"{driver_command} is not supported by FixtureBrowser")
+        return {"value": handler(self, params)}
+
+    def _load(self, response):
+        response.raise_for_status()
+        self._url = response.url
+        self._source = response.text
+        self._document = parse_html(response.content)
+        # 遷移前のドキュメントの要素は使えなくなる
+        self._generation += 1
+        self._elements.clear()
+        self._ids.clear()
+
+    def _get(self, params):
+        self._load(self.http.get(params["url"], timeout=self.timeout))
+
+    def _element_id(self, node):
+        element_id = self._ids.get(node)
+        if element_id is None:
+            element_id = f"{self._generation}-{len(self._elements)}"
+            self._ids[node] = element_id
+            self._elements[element_id] = node
+        return element_id
+
+    def _node(self, element_id):
+        if isinstance(element_id, WebElement):
+            element_id = element_id.id
+        node = self._elements.get(element_id)
+        if node is None:
+            raise StaleElementReferenceException(f"stale element reference: {element_id}")
+        return node
+
+    def _select(self, root, using, value):
+        if using == "xpath":
+            return [node for node in root.xpath(value) if isinstance(node, etree.ElementBase)]
+        if using == "css selector":
+            return compile_selector(value, css=True)(root)
+        raise WebDriverException(f"locator strategy {using} is not supported by FixtureBrowser")
+
+    def _find_elements(self, params):
+        root = self._node(params["id"]) if "id" in params else self._document
+        return [
+            self.create_web_element(self._element_id(node))
+            for node in self._select(root, params["using"], params["value"])
+        ]
+
+    def _find_element(self, params):
+        elements = self._find_elements(params)
+        if not elements:
+            raise NoSuchElementException(f"no such element: {params['value']}")
+        return elements[0]
+
+    def _send_keys(self, params):
+        node = self._node(params["id"])
+        node.set("value", (node.get("value") or "") + params["text"])
+
+    def _clear(self, params):
+        self._node(params["id"]).set("value", "")
+
+    def _click(self, params):
+        node = self._node(params["id"])
+        if node.tag == "a" and node.get("href"):
+            self._get({"url": urljoin(self._url, node.get("href"))})
+        elif node.tag in ("input", "button") and node.get("type", "submit") == "submit":
+            self._submit(node)
+
+    def _submit(self, node):
+        form = node
+        while form is not None and form.tag != "form":
+            form = form.getparent()
+        if form is None:
+            raise JavascriptException("Unable to find containing form element")
+        data = {
+            field.get("name"): field.get("value") or ""
+            for field in form.iter("input", "textarea", "select")
+            if field.get("name") and field.get("type") != "submit"
+        }
+        url = urljoin(self._url, form.get("action") or self._url)
+        if (form.get("method") or "get").lower() == "post":
+            self._load(self.http.post(url, data=data, timeout=self.timeout))
+        else:
+            self._load(self.http.get(url, params=data, timeout=self.timeout))
+
+    def _execute_script(self, params):
+        script, args = params["script"], params["args"]
+        if script.startswith("/* isDisplayed */"):
+            return True
+        if script.startswith("/* submitForm */"):
+            self._submit(self._node(args[0]))
+            return None
+        if script == BULK_QUERY_SCRIPT:
+            return {name: self._query(query) for name, query in args[0].items()}
+        raise JavascriptException("FixtureBrowser does not run JavaScript")
+
+    def _query(self, query):
+        # BULK_QUERY_SCRIPTと同じ結果をlxmlで返す
+        nodes = self._select(
+            self._document, "css selector" if query["css"] else "xpath", query["selector"]
+        )
+        if query["count_only"]:
+            return len(nodes)
+        offset = query["offset"] or 0
+        nodes = nodes[offset:] if query["limit"] is None else nodes[offset:offset + query["limit"]]
+        if query["fields"] is None:
+            return [self._project(node, "text") for node in nodes]
+        rows = []
+        for node in nodes:
+            row = {}
+            for name, spec in query["fields"].items():
+                target = node
+                if spec["selector"] is not None:
+                    matched = self._select(
+                        node, "css selector" if query["css"] else "xpath", spec["selector"]
+                    )
+                    target = matched[0] if matched else None
+                row[name] = self._project(target, spec["projection"])
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _project(node, projection):
+        if node is None:
+            return None
+        if projection in ("text", "visible_text"):
+            return node.text_content().strip()
+        if projection == "html":
+            return (node.text or "") + "".join(
+                etree.tostring(child, encoding="unicode") for child in node
+            )
+        if projection.startswith("@"):
+            return node.get(projection[1:])
+        return None
+
+    def quit(self):
+        self.http.close()
+
+    HANDLERS = {
+        Command.GET: _get,
+        Command.GET_CURRENT_URL: lambda self, params: self._url,
+        Command.GET_PAGE_SOURCE: lambda self, params: self._source,
+        Command.GET_TITLE: lambda self, params: self._document.findtext(".//title") or "",
+        Command.FIND_ELEMENT: _find_element,
+        Command.FIND_ELEMENTS: _find_elements,
+        Command.FIND_CHILD_ELEMENT: _find_element,
+        Command.FIND_CHILD_ELEMENTS: _find_elements,
+        Command.GET_ELEMENT_TEXT: lambda self, params: self._node(params["id"]).text_content().strip(),
+        Command.GET_ELEMENT_TAG_NAME: lambda self, params: self._node(params["id"]).tag,
+        Command.SEND_KEYS_TO_ELEMENT: _send_keys,
+        Command.CLEAR_ELEMENT: _clear,
+        Command.CLICK_ELEMENT: _click,
+        Command.W3C_EXECUTE_SCRIPT: _execute_script,
+    }
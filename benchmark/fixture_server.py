@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>login</title></head>
+<body>
+<form name="login_form" action="/home" method="post">
+  <input type="text" name="login_id">
+  <input type="password" name="password">
+  <input type="submit" value="login">
+</form>
+</body></html>
+"""
+
+HOME_PAGE = """<!DOCTYPE html>
+<html><head><title>home</title></head>
+<body>
+<a id="items_link" href="/items">items</a>
+<div id="news">loading...</div>
+<script>
+setTimeout(function () {
+  fetch('/api/news').then(function (r) { return r.json(); }).then(function (d) {
+    document.getElementById('news').textContent = d.title;
+  });
+}, 200);
+</script>
+</body></html>
+"""
+
+
+def items_page(rows=50):
+    return (
+        "<!DOCTYPE html><html><head><title>items</title></head><body>"
+        "<table id='items'><tr><th>id</th><th>name</th><th>price</th></tr>"
+        f"{item_rows(1, rows)}</table></body></html>"
+    )
+
+
+def item_rows(start, end):
+    return "".join(
+        f"<tr><td class='id'>{i}</td><td class='name'>item{i}</td>"
+        f"<td class='price'>{i * 100}</td></tr>"
+        for i in range(start, end + 1)
+    )
+
+
+def table_page(page=1, per_page=50, total=500):
+    """ページングされたテーブル。次のページがあれば#nextのリンクを表示する"""
+    start = (page - 1) * per_page + 1
+    end = min(total, page * per_page)
+    next_link = ""
+    if end < total:
+        next_link = (
+            f"<a id='next' href='/table?page={page + 1}&per_page={per_page}&total={total}'>next</a>"
+        )
+    return (
+        f"<!DOCTYPE html><html><head><title>table {page}</title></head><body>"
+        "<table id='items'><tr><th>id</th><th>name</th><th>price</th></tr>"
+        f"{item_rows(start, end)}</table>{next_link}</body></html>"
+    )
+
+
+def framed_page(rows=50):
+    """テーブルをiframeの中に表示するページ"""
+    return (
+        "<!DOCTYPE html><html><head><title>framed</title></head><body>"
+        f"<h1>framed</h1><iframe id='content' src='/items?rows={rows}'></iframe>"
+        "</body></html>"
+    )
+
+
+def load_more_page(step=20, total=200):
+    """最初のstep件を表示し、「もっと見る」で/api/itemsから続きを読み込むページ"""
+    return (
+        "<!DOCTYPE html><html><head><title>more</title></head><body>"
+        "<table id='items'><tr><th>id</th><th>name</th><th>price</th></tr>"
+        f"{item_rows(1, min(step, total))}</table>"
+        "<button id='more'>more</button>"
+        "<script>"
+        f"var step = {step}, total = {total};"
+        "document.getElementById('more').addEventListener('click', function () {"
+        "  var offset = document.querySelectorAll('#items tr').length - 1;"
+        "  fetch('/api/items?offset=' + offset + '&limit=' + step + '&total=' + total)"
+        "    .then(function (r) { return r.text(); })"
+        "    .then(function (rows) {"
+        "      document.getElementById('items').insertAdjacentHTML('beforeend', rows);"
+        "      if (offset + step >= total) document.getElementById('more').remove();"
+        "    });"
+        "});"
+        "</script></body></html>"
+    )
+
+
+def heavy_page(images=30):
+    """画像・フォント・動画・トラッカーを大量に読み込むページ"""
+    imgs = "".join(f"<img src='/assets/img{i}.jpg' width='64'>" for i in range(images))
+    return (
+        "<!DOCTYPE html><html><head><title>heavy</title><style>"
+        "@font-face{font-family:f1;src:url('/assets/font1.woff2')}"
+        "@font-face{font-family:f2;src:url('/assets/font2.woff2')}"
+        "body{font-family:f1,f2}</style>"
+        "<script src='/tracker/collect.js'></script></head><body>"
+        "<h1>heavy</h1><video src='/assets/movie.mp4' preload='auto' autoplay muted></video>"
+        f"{imgs}{items_page(100)}</body></html>"
+    )
+
+
+# 擬似的な静的ファイル: 拡張子 -> (Content-Type, サイズ)
+ASSETS = {
+    "jpg": ("image/jpeg", 200 * 1024),
+    "woff2": ("font/woff2", 100 * 1024),
+    "mp4": ("video/mp4", 2 * 1024 * 1024),
+    "js": ("application/javascript", 50 * 1024),
+}
+# 静的ファイル1つあたりの擬似的なネットワーク遅延(秒)
+ASSET_LATENCY = 0.02
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """ベンチマーク用のローカルサイト"""
+
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書き込むので、Nagleアルゴリズムと遅延ACKで応答ごとに40ms待たされないようにする
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        def param(name, default):
+            return int(query.get(name, [default])[0])
+
+        if url.path in ("/", "/login"):
+            self.send_html(LOGIN_PAGE)
+        elif url.path == "/home":
+            self.send_html(HOME_PAGE)
+        elif url.path == "/items":
+            self.send_html(items_page(param("rows", 50)))
+        elif url.path == "/table":
+            self.send_html(table_page(param("page", 1), param("per_page", 50), param("total", 500)))
+        elif url.path == "/framed":
+            self.send_html(framed_page(param("rows", 50)))
+        elif url.path == "/more":
+            self.send_html(load_more_page(param("step", 20), param("total", 200)))
+        elif url.path == "/api/items":
+            offset, limit, total = param("offset", 0), param("limit", 20), param("total", 200)
+            self.send_body(
+                item_rows(offset + 1, min(total, offset + limit)).encode("utf-8"),
+                "text/html; charset=utf-8",
+            )
+        elif url.path == "/heavy":
+            self.send_html(heavy_page(param("images", 30)))
+        elif url.path.startswith(("/assets/", "/tracker/")):
+            self.send_asset(url.path)
+        elif url.path == "/api/news":
+            time.sleep(0.1)
+            self.send_body(json.dumps({"title": "hello"}).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.path == "/home":
+            self.send_html(HOME_PAGE)
+        else:
+            self.send_error(404)
+
+    def send_asset(self, path):
+        asset = ASSETS.get(path.rsplit(".", 1)[-1])
+        if asset is None:
+            self.send_error(404)
+            return
+        content_type, size = asset
+        time.sleep(ASSET_LATENCY)
+        if content_type == "application/javascript":
+            body = (b"/*" + b"x" * size + b"*/")
+        else:
+            body = bytes(size)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_html(self, html):
+        self.send_body(html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def send_body(self, body, content_type):
+        # 条件付きGET(ETag)とgzipに対応する
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        headers = {"Content-Type": content_type, "ETag": etag}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FixtureServer:
+    """_summary_
+    ベンチマーク用のローカルHTTPサーバーを別スレッドで起動する。
+
+    Usage:
+        with FixtureServer() as server:
+            driver.get(server.url("/login"))
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, handler=FixtureHandler):
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path="/"):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
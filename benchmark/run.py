@@ -0,0 +1,105 @@
+"""_summary_
+benchmark.scenariosのシナリオを実行し、結果をJSONに保存して閾値(thresholds.json)と比べる。
+ブラウザ・ネットワーク(ローカルのフィクスチャのサイトを除く)・Google APIは使わない。
+
+    Usage:
+        python -m benchmark.run [--scenario 名前 ...] [--output results.json]
+                                [--thresholds thresholds.json] [--browser]
+
+    * --scenario: 実行するシナリオ(複数指定可)。省略時は全て
+    * --output: 結果のJSONの保存先. Defaults to .cache/benchmark/results.json
+    * --browser: Chromeでも測る(オフラインでも動くが、Chromeとchromedriverが必要)
+
+    閾値を外れた指標があれば終了コード1で終了する。
+    閾値は{シナリオ: {指標: {"min": 下限, "max": 上限}}}の形で、
+    呼び出し回数のように環境に依存しない指標は厳しく、速度は遅い環境でも通る程度に設定している。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmark.fixture_server import FixtureServer
+from benchmark.scenarios import SCENARIOS
+
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+RESULTS_FILE = os.path.join(".cache", "benchmark", "results.json")
+
+
+def run(names, browser=False):
+    """namesのシナリオを実行し、{シナリオ: 指標のdict}を返す"""
+    results = {}
+    with FixtureServer() as server:
+        for name in names:
+            scenario, needs_server = SCENARIOS[name]
+            started = time.perf_counter()
+            if needs_server:
+                metrics = scenario(server, browser=browser)
+            else:
+                metrics = scenario()
+            metrics["elapsed_seconds"] = time.perf_counter() - started
+            results[name] = metrics
+    return results
+
+
+def check(results, thresholds):
+    """閾値と比べ、外れた指標の説明のリストを返す。実行していないシナリオは比べない"""
+    failures = []
+    for name, limits in thresholds.items():
+        if name not in results:
+            continue
+        for metric, limit in limits.items():
+            value = results[name].get(metric)
+            if value is None:
+                failures.append(f"{name}.{metric}: not measured")
+            elif "min" in limit and value < limit["min"]:
+                failures.append(f"{name}.{metric}: {value:g} < min {limit['min']:g}")
+            elif "max" in limit and value > limit["max"]:
+                failures.append(f"{name}.{metric}: {value:g} > max {limit['max']:g}")
+    return failures
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmark.run", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument("--browser", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = args.scenario or list(SCENARIOS)
+    results = run(names, args.browser)
+    with open(args.thresholds, encoding="utf-8") as f:
+        thresholds = json.load(f)
+    failures = check(results, thresholds)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "browser": args.browser,
+        "results": results,
+        "failures": failures,
+    }
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for name, metrics in results.items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f"  {metric:<28} {value:12.2f}" if isinstance(value, float) else f"  {metric:<28} {value:12}")
+    for failure in failures:
+        print("REGRESSION " + failure)
+    print(f"results: {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,243 @@
+"""_summary_
+benchmark.runで実行するシナリオ。各シナリオは指標のdictを返す。
+ブラウザもGoogle APIも使わず、フィクスチャのサイト(FixtureServer)・FixtureBrowser・
+ReplayDriver・fakeのgspread/Drive APIで実行する。browser=Trueならブラウザ(Chrome)でも測る。
+
+    * login_scrape: ログインのPlanとテーブルの取得・抽出を行うCase。
+      FixtureBrowserで直接実行した場合と、RecordingDriverで記録してReplayDriverで再生した場合を比べる
+    * table_extraction: ページングされたテーブルをHTTP(Fetch)とFixtureBrowser(Click)で全ページ抽出する
+    * sheet_sync: SpreadsheetWriterの書き込み・upsert・一括削除のAPI呼び出し回数
+"""
+import os
+import tempfile
+import time
+from unittest import mock
+
+from benchmark.fixture_browser import FixtureBrowser
+from lib.bulk_query import Query
+from lib.case import Case
+from lib.e2e_util import Util
+from lib.extractor import Extractor, Field
+from lib.http_session import HttpSession
+from lib.operation import Click, Fetch, Get, Input, LoadMore, SwitchToFrame, Submit
+from lib.plan import Param, Plan, Step
+from lib.replay import RecordingDriver, ReplayArchive, ReplayDriver
+from lib import spreadsheet_writer
+from lib.spreadsheet_writer import SpreadsheetWriter
+from testing.fake_google import FakeDriveService, FakeGspreadClient
+
+
+# lib.my_catalog.Catalog.LOGINと同じ手順(フィクスチャのログインフォームは同じname属性)
+LOGIN = Plan(
+    Step(Input, "//*[@name='login_id']", Param("login_id")),
+    Step(Input, "//*[@name='password']", Param("password")),
+    Step(Submit, "//form[@name='login_form']"),
+    name="login",
+)
+
+ITEM_ROWS = "//table[@id='items']//tr[td]"
+ITEMS = Extractor(ITEM_ROWS, [Field("id", "td[1]"), Field("name", "td[2]"), Field("price", "td[3]")])
+NEXT_LINK = Extractor("//a[@id='next']", [Field("href", "@href")])
+
+
+def login_and_scrape(driver, server, rows):
+    Case(Get(driver, server.url("/login"))).exec_operation()
+    LOGIN.bind(driver, login_id="bench", password="bench").exec_operation()
+    html = Case(Get(driver, server.url(f"/items?rows={rows}"))).exec_operation(driver)
+    return ITEMS.extract(html)
+
+
+def _runs_per_second(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return repeat / (time.perf_counter() - started)
+
+
+def login_scrape(server, repeat=50, rows=200, browser=False):
+    driver = FixtureBrowser()
+    scraped = login_and_scrape(driver, server, rows)
+    driver.commands.clear()
+    fixture_rate = _runs_per_second(lambda: login_and_scrape(driver, server, rows), repeat)
+    commands = sum(driver.commands.values()) / repeat
+
+    # 1回分を記録し、保存・読み込みしたものを再生する
+    recording = RecordingDriver(FixtureBrowser())
+    login_and_scrape(recording, server, rows)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "login_scrape.replay.gz")
+        recording.save(path)
+        archive_bytes = os.path.getsize(path)
+        replay = ReplayDriver(ReplayArchive.load(path))
+
+    def replay_once():
+        replay.rewind()
+        assert len(login_and_scrape(replay, server, rows)) == rows
+
+    replay_rate = _runs_per_second(replay_once, repeat * 20)
+    result = {
+        "rows": len(scraped),
+        "commands_per_run": commands,
+        "fixture_runs_per_second": fixture_rate,
+        "replay_runs_per_second": replay_rate,
+        "replay_speedup": replay_rate / fixture_rate,
+        "replay_misses": replay.misses,
+        "archive_bytes": archive_bytes,
+    }
+    if browser:
+        driver = Util.create_driver(True, True)
+        try:
+            login_and_scrape(driver, server, rows)
+            result["browser_runs_per_second"] = _runs_per_second(
+                lambda: login_and_scrape(driver, server, rows), max(1, repeat // 10)
+            )
+        finally:
+            driver.quit()
+    return result
+
+
+def _pages_by_fetch(server, per_page, total):
+    session = HttpSession()
+    rows = []
+    url = server.url(f"/table?per_page={per_page}&total={total}")
+    pages = 0
+    while url:
+        html = Case(Fetch(session, url)).exec_operation(session)
+        rows.extend(ITEMS.extract(html))
+        pages += 1
+        next_link = NEXT_LINK.extract(html)
+        url = server.url(next_link[0]["href"]) if next_link else None
+    session.close()
+    return pages, rows
+
+
+def _pages_by_click(driver, server, per_page, total):
+    Case(Get(driver, server.url(f"/table?per_page={per_page}&total={total}"))).exec_operation()
+    rows = []
+    pages = 0
+    while True:
+        rows.extend(Util.bulk_query(driver, {"rows": Query(ITEM_ROWS, fields={"id": "td[1]"})})["rows"])
+        pages += 1
+        if Util.count_elements_by_xpath(driver, "//a[@id='next']") == 0:
+            return pages, rows
+        Case(Click(driver, "//a[@id='next']")).exec_operation()
+
+
+def table_extraction(server, per_page=100, total=5000, browser=False):
+    started = time.perf_counter()
+    pages, rows = _pages_by_fetch(server, per_page, total)
+    fetch_elapsed = time.perf_counter() - started
+    assert len(rows) == total, len(rows)
+
+    driver = FixtureBrowser()
+    started = time.perf_counter()
+    click_pages, click_rows = _pages_by_click(driver, server, per_page, total)
+    click_elapsed = time.perf_counter() - started
+    assert len(click_rows) == total, len(click_rows)
+
+    result = {
+        "pages": pages,
+        "rows": len(rows),
+        "fetch_rows_per_second": len(rows) / fetch_elapsed,
+        "click_rows_per_second": len(click_rows) / click_elapsed,
+        "click_commands_per_page": sum(driver.commands.values()) / click_pages,
+    }
+    if browser:
+        result.update(_browser_tables(server))
+    return result
+
+
+def _browser_tables(server, total=200):
+    # 「もっと見る」とiframeはJavaScriptが必要なのでブラウザでだけ測る
+    driver = Util.create_driver(True, True)
+    try:
+        Case(Get(driver, server.url(f"/more?step=20&total={total}"))).exec_operation()
+        load_more = LoadMore(driver, ITEM_ROWS, button_xpath="//button[@id='more']")
+        started = time.perf_counter()
+        Case(load_more).exec_operation()
+        load_more_elapsed = time.perf_counter() - started
+
+        html = Case(
+            Get(driver, server.url(f"/framed?rows={total}")),
+            SwitchToFrame(driver, "index", 0),
+        ).exec_operation(driver)
+        frame_rows = len(ITEMS.extract(html))
+        driver.switch_to.default_content()
+    finally:
+        driver.quit()
+    return {
+        "load_more_items": load_more.item_count,
+        "load_more_seconds": load_more_elapsed,
+        "frame_rows": frame_rows,
+    }
+
+
+def _records(n, changed=()):
+    for i in range(n):
+        yield {"id": i, "name": f"item{i}{'*' if i in changed else ''}", "price": i * 100}
+
+
+def sheet_sync(rows=5000, changed=50, files=2000):
+    # upsertが保存する行のハッシュをカレントディレクトリに残さない
+    with tempfile.TemporaryDirectory() as directory, mock.patch.object(
+        spreadsheet_writer, "ROW_HASH_DIR", directory
+    ):
+        return _sheet_sync(rows, changed, files)
+
+
+def _sheet_sync(rows, changed, files):
+    client = FakeGspreadClient(fail_every=7)
+    drive = FakeDriveService(rate_limit_every=50)
+    writer = SpreadsheetWriter(None, "bench", client=client, drive_service=drive)
+    # fakeなので待機しない
+    writer.BACKOFF_BASE = 0.0
+
+    client.calls.clear()
+    started = time.perf_counter()
+    writer.write_stream(_records(rows))
+    write_elapsed = time.perf_counter() - started
+    write_calls = sum(client.calls.values())
+    retries = client.calls["429"]
+
+    client.calls.clear()
+    modified = set(range(0, rows, rows // changed))
+    data = list(_records(rows, modified))
+    upsert = writer.upsert(data, key="id", force=True)
+    upsert_calls = sum(client.calls.values())
+    retries += client.calls["429"]
+
+    client.calls.clear()
+    writer.upsert(data, key="id")
+    noop_calls = sum(client.calls.values())
+
+    for i in range(files):
+        drive.add_file(f"sheet{i}")
+    drive.calls.clear()
+    started = time.perf_counter()
+    deleted = writer.delete_all_spreadsheets()
+    delete_elapsed = time.perf_counter() - started
+    assert not drive.files_by_id, len(drive.files_by_id)
+
+    return {
+        "rows": rows,
+        "write_api_calls": write_calls,
+        "write_rows_per_second": rows / write_elapsed,
+        "retries_429": retries,
+        "upsert_updated": upsert["updated"],
+        "upsert_api_calls": upsert_calls,
+        "upsert_noop_api_calls": noop_calls,
+        "deleted_files": len(deleted.deleted),
+        # バッチ内の個々のリクエスト("batch:...")を除いた、HTTPリクエストの回数
+        "delete_api_requests": sum(
+            count for name, count in drive.calls.items() if not name.startswith("batch:")
+        ),
+        "delete_seconds": delete_elapsed,
+    }
+
+
+# 名前 -> (関数, FixtureServerが必要か)
+SCENARIOS = {
+    "login_scrape": (login_scrape, True),
+    "table_extraction": (table_extraction, True),
+    "sheet_sync": (sheet_sync, False),
+}
@@ -0,0 +1,290 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+try:
+    # zstdが使えればgzipより高速・高圧縮率なので優先する
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# レコードの先頭: MAGIC + ヘッダー長(4byte) + 本体長(8byte)
+RECORD_MAGIC = b"PNA1"
+RECORD_PREFIX = struct.Struct(">4sIQ")
+SEGMENT_SUFFIX = ".pack"
+
+# 圧縮済みの形式はそのまま保存する
+UNCOMPRESSED_KINDS = ("png", "jpg", "jpeg", "gz", "zip")
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd records")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+def _read_header(f):
+    """fの現在位置のレコードのヘッダーを読み、(header, 本体の位置, 本体長)を返す。終端ならNone"""
+    prefix = f.read(RECORD_PREFIX.size)
+    if len(prefix) < RECORD_PREFIX.size:
+        return None
+    magic, header_len, payload_len = RECORD_PREFIX.unpack(prefix)
+    if magic != RECORD_MAGIC:
+        raise ValueError(f"broken record at offset {f.tell() - RECORD_PREFIX.size}")
+    header = json.loads(f.read(header_len).decode("utf-8"))
+    return header, f.tell(), payload_len
+
+
+def read_record(segment_path, offset):
+    """segment_pathのoffsetにあるレコードを読み、(header, 展開済みのbytes)を返す"""
+    with open(segment_path, "rb") as f:
+        f.seek(offset)
+        header, _, payload_len = _read_header(f)
+        return header, _decompress(f.read(payload_len), header["codec"])
+
+
+def iter_records(path, with_data=True):
+    """アーカイブ(ファイル、またはArtifactSinkのディレクトリ)のレコードを古い順に返す。
+    重複排除で参照になっているレコードは参照先から本体を読む。参照先が削除済みならdataはNone
+
+    Args:
+        path (str): .packファイル、またはそれを含むディレクトリ
+        with_data (bool, optional): Falseならヘッダーだけ読み、本体は読み飛ばす. Defaults to True.
+
+    Yields:
+        tuple: (header, data)。headerはname/kind/time/sha256/size等を持つdict
+    """
+    if os.path.isdir(path):
+        segments = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX)
+        )
+    else:
+        segments = [path]
+
+    for segment in segments:
+        directory = os.path.dirname(segment)
+        with open(segment, "rb") as f:
+            while True:
+                offset = f.tell()
+                record = _read_header(f)
+                if record is None:
+                    break
+                header, _, payload_len = record
+                header["segment"] = segment
+                header["offset"] = offset
+                if not with_data:
+                    f.seek(payload_len, os.SEEK_CUR)
+                    yield header, None
+                    continue
+                payload = f.read(payload_len)
+                ref = header.get("ref")
+                if ref is None:
+                    yield header, _decompress(payload, header["codec"])
+                    continue
+                try:
+                    _, data = read_record(os.path.join(directory, ref[0]), ref[1])
+                except OSError:
+                    data = None
+                yield header, data
+
+
+class ArtifactSink:
+    """_summary_
+    スクリーンショットやHTMLを、ブラウザのスレッドを止めずにバックグラウンドで保存する。
+
+    * putはキューに積むだけで、ハッシュ計算・圧縮・書き込みは書き込みスレッドが行う
+    * キューは有界で、満杯のときputは空きを待つ(block=Falseなら破棄してFalseを返す)
+    * HTML等はzstd(zstandardが無ければgzip)で圧縮する。PNG等の圧縮済みの形式はそのまま保存する
+    * 1件1ファイルではなく、segment_bytesごとに切り替わるアーカイブ(.pack)に追記する
+    * dedupe=Trueなら同じ内容は本体を書かず、既存のレコードへの参照だけを書く。
+      参照先は同じアーカイブ内に限るので、古いアーカイブを削除しても参照は切れない
+    * アーカイブの合計がmax_total_bytesを超えると古いアーカイブから削除する
+    * 保存したものはiter_records(directory)で読み出す
+
+        Usage:
+            Util.artifact_sink = ArtifactSink("artifacts", max_total_bytes=1024 ** 3)
+            ...
+            Util.artifact_sink.close()
+
+            for header, data in iter_records("artifacts"):
+                print(header["name"], len(data))
+    """
+
+    def __init__(
+        self,
+        directory="artifacts",
+        max_queue=64,
+        segment_bytes=64 * 1024 * 1024,
+        max_total_bytes=1024 * 1024 * 1024,
+        dedupe=True,
+        codec=None,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_total_bytes = max_total_bytes
+        self.dedupe = dedupe
+        self.codec = codec or ("zstd" if zstandard is not None else "gzip")
+        self.logger = logging.getLogger(__name__)
+
+        self.written = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._seq = 0
+        self._segment = None
+        self._segment_name = None
+        self._known = {}  # sha256 -> (現在のsegment名, offset)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def put(self, name, data, kind="html", block=True, timeout=None):
+        """保存をキューに積む
+
+        Args:
+            name (str): 保存名(ファイル名)
+            data (str | bytes): 本体。strはutf-8で保存する
+            kind (str, optional): "html"、"png"など. Defaults to "html".
+            block (bool, optional): キューが満杯のとき空きを待つ. Defaults to True.
+            timeout (float, optional): 空きを待つ最大秒数. Defaults to None.
+
+        Returns:
+            bool: キューに積めた場合True
+        """
+        try:
+            self._queue.put((name, data, kind, time.time()), block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.logger.warning(f"artifact queue is full, dropped {name}")
+            return False
+
+    def flush(self):
+        """キューに積まれた分の書き込みが終わるまで待つ"""
+        self._queue.join()
+
+    def close(self):
+        """キューに積まれた分を書き込んでから書き込みスレッドを終了する"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+                # キューが空になったらOSに書き出し、読み出し側から見えるようにする
+                if self._queue.empty():
+                    self._segment.flush()
+            except Exception:
+                self.failed += 1
+                self.logger.exception("failed to write artifact")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, name, data, kind, created_at):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        header = {"name": name, "kind": kind, "time": created_at, "sha256": digest, "size": len(data)}
+        self.bytes_in += len(data)
+
+        # 参照は同じアーカイブ内のレコードにだけ張る。
+        # 古いアーカイブは丸ごと削除されるので、別のアーカイブへの参照は切れることがある
+        segment = self._current_segment()
+        location = self._known.get(digest) if self.dedupe else None
+        if location is not None:
+            header["codec"] = "none"
+            header["ref"] = list(location)
+            payload = b""
+            self.deduplicated += 1
+        else:
+            header["codec"] = "none" if kind in UNCOMPRESSED_KINDS else self.codec
+            payload = _compress(data, header["codec"])
+
+        offset = segment.tell()
+        header_bytes = json.dumps(header).encode("utf-8")
+        segment.write(RECORD_PREFIX.pack(RECORD_MAGIC, len(header_bytes), len(payload)))
+        segment.write(header_bytes)
+        segment.write(payload)
+        self.bytes_out += RECORD_PREFIX.size + len(header_bytes) + len(payload)
+        self.written += 1
+        if self.dedupe and location is None:
+            self._known[digest] = (self._segment_name, offset)
+
+    def _current_segment(self):
+        if self._segment is not None and self._segment.tell() < self.segment_bytes:
+            return self._segment
+        if self._segment is not None:
+            self._segment.close()
+        self._seq += 1
+        self._segment_name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._seq:04d}{SEGMENT_SUFFIX}"
+        )
+        self._segment = open(os.path.join(self.directory, self._segment_name), "ab")
+        # 重複排除の索引は現在のアーカイブの分だけ持つ
+        self._known = {}
+        self._apply_retention()
+        return self._segment
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def _apply_retention(self):
+        sizes = []
+        for name in self._segments():
+            try:
+                sizes.append((name, os.path.getsize(os.path.join(self.directory, name))))
+            except OSError:
+                continue
+        total = sum(size for _, size in sizes)
+        for name, size in sizes:
+            if total <= self.max_total_bytes:
+                break
+            if name == self._segment_name:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            self.logger.info(f"removed old artifact archive {name}")
@@ -0,0 +1,179 @@
+import logging
+
+from selenium.common.exceptions import WebDriverException
+
+
+# 種類ごとにブロックするURLのパターン(Chrome DevToolsのNetwork.setBlockedURLsの形式)
+RESOURCE_PATTERNS = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp"),
+    "font": ("woff", "woff2", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "ogg", "ogv", "mp3", "m4a", "wav", "m3u8"),
+}
+
+DEFAULT_BLOCKED_TYPES = ("image", "font", "media")
+
+# アクセス解析・広告などのサードパーティ
+DEFAULT_BLOCKED_URLS = (
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*googlesyndication.com*",
+    "*doubleclick.net*",
+    "*facebook.net*",
+    "*connect.facebook.com*",
+    "*hotjar.com*",
+    "*clarity.ms*",
+    "*newrelic.com*",
+    "*nr-data.net*",
+    "*sentry.io*",
+    "*segment.io*",
+    "*mixpanel.com*",
+    "*optimizely.com*",
+)
+
+# DOMのテキストを読むだけなら不要な機能
+CHROME_LEAN_ARGUMENTS = (
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-notifications",
+    "--mute-audio",
+    "--no-first-run",
+    "--autoplay-policy=user-gesture-required",
+)
+
+FIREFOX_LEAN_PREFERENCES = {
+    "media.autoplay.default": 5,
+    "dom.webnotifications.enabled": False,
+    "dom.push.enabled": False,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "privacy.trackingprotection.enabled": True,
+    "datareporting.healthreport.uploadEnabled": False,
+    "toolkit.telemetry.enabled": False,
+    "app.update.auto": False,
+    "extensions.update.enabled": False,
+}
+
+
+class LeanProfile:
+    """_summary_
+    画像・フォント・動画・トラッカーを読み込まない軽量なブラウザの設定。
+    Util.create_driver(..., lean=LeanProfile())やDriverPool(lean=...)に渡す。
+
+    * pageLoadStrategyをeagerにし、DOMContentLoadedで操作を始める
+    * Chrome: 種類(拡張子)とURLパターンでNetwork.setBlockedURLs(CDP)によりブロックする。
+      実行中に変更できるので、applyでscraperごとの許可リストを反映できる。
+      画像は起動時のコンテンツ設定でも無効にするため、applyのallowでは許可できない(起動時のallowに指定する)
+    * Firefox: 種類ごとにprefsで無効にし、トラッカーはトラッキング防止でブロックする。
+      prefsは起動時にしか変えられないので、許可リストは起動時のallowだけが効く
+    * allowには種類("image"など)またはURLパターンを指定し、ブロック対象から外す
+    * DriverPoolはScraper.lean_allowごとに、allowingで許可リストを加えたLeanProfileで
+      起動したdriverを貸し出す。どちらのブラウザでもscraperごとの許可リストが効く
+
+        Usage:
+            pool = DriverPool(is_headless=True, lean=LeanProfile())
+
+            class ChartScraper(MyScraper):
+                # 画像が無いと壊れるページ
+                lean_allow = ("image", "*cdn.example.com*")
+    """
+
+    def __init__(
+        self,
+        block_types=DEFAULT_BLOCKED_TYPES,
+        block_urls=DEFAULT_BLOCKED_URLS,
+        allow=(),
+        page_load_strategy="eager",
+    ):
+        self.block_types = tuple(block_types)
+        self.block_urls = tuple(block_urls)
+        self.allow = tuple(allow)
+        self.page_load_strategy = page_load_strategy
+        self.logger = logging.getLogger(__name__)
+
+    def blocked_patterns(self, allow=()):
+        """ブロックするURLパターンのリスト
+
+        Args:
+            allow (tuple, optional): 起動時のallowに加えて許可する種類・URLパターン. Defaults to ().
+        """
+        allowed = set(self.allow) | set(allow)
+        patterns = []
+        for resource_type in self.block_types:
+            if resource_type in allowed:
+                continue
+            for extension in RESOURCE_PATTERNS[resource_type]:
+                patterns.append(f"*.{extension}")
+                patterns.append(f"*.{extension}?*")
+        patterns.extend(url for url in self.block_urls if url not in allowed)
+        return patterns
+
+    def allowing(self, allow):
+        """allowを追加したLeanProfileを返す。起動時にしか反映できない設定(Chromeの画像等)を許可するときに使う"""
+        return LeanProfile(
+            self.block_types,
+            self.block_urls,
+            self.allow + tuple(allow),
+            self.page_load_strategy,
+        )
+
+    def chrome_options(self, options):
+        """ChromeOptionsに起動時の設定を追加する"""
+        options.page_load_strategy = self.page_load_strategy
+        for argument in CHROME_LEAN_ARGUMENTS:
+            options.add_argument(argument)
+        if "image" in self.block_types and "image" not in self.allow:
+            # 拡張子の無い画像URL(/image?id=1等)も読み込まないように、コンテンツ設定でも無効にする
+            prefs = dict(options.experimental_options.get("prefs", {}))
+            prefs["profile.managed_default_content_settings.images"] = 2
+            options.add_experimental_option("prefs", prefs)
+        return options
+
+    def firefox_options(self, options):
+        """FirefoxOptionsに起動時の設定を追加する"""
+        options.page_load_strategy = self.page_load_strategy
+        allowed = set(self.allow)
+        preferences = dict(FIREFOX_LEAN_PREFERENCES)
+        if "image" in self.block_types and "image" not in allowed:
+            preferences["permissions.default.image"] = 2
+        if "font" in self.block_types and "font" not in allowed:
+            preferences["gfx.downloadable_fonts.enabled"] = False
+            preferences["browser.display.use_document_fonts"] = 0
+        if "media" in self.block_types and "media" not in allowed:
+            preferences["media.autoplay.blocking_policy"] = 2
+            preferences["media.preload.default"] = 0
+            preferences["media.preload.auto"] = 0
+        for name, value in preferences.items():
+            options.set_preference(name, value)
+        return options
+
+    def apply(self, driver, allow=()):
+        """起動済みのdriverの現在のタブにURLのブロックを設定する。Chromeのみ(Firefoxは何もしない)。
+        新しく開いたタブには設定されないので、タブごとに呼ぶこと
+
+        Args:
+            driver (_type_): driver
+            allow (tuple, optional): 追加で許可する種類・URLパターン. Defaults to ().
+        """
+        if not hasattr(driver, "execute_cdp_cmd"):
+            return
+        if "image" in allow and "image" in self.block_types and "image" not in self.allow:
+            self.logger.warning(
+                "images are disabled when Chrome is launched; pass allow to LeanProfile instead"
+            )
+        patterns = self.blocked_patterns(allow)
+        try:
+            # CDPの設定はタブ(target)ごとなので、ウィンドウハンドルごとに記録する
+            handle = driver.current_window_handle
+            blocked = getattr(driver, "_lean_blocked", None) or {}
+            if blocked.get(handle) == patterns:
+                # 前回と同じなら設定し直さない
+                return
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            blocked[handle] = patterns
+            driver._lean_blocked = blocked
+        except WebDriverException:
+            self.logger.warning("failed to set blocked URLs", exc_info=True)
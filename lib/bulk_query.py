@@ -0,0 +1,144 @@
+from selenium.common.exceptions import NoSuchElementException
+
+
+# queriesを全てページ内で評価し、{名前: 結果}を返す
+BULK_QUERY_SCRIPT = """
+var queries = arguments[0];
+
+function select(root, selector, css) {
+  if (css) {
+    return Array.prototype.slice.call(root.querySelectorAll(selector));
+  }
+  var result = document.evaluate(
+    selector, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+  var nodes = [];
+  for (var i = 0; i < result.snapshotLength; i++) {
+    nodes.push(result.snapshotItem(i));
+  }
+  return nodes;
+}
+
+function project(node, projection) {
+  if (node === null || node === undefined) return null;
+  if (projection === 'text') return (node.textContent || '').trim();
+  if (projection === 'visible_text') return (node.innerText || '').trim();
+  if (projection === 'html') return node.innerHTML;
+  if (projection.charAt(0) === '@') return node.getAttribute(projection.slice(1));
+  return null;
+}
+
+var output = {};
+for (var name in queries) {
+  var query = queries[name];
+  var nodes = select(document, query.selector, query.css);
+  if (query.count_only) {
+    output[name] = nodes.length;
+    continue;
+  }
+  if (query.limit !== null) nodes = nodes.slice(query.offset, query.offset + query.limit);
+  else if (query.offset) nodes = nodes.slice(query.offset);
+  var rows = [];
+  for (var i = 0; i < nodes.length; i++) {
+    if (query.fields === null) {
+      rows.push(project(nodes[i], 'text'));
+      continue;
+    }
+    var row = {};
+    for (var field in query.fields) {
+      var spec = query.fields[field];
+      var target = nodes[i];
+      if (spec.selector !== null) {
+        target = select(nodes[i], spec.selector, query.css)[0];
+      }
+      row[field] = project(target, spec.projection);
+    }
+    rows.push(row);
+  }
+  output[name] = rows;
+}
+return output;
+"""
+
+PROJECTIONS = ("text", "visible_text", "html")
+
+
+class Query:
+    """_summary_
+    bulk_queryで評価するセレクタと、要素ごとに取り出す値の定義。
+
+    fieldsの値は次のいずれか。
+        * "text" / "visible_text" / "html" / "@属性名": 要素自身の値
+        * "相対セレクタ": 要素配下で最初に一致した要素のtextContent
+        * ("相対セレクタ", "text" / "visible_text" / "html" / "@属性名"): 要素配下の要素の値
+    fieldsを省略した場合は要素ごとのtextContentのリストを返す。
+
+        Usage:
+            Query(
+                "//table[@id='items']//tr[td]",
+                fields={"id": "td[1]", "name": "td[2]", "link": ("td[2]/a", "@href")},
+            )
+            Query("table#items tr", css=True, count_only=True)
+    """
+
+    def __init__(self, selector, fields=None, css=False, count_only=False, offset=0, limit=None):
+        self.selector = selector
+        self.fields = fields
+        self.css = css
+        self.count_only = count_only
+        self.offset = offset
+        self.limit = limit
+
+    def to_json(self):
+        fields = None
+        if self.fields is not None:
+            fields = {name: self._field(spec) for name, spec in self.fields.items()}
+        return {
+            "selector": self.selector,
+            "css": self.css,
+            "count_only": self.count_only,
+            "offset": self.offset,
+            "limit": self.limit,
+            "fields": fields,
+        }
+
+    @staticmethod
+    def _field(spec):
+        if isinstance(spec, tuple):
+            selector, projection = spec
+            return {"selector": selector, "projection": projection}
+        if spec in PROJECTIONS or spec.startswith("@"):
+            return {"selector": None, "projection": spec}
+        return {"selector": spec, "projection": "text"}
+
+
+def bulk_query(driver, queries):
+    """複数のQueryを1回のexecute_scriptでまとめて評価する。
+    find_element(s)を要素ごと・項目ごとに呼ぶ場合と違い、WebDriverとの通信は1往復で済む。
+
+    Args:
+        driver (_type_): Selenium WebDriverのインスタンス
+        queries (dict): {名前: Query}
+
+    Returns:
+        dict: {名前: 結果}。count_onlyなら件数、fieldsがあればdictのリスト、無ければ文字列のリスト
+
+    Usage:
+        result = bulk_query(driver, {
+            "rows": Query("//table[@id='items']//tr[td]", fields={"id": "td[1]", "name": "td[2]"}),
+            "title": Query("//h1"),
+        })
+        result["rows"]  # => [{"id": "1", "name": "item1"}, ...]
+    """
+    payload = {name: query.to_json() for name, query in queries.items()}
+    return driver.execute_script(BULK_QUERY_SCRIPT, payload)
+
+
+def count_table_rows(driver, xpath):
+    """xpathに一致する最初の要素の配下のtr要素数を返す。要素が無ければNoSuchElementException"""
+    counts = bulk_query(driver, {
+        "tables": Query(xpath, count_only=True),
+        "rows": Query(f"({xpath})[1]//tr", count_only=True),
+    })
+    if counts["tables"] == 0:
+        raise NoSuchElementException(f"no such element: {xpath}")
+    return counts["rows"]
@@ -1,11 +1,41 @@
+import logging
 import time
+from lib.instrumentation import tracer
 from lib.operation import Operation
+from lib.wait import prepare_ready, wait_until_ready
 from selenium.webdriver.remote.webdriver import WebDriver
 
 
+class OperationTiming:
+    """Case内の1 Operationの所要時間"""
+
+    def __init__(self, name, exec_time, wait_time, ready):
+        self.name = name
+        self.exec_time = exec_time  # exec()にかかった秒数
+        self.wait_time = wait_time  # ready_conditionの成立待ちにかかった秒数
+        self.ready = ready  # Falseならタイムアウトした
+
+    def __repr__(self):
+        return (
+            f"OperationTiming({self.name}, exec={self.exec_time:.3f}s,"
+            f" wait={self.wait_time:.3f}s, ready={self.ready})"
+        )
+
+
 class Case:
+    """_summary_
+    Operationを順番に実行する。
+    各Operationの実行後は固定sleepではなく、Operation.ready_condition()が
+    成立するまで(最大timeout秒)だけ待機する。
 
-    def __init__(self, *args):
+    Args:
+        *args: OperationまたはCase(ネストしたCaseは展開される)
+        timeout (int, optional): 1 Operationあたりの最大待機秒数. Defaults to 10.
+        poll_interval (float, optional): 待機条件のポーリング間隔(秒). Defaults to 0.05.
+        name (str, optional): lib.instrumentationで記録するときの名前. Defaults to "Case".
+    """
+
+    def __init__(self, *args, timeout=10, poll_interval=0.05, name="Case"):
         self.operations = []
         for arg in args:
             if isinstance(arg, Case):
@@ -14,12 +44,76 @@ class Case:
                 self.operations.append(arg)
             else:
                 raise ValueError("Invalid argument type")
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.name = name
+        self.timings = []
+        self.logger = logging.getLogger(__name__)
 
     def exec_operation(self, driver: WebDriver = None) -> str:
+        if tracer.enabled:
+            with tracer.span(self.name, "case", "case_seconds"):
+                return self._exec_operation(driver)
+        return self._exec_operation(driver)
+
+    def _exec_operation(self, driver):
+        self.timings = []
         for operation in self.operations:
-            time.sleep(1)  # FIXME: O_o
+            started = time.perf_counter()
+            # 遷移の判定などのために、条件は実行前に作成して操作前の状態を記録させる
+            condition = operation.ready_condition()
+            prepare_ready(operation.driver, condition)
             operation.exec()
+            executed = time.perf_counter()
+            ready = wait_until_ready(
+                operation.driver,
+                condition,
+                self.timeout,
+                self.poll_interval,
+            )
+            waited = time.perf_counter()
+            if tracer.enabled:
+                tracer.record(
+                    operation.__class__.__name__,
+                    "ready_wait",
+                    "ready_wait_seconds",
+                    executed,
+                    waited,
+                )
+            if not ready:
+                # 条件はwait_until_readyがwarningで記録している
+                self.logger.debug(
+                    "ready condition timed out: " + operation.__class__.__name__
+                )
+            self.timings.append(
+                OperationTiming(
+                    operation.__class__.__name__,
+                    executed - started,
+                    waited - executed,
+                    ready,
+                )
+            )
 
-        time.sleep(2)  # FIXME: O_o
+        self.logger.debug(self.report())
         if driver != None:
             return driver.page_source
+
+    def report(self):
+        """直近のexec_operationの所要時間レポートを返却する
+
+        Returns:
+            str: Operationごとの実行時間・待機時間と合計
+        """
+        lines = []
+        for i, timing in enumerate(self.timings, start=1):
+            lines.append(
+                f"{i:>3} {timing.name:<20} exec {timing.exec_time:7.3f}s"
+                f"  wait {timing.wait_time:7.3f}s"
+                + ("" if timing.ready else "  (timeout)")
+            )
+        total_exec = sum(t.exec_time for t in self.timings)
+        total_wait = sum(t.wait_time for t in self.timings)
+        lines.append(
+            f"    {'total':<20} exec {total_exec:7.3f}s  wait {total_wait:7.3f}s"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,198 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from lxml import html as lxml_html
+
+from lib.extractor import compile_selector, parse_html
+
+
+class ContentCache:
+    """_summary_
+    page_sourceのハッシュを記録し、前回と同じ内容のページのextract/format/outputを省略するためのキャッシュ。
+
+    * ページの内容はハッシュ値をファイル名にしてgzipで保存する(content-addressed)
+    * namespace(scraper)・page_key(ページ)ごとに直前に処理したハッシュをindex.jsonに記録する
+    * 時刻やCSRFトークンなど毎回変わるノードはvolatile_xpathsで除外してからハッシュを取る
+    * 保存したページの合計がmax_bytesを超えると、最後に使われたのが古いものから削除する。
+      削除したページはindex.jsonからも消すので、次回は変更ありとして処理される
+
+        Usage:
+            cache = ContentCache(".cache/pages", max_bytes=100 * 1024 * 1024)
+            digest = cache.fingerprint(html, ["//span[@id='now']"])
+            if not cache.is_unchanged("MyScraper1", "0", digest):
+                output(format(extract(html)))
+                cache.commit("MyScraper1", "0", digest, html)
+            print(cache.stats())
+    """
+
+    def __init__(self, directory=os.path.join(".cache", "pages"), max_bytes=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._indexes = {}  # namespace -> {page_key: digest}
+        self._stats = {}  # namespace -> [hits, misses]
+        self._blobs = None  # (namespace, digest) -> [最終使用時刻, サイズ]。最初のcommitで読み込む
+        self._total = 0
+
+    def fingerprint(self, html, volatile_xpaths=()):
+        """volatile_xpathsに一致するノードを除いたhtmlのハッシュ値を返す"""
+        if volatile_xpaths:
+            tree = parse_html(html)
+            for xpath in volatile_xpaths:
+                for node in compile_selector(xpath)(tree):
+                    # tailのテキストは残して要素だけ取り除く
+                    node.drop_tree()
+            data = lxml_html.tostring(tree)
+        else:
+            data = html.encode("utf-8") if isinstance(html, str) else html
+        return hashlib.sha256(data).hexdigest()
+
+    def is_unchanged(self, namespace, page_key, digest):
+        """前回commitした内容と同じならTrue。ヒット率の集計にも使う"""
+        with self._lock:
+            unchanged = self._index(namespace).get(str(page_key)) == digest
+            stats = self._stats.setdefault(namespace, [0, 0])
+            stats[0 if unchanged else 1] += 1
+        if unchanged:
+            # LRUのために最終使用時刻を更新する
+            self._touch(namespace, digest)
+        return unchanged
+
+    def commit(self, namespace, page_key, digest, html):
+        """ページを処理済みとして記録する。outputが成功してから呼ぶこと"""
+        blob_path = self._blob_path(namespace, digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if not os.path.exists(blob_path):
+            data = html.encode("utf-8") if isinstance(html, str) else html
+            tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, blob_path)
+        else:
+            self._touch(namespace, digest)
+
+        with self._lock:
+            index = self._index(namespace)
+            index[str(page_key)] = digest
+            blobs = self._load_blobs()
+            if (namespace, digest) not in blobs:
+                try:
+                    stat = os.stat(blob_path)
+                except OSError:
+                    stat = None
+                if stat is not None:
+                    blobs[(namespace, digest)] = [stat.st_mtime, stat.st_size]
+                    self._total += stat.st_size
+            self._evict()
+            self._save_index(namespace)
+
+    def load(self, namespace, digest):
+        """保存したページを返す。削除済みならNone"""
+        try:
+            with gzip.open(self._blob_path(namespace, digest), "rb") as f:
+                return f.read().decode("utf-8")
+        except OSError:
+            return None
+
+    def stats(self):
+        """namespaceごとのヒット数・ミス数・ヒット率を返す"""
+        with self._lock:
+            return {
+                namespace: {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                }
+                for namespace, (hits, misses) in self._stats.items()
+            }
+
+    def _index(self, namespace):
+        # self._lockを取得した状態で呼ぶこと
+        index = self._indexes.get(namespace)
+        if index is None:
+            try:
+                with open(self._index_path(namespace), encoding="utf-8") as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            self._indexes[namespace] = index
+        return index
+
+    def _index_path(self, namespace):
+        return os.path.join(self.directory, namespace, "index.json")
+
+    def _blob_path(self, namespace, digest):
+        return os.path.join(self.directory, namespace, digest + ".html.gz")
+
+    def _save_index(self, namespace):
+        # self._lockを取得した状態で呼ぶこと
+        index_path = self._index_path(namespace)
+        tmp_path = f"{index_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index(namespace), f)
+        os.replace(tmp_path, index_path)
+
+    def _touch(self, namespace, digest):
+        try:
+            os.utime(self._blob_path(namespace, digest))
+        except OSError:
+            return
+        with self._lock:
+            entry = (self._blobs or {}).get((namespace, digest))
+            if entry is not None:
+                entry[0] = time.time()
+
+    def _load_blobs(self):
+        # self._lockを取得した状態で呼ぶこと。ディレクトリを走査するのは最初の1回だけで、
+        # 以降はcommit・evictで差分を反映する
+        if self._blobs is None:
+            self._blobs = {}
+            self._total = 0
+            for root, _, files in os.walk(self.directory):
+                namespace = os.path.relpath(root, self.directory)
+                for name in files:
+                    if not name.endswith(".html.gz"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    digest = name[: -len(".html.gz")]
+                    self._blobs[(namespace, digest)] = [stat.st_mtime, stat.st_size]
+                    self._total += stat.st_size
+        return self._blobs
+
+    def _evict(self):
+        # self._lockを取得した状態で呼ぶこと
+        if self._total <= self.max_bytes:
+            return
+        evicted = set()
+        for key, (_, size) in sorted(self._blobs.items(), key=lambda item: item[1][0]):
+            namespace, digest = key
+            path = self._blob_path(namespace, digest)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            del self._blobs[key]
+            self._total -= size
+            evicted.add(key)
+            self.logger.debug(f"evicted {path}")
+            if self._total <= self.max_bytes:
+                break
+
+        # 削除したページを参照しているpage_keyは、次回は変更ありとして処理させる
+        for namespace in {namespace for namespace, _ in evicted}:
+            index = self._index(namespace)
+            stale = [key for key, digest in index.items() if (namespace, digest) in evicted]
+            for key in stale:
+                del index[key]
+            self._save_index(namespace)
@@ -0,0 +1,400 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import WebDriverException
+
+from lib.e2e_util import Util
+
+
+# Chromeが1タブに保持する履歴の最大数。これを超えると古いものから捨てられる
+MAX_HISTORY_ENTRIES = 50
+
+FIREFOX_CLEAR_STORAGE_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var flags = Ci.nsIClearDataService;
+Services.clearData.deleteData(flags.CLEAR_DOM_STORAGES | flags.CLEAR_COOKIES, {
+  onDataDeleted: function (failed) { done(failed === 0); }
+});
+"""
+
+
+def _origin(url):
+    """http(s)のURLのorigin。それ以外(about:blank等)はNone"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class PooledDriver:
+    """プール内のdriverと、その利用状況"""
+
+    def __init__(self, driver, allow=()):
+        self.driver = driver
+        self.allow = allow  # 起動時のLeanProfileに追加したallow
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+
+class DriverPool:
+    """_summary_
+    WebDriverをスレッドセーフに貸し出すプール。
+    返却時にセッション(cookie, 全originのstorage, タブ)をリセットし、次の利用者に使い回す。
+
+    * 最大max_size個までdriverを起動する。全て貸出中ならcheckoutは返却を待つ
+    * max_uses回使ったdriverは返却時に破棄して作り直す
+    * storageを消せない場合(Firefoxでchrome contextが使えない等)も使い回さずに破棄する
+    * idle_timeout秒使われなかったdriverは破棄する
+    * 貸出時にヘルスチェックし、応答しないdriverは破棄して作り直す
+    * lean(lib.browser_profile.LeanProfile)を渡すと画像・フォント等を読み込まないdriverを起動する。
+      checkoutのlean_allowごとに、そのallowを加えたLeanProfileで起動したdriverを貸し出す
+      (Chromeの画像・Firefoxのprefsは起動時にしか変えられないため)。空きが無ければ
+      別のallowで待機中のdriverを破棄して起動し直す
+
+        Usage:
+            pool = DriverPool(is_chrome=True, is_headless=True, max_size=2)
+
+            with pool.borrow() as driver:
+                Catalog.login_user(driver).exec_operation(driver)
+
+            print(pool.stats())
+            pool.close()
+    """
+
+    def __init__(
+        self,
+        is_chrome=True,
+        is_headless=False,
+        max_size=2,
+        max_uses=50,
+        idle_timeout=600,
+        factory=None,
+        lean=None,
+    ):
+        self.is_chrome = is_chrome
+        self.is_headless = is_headless
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self.lean = lean
+        # factoryはallowを指定して起動する場合だけallowを引数に呼ばれる
+        self.factory = factory or self._create_driver
+        self.logger = logging.getLogger(__name__)
+
+        self._cond = threading.Condition()
+        self._idle = []  # 返却済みのPooledDriver(末尾が最も最近返却されたもの)
+        self._in_use = {}  # id(driver) -> PooledDriver
+        self._size = 0  # 起動中(起動処理中を含む)のdriver数
+        self._closed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.launches = 0
+        self.launch_failures = 0
+        self.recycled = 0
+        self.evicted = 0
+        self.unhealthy = 0
+        self.launch_latencies = []
+
+    def checkout(self, timeout=None, lean_allow=()):
+        """driverを借りる。使い終わったら必ずcheckinすること
+
+        Args:
+            timeout (float, optional): 空きを待つ最大秒数. Noneなら無制限.
+            lean_allow (tuple, optional): leanに加えて読み込みを許可する種類・URLパターン
+                (lib.browser_profile.LeanProfile). leanが無ければ無視する. Defaults to ().
+
+        Raises:
+            TimeoutError: timeout秒以内にdriverを借りられなかった
+
+        Returns:
+            _type_: driver
+        """
+        allow = tuple(sorted(set(lean_allow))) if self.lean is not None else ()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("DriverPool is closed")
+                expired = self._pop_expired()
+                while True:
+                    entry = self._pop_idle(allow)
+                    if entry is not None:
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    if self._idle:
+                        # 別のallowで起動したdriverしか空いていないので、破棄して枠を空ける
+                        expired.append(self._idle.pop(0))
+                        self._size -= 1
+                        self.evicted += 1
+                        continue
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("no driver available in DriverPool")
+                    self._cond.wait(remaining)
+            self._quit_all(expired)
+
+            if entry is None:
+                entry = self._launch(allow)
+                with self._cond:
+                    self.misses += 1
+            elif not self._is_healthy(entry.driver):
+                self.logger.debug("discard unhealthy driver")
+                self._discard(entry, "unhealthy")
+                continue
+            else:
+                with self._cond:
+                    self.hits += 1
+
+            entry.uses += 1
+            with self._cond:
+                self._in_use[id(entry.driver)] = entry
+            return entry.driver
+
+    def checkin(self, driver, discard=False):
+        """借りたdriverを返却する
+
+        Args:
+            driver (_type_): checkoutで借りたdriver
+            discard (bool, optional): Trueなら使い回さずに破棄する. Defaults to False.
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(driver), None)
+        if entry is None:
+            raise ValueError("driver is not checked out from this pool")
+
+        if discard or self._closed:
+            self._discard(entry, "evicted")
+            return
+        if entry.uses >= self.max_uses:
+            self._discard(entry, "recycled")
+            return
+        try:
+            cleared = self.reset_session(driver)
+        except Exception as e:
+            # driverのプロセスが終了している場合はWebDriverExceptionではなく
+            # urllib3のMaxRetryError等になる。どちらも破棄して枠を空ける
+            self.logger.debug(f"failed to reset driver session: {e}")
+            self._discard(entry, "unhealthy")
+            return
+        if not cleared:
+            self.logger.debug("discard driver whose storage could not be cleared")
+            self._discard(entry, "recycled")
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def borrow(self, timeout=None, lean_allow=()):
+        """with文でdriverを借りる。例外が発生した場合driverは破棄される"""
+        driver = self.checkout(timeout, lean_allow)
+        try:
+            yield driver
+        except BaseException:
+            self.checkin(driver, discard=True)
+            raise
+        self.checkin(driver)
+
+    def warm(self, n):
+        """最大n個のdriverを並列に起動して待機させておく
+
+        Args:
+            n (int): 起動する数(max_sizeを超える分は起動しない)
+
+        Returns:
+            int: 実際に起動した数
+        """
+        with self._cond:
+            n = max(0, min(n, self.max_size - self._size))
+            self._size += n
+        if n == 0:
+            return 0
+
+        # ブラウザの起動はほぼ外部プロセス待ちなのでスレッドで並列化できる
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            futures = [executor.submit(self._launch) for _ in range(n)]
+        launched = 0
+        for future in futures:
+            try:
+                entry = future.result()
+            except Exception as e:
+                self.logger.debug(f"failed to warm driver: {e}")
+                continue
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+            launched += 1
+        return launched
+
+    def evict_idle(self):
+        """idle_timeout秒以上使われていないdriverを破棄する"""
+        with self._cond:
+            expired = self._pop_expired()
+        self._quit_all(expired)
+
+    def close(self):
+        """待機中のdriverを全て終了する。貸出中のdriverは返却時に終了する"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._quit(entry.driver)
+
+    def stats(self):
+        """プールの統計情報を返却する
+
+        Returns:
+            dict: ヒット率・起動回数・起動時間など
+        """
+        with self._cond:
+            latencies = list(self.launch_latencies)
+            size, idle = self._size, len(self._idle)
+        requests = self.hits + self.misses
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "launches": self.launches,
+            "launch_failures": self.launch_failures,
+            "recycled": self.recycled,
+            "evicted": self.evicted,
+            "unhealthy": self.unhealthy,
+            "launch_latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "launch_latency_max": max(latencies, default=0.0),
+        }
+
+    @staticmethod
+    def reset_session(driver):
+        """次の利用者に影響しないように、タブ・cookie・全originのstorageを初期状態に戻す
+
+        Returns:
+            bool: storageを消せなかったoriginがあり得る場合はFalse(driverを使い回さないこと)
+        """
+        handles = driver.window_handles
+        cleared = True
+        origins = set()
+        if hasattr(driver, "execute_cdp_cmd"):
+            # 貸出中に各タブで開いたページのoriginを、閉じる前に履歴から集める
+            for handle in handles:
+                driver.switch_to.window(handle)
+                entries = driver.execute_cdp_cmd("Page.getNavigationHistory", {})["entries"]
+                origins.update(_origin(entry["url"]) for entry in entries)
+                if len(entries) >= MAX_HISTORY_ENTRIES:
+                    # 古い履歴は捨てられているので、全てのoriginは分からない
+                    cleared = False
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.switch_to.default_content()
+        driver.get("about:blank")
+
+        if hasattr(driver, "execute_cdp_cmd"):
+            # cookieだけ残したoriginも消す(iframe等、履歴に残らないoriginの分)
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+            for cookie in cookies:
+                domain = cookie["domain"].lstrip(".")
+                origins.update((f"http://{domain}", f"https://{domain}"))
+            origins.discard(None)
+            for origin in sorted(origins):
+                driver.execute_cdp_cmd(
+                    "Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"}
+                )
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        elif hasattr(driver, "context"):
+            # Firefoxはブラウザ側(chrome context)の権限で全originのstorageを消す。
+            # 起動オプションで許可されていない場合は消せないので、使い回さない
+            driver.delete_all_cookies()
+            try:
+                with driver.context(driver.CONTEXT_CHROME):
+                    cleared = driver.execute_async_script(FIREFOX_CLEAR_STORAGE_SCRIPT) and cleared
+            except WebDriverException:
+                cleared = False
+        else:
+            driver.delete_all_cookies()
+            cleared = False
+
+        # 前の利用者が見つけた要素やPlanのCaseを次の利用者に引き継がない
+        for name in ("_element_lookup", "_plan_cases"):
+            vars(driver).pop(name, None)
+        return cleared
+
+    def _create_driver(self, allow=()):
+        lean = self.lean.allowing(allow) if allow else self.lean
+        return Util.create_driver(self.is_chrome, self.is_headless, lean)
+
+    def _launch(self, allow=()):
+        started = time.perf_counter()
+        try:
+            driver = self.factory(allow) if allow else self.factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.launch_failures += 1
+                self._cond.notify()
+            raise
+        latency = time.perf_counter() - started
+        with self._cond:
+            self.launches += 1
+            self.launch_latencies.append(latency)
+        self.logger.debug(f"launched driver in {latency:.3f}s")
+        return PooledDriver(driver, allow)
+
+    def _pop_idle(self, allow):
+        # self._condを取得した状態で呼ぶこと。最も最近返却された、同じallowのdriverを返す
+        for index in range(len(self._idle) - 1, -1, -1):
+            if self._idle[index].allow == allow:
+                return self._idle.pop(index)
+        return None
+
+    def _is_healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception as e:
+            # chromedriverが終了している場合はMaxRetryError/ConnectionError等になる
+            self.logger.debug(f"health check failed: {e!r}")
+            return False
+
+    def _pop_expired(self):
+        # self._condを取得した状態で呼ぶこと
+        now = time.monotonic()
+        expired = [e for e in self._idle if now - e.last_used >= self.idle_timeout]
+        if expired:
+            self._idle = [e for e in self._idle if e not in expired]
+            self._size -= len(expired)
+            self.evicted += len(expired)
+            self._cond.notify_all()
+        return expired
+
+    def _discard(self, entry, reason):
+        with self._cond:
+            self._size -= 1
+            setattr(self, reason, getattr(self, reason) + 1)
+            self._cond.notify()
+        self._quit(entry.driver)
+
+    def _quit_all(self, entries):
+        for entry in entries:
+            self._quit(entry.driver)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            self.logger.debug(f"failed to quit driver: {e}")
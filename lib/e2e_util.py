@@ -6,12 +6,19 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.firefox.service import Service as FirefoxService
 from webdriver_manager.firefox import GeckoDriverManager
-from selenium.webdriver.common.by import By
 from bs4 import BeautifulSoup
 from oauth2client.service_account import ServiceAccountCredentials
 from googleapiclient.discovery import build
+from lib.browser_profile import LeanProfile
+from lib.bulk_query import bulk_query, count_table_rows, Query
+from lib.instrumentation import counted
+from lib.lookup import ElementLookup
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 import threading
+import time
 
 # mobile device setting
 # USE_MOBILE_DEVICE = "iPhone SE"
@@ -20,17 +27,92 @@ USE_MOBILE_DEVICE = "iPhone XR"
 # output path
 SCREENSHOT_DIR = "screenshot/"
 
+# webdriver_managerで解決したdriverのパスをプロセス間で共有するキャッシュ
+DRIVER_PATH_CACHE = os.path.join(
+    os.path.expanduser("~"), ".cache", "pynium", "driver_paths.json"
+)
+# ブラウザ更新に追従するため、キャッシュは1日で再解決する
+DRIVER_PATH_CACHE_TTL = 24 * 60 * 60
+
 
 class Util:
+    # driverバイナリの解決(webdriver_managerのダウンロード・展開)だけを保護するロック
     driver_creation_lock = threading.Lock()
+    driver_paths = {}
+    # 設定するとスクショ・HTMLをファイルではなくlib.artifact_sink.ArtifactSinkに非同期で保存する
+    artifact_sink = None
+
+    @staticmethod
+    def resolve_driver_path(is_chrome):
+        """chromedriver/geckodriverのパスを返却する。
+        プロセス内ではメモリに、プロセス間ではDRIVER_PATH_CACHEにキャッシュし、
+        webdriver_managerのinstall()はキャッシュが無いか期限切れの場合だけ呼ぶ。
+
+        Args:
+            is_chrome (bool): trueならchromedriver, falseならgeckodriver
+
+        Returns:
+            str: driverバイナリのパス
+        """
+        key = "chrome" if is_chrome else "firefox"
+        path = Util.driver_paths.get(key)
+        if path is not None:
+            return path
+
+        with Util.driver_creation_lock:
+            path = Util.driver_paths.get(key)
+            if path is None:
+                path = Util._load_driver_path_cache(key)
+            if path is None:
+                if is_chrome:
+                    path = ChromeDriverManager().install()
+                else:
+                    path = GeckoDriverManager().install()
+                Util._save_driver_path_cache(key, path)
+            Util.driver_paths[key] = path
+        return path
+
+    @staticmethod
+    def _load_driver_path_cache(key):
+        try:
+            with open(DRIVER_PATH_CACHE, encoding="utf-8") as f:
+                entry = json.load(f).get(key)
+        except (OSError, ValueError):
+            return None
+        if not entry or not os.path.exists(entry["path"]):
+            return None
+        if time.time() - entry["resolved_at"] > DRIVER_PATH_CACHE_TTL:
+            return None
+        return entry["path"]
+
+    @staticmethod
+    def _save_driver_path_cache(key, path):
+        try:
+            with open(DRIVER_PATH_CACHE, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache[key] = {"path": path, "resolved_at": time.time()}
+        try:
+            os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+            # 他プロセスが読みかけのファイルを壊さないように置き換える
+            tmp_path = f"{DRIVER_PATH_CACHE}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, DRIVER_PATH_CACHE)
+        except OSError:
+            # キャッシュできなくても次回install()し直すだけなので無視する
+            pass
 
     @staticmethod
-    def create_driver(is_chrome, is_headless=False):
+    def create_driver(is_chrome, is_headless=False, lean=None):
         """_summary_
 
         Args:
             is_chrome (bool): trueならchrome, falseならfirefox
             is_headless (bool, optional): chromeのみheadlessを選択できる. Defaults to False.
+            lean (LeanProfile, optional): 画像・フォント等を読み込まない軽量な設定(lib.browser_profile).
+                Trueなら既定のLeanProfile. Defaults to None.
 
         Returns:
             _type_: driver
@@ -40,49 +122,96 @@ class Util:
             create_driver(True,True) # headlessのchrome driver
             create_driver(False) # 通常のfirefox driver
             create_driver(False,True) # ※使わない。通常のfirefox driverを返却
+            create_driver(True,True,lean=True) # 画像等をブロックするheadlessのchrome driver
         """
+        if lean is True:
+            lean = LeanProfile()
+
+        if is_chrome:
+            chrome_options = ChromeOptions()
+            chrome_options.add_argument("--start-maximized")
+            chrome_options.add_experimental_option(
+                "excludeSwitches", ["enable-logging"]
+            )
 
-        with Util.driver_creation_lock:
-            if is_chrome:
-                chrome_options = ChromeOptions()
-                chrome_options.add_argument("--start-maximized")
-                chrome_options.add_experimental_option(
-                    "excludeSwitches", ["enable-logging"]
-                )
-
-                # headlessオプション設定
-                if is_headless:
-                    chrome_options.add_argument("--headless")
-                    chrome_options.add_argument("--no-sandbox")  # for docker
-                    chrome_options.add_argument("--disable-dev-shm-usage")  # for docker
-
-                # ケース完了時にブラウザを閉じない
-                chrome_options.add_experimental_option("detach", True)
-
-                driver = webdriver.Chrome(
-                    service=ChromeService(ChromeDriverManager().install()),
-                    options=chrome_options,
-                )
-            else:
-                firefox_options = FirefoxOptions()
-                firefox_options.add_argument("--start-maximized")
-                driver = webdriver.Firefox(
-                    service=FirefoxService(GeckoDriverManager().install()),
-                    options=firefox_options,
-                )
+            # headlessオプション設定
+            if is_headless:
+                chrome_options.add_argument("--headless")
+                chrome_options.add_argument("--no-sandbox")  # for docker
+                chrome_options.add_argument("--disable-dev-shm-usage")  # for docker
+
+            # ケース完了時にブラウザを閉じない
+            chrome_options.add_experimental_option("detach", True)
+
+            if lean is not None:
+                lean.chrome_options(chrome_options)
+
+            driver = webdriver.Chrome(
+                service=ChromeService(Util.resolve_driver_path(True)),
+                options=chrome_options,
+            )
+        else:
+            firefox_options = FirefoxOptions()
+            firefox_options.add_argument("--start-maximized")
+            if lean is not None:
+                lean.firefox_options(firefox_options)
+            driver = webdriver.Firefox(
+                service=FirefoxService(Util.resolve_driver_path(False)),
+                options=firefox_options,
+            )
+
+        if lean is not None:
+            lean.apply(driver)
+            # Scraper.borrow_driverがscraperごとの許可リストを反映するために保持する
+            driver.lean_profile = lean
+
+        # 待機はlib.lookup.ElementLookupの明示的な待機だけにする(implicitly_waitは設定しない)
+        return driver
+
+    @staticmethod
+    def create_drivers(n, is_chrome, is_headless=False, max_workers=None, lean=None):
+        """n個のdriverを並列に起動する
+
+        Args:
+            n (int): 起動するdriverの数
+            is_chrome (bool): trueならchrome, falseならfirefox
+            is_headless (bool, optional): create_driverと同じ. Defaults to False.
+            max_workers (int, optional): 同時に起動する数. Defaults to n.
+            lean (LeanProfile, optional): create_driverと同じ. Defaults to None.
 
-            driver.implicitly_wait(10)
-            return driver
+        Returns:
+            list: driverのリスト。1つでも起動に失敗した場合は起動済みのdriverを終了して例外を送出する
+        """
+        if n <= 0:
+            return []
+        # driverバイナリの解決は並列化できないので先に済ませておく
+        Util.resolve_driver_path(is_chrome)
+
+        with ThreadPoolExecutor(max_workers=max_workers or n) as executor:
+            futures = [
+                executor.submit(Util.create_driver, is_chrome, is_headless, lean)
+                for _ in range(n)
+            ]
+        drivers, errors = [], []
+        for future in futures:
+            try:
+                drivers.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            for driver in drivers:
+                driver.quit()
+            raise errors[0]
+        return drivers
 
     @staticmethod
     def create_driver_with_mobile():
         chrome_options = ChromeOptions()
         chrome_options.add_argument(USE_MOBILE_DEVICE)
         driver = webdriver.Chrome(
-            ChromeDriverManager().install(), options=chrome_options
+            service=ChromeService(Util.resolve_driver_path(True)),
+            options=chrome_options,
         )
-        driver.implicitly_wait(10)
-
         return driver
 
     @staticmethod
@@ -95,41 +224,91 @@ class Util:
     def take_screenshot(driver, file_name):
         file_path = SCREENSHOT_DIR + file_name
         screenshot = None
-        if isinstance(driver, Chrome):
+        # TabRunner等のプロキシは元のdriverで種類を判定し、操作はプロキシ経由で行う
+        wrapped = getattr(driver, "wrapped_driver", driver)
+        if Util.artifact_sink is not None:
+            # 画像の取得だけを行い、書き込みは書き込みスレッドに任せる
+            if isinstance(wrapped, Chrome):
+                png = driver.get_screenshot_as_png()
+            elif isinstance(wrapped, Firefox):
+                png = driver.get_full_page_screenshot_as_png()
+            else:
+                raise ValueError("Unsupported driver type")
+            Util.artifact_sink.put(file_name + ".png", png, kind="png")
+            return
+        if isinstance(wrapped, Chrome):
             screenshot = driver.get_screenshot_as_file(file_path + ".png")
-        elif isinstance(driver, Firefox):
+        elif isinstance(wrapped, Firefox):
             screenshot = driver.get_full_page_screenshot_as_file(file_path + ".png")
         else:
             raise ValueError("Unsupported driver type")
 
     @staticmethod
-    def count_elements_by_xpath(driver, xpath):
-        """指定されたXPathに一致する要素の数を返却する
+    def count_elements_by_xpath(driver, xpath, timeout=0):
+        """指定されたXPathに一致する要素の数を返却する。
+        implicitly_waitは設定しないので、既定では呼んだ時点の要素数をすぐに返す
 
         Args:
             driver (_type_): Selenium WebDriverのインスタンス
             xpath (str): 要素を検索するためのXPath
+            timeout (int, optional): 要素が1つも無い場合に、現れるまで待つ最大秒数. Defaults to 0.
 
         Returns:
-            int: 指定されたXPathに一致する要素の数
+            int: 指定されたXPathに一致する要素の数。timeout秒待っても無ければ0
         """
-        elements = driver.find_elements(By.XPATH, xpath)
-        return len(elements)
+        query = {"count": Query(xpath, count_only=True)}
+        if not timeout:
+            return bulk_query(driver, query)["count"]
+        try:
+            return ElementLookup.of(driver).wait(timeout).until(
+                counted(lambda driver: bulk_query(driver, query)["count"])
+            )
+        except TimeoutException:
+            return 0
 
     @staticmethod
-    def count_table_records_by_xpath(driver, xpath):
+    def count_table_records_by_xpath(driver, xpath, timeout=0):
         """指定されたXPathに一致するテーブルのレコード数を返却する。ヘッダー行もカウントする。
+        既定ではテーブルが現れるのを待たない
 
         Args:
             driver (_type_): Selenium WebDriverのインスタンス
             xpath (str): テーブルを検索するためのXPath
+            timeout (int, optional): テーブルが現れるまで待つ最大秒数. Defaults to 0.
 
         Returns:
             int: 指定されたXPathに一致するテーブルのレコード数
+
+        Raises:
+            NoSuchElementException: timeout秒待ってもテーブルが無い
+        """
+        if timeout:
+            try:
+                ElementLookup.of(driver).find(xpath, timeout)
+            except TimeoutException:
+                raise NoSuchElementException(f"no such element: {xpath}")
+        return count_table_rows(driver, xpath)
+
+    @staticmethod
+    def bulk_query(driver, queries):
+        """複数のセレクタと取り出す値を1回のexecute_scriptでまとめて評価する。
+        詳細はlib.bulk_query.bulk_queryを参照
+
+        Args:
+            driver (_type_): Selenium WebDriverのインスタンス
+            queries (dict): {名前: Query}
+
+        Returns:
+            dict: {名前: 結果}
+
+        Usage:
+            from lib.bulk_query import Query
+
+            rows = Util.bulk_query(driver, {
+                "rows": Query("//table[@id='items']//tr[td]", fields={"id": "td[1]", "name": "td[2]"}),
+            })["rows"]
         """
-        table = driver.find_element(By.XPATH, xpath)
-        rows = table.find_elements(By.TAG_NAME, "tr")
-        return len(rows)
+        return bulk_query(driver, queries)
 
     @staticmethod
     def convert_url(url, parameters):
@@ -138,14 +317,36 @@ class Util:
             converted_url = converted_url.replaceFirst("\\{.*?\\}", parameter)
         return converted_url
 
+    @staticmethod
+    def save_raw_html(html, file_name):
+        """page_sourceを整形せずにそのまま保存する。
+        整形は見るときにlib.html_viewで行うので、保存時のCPU・メモリ消費が小さい
+
+        Args:
+            html (str): page_source
+            file_name (str): temp/以下のファイル名(artifact_sinkがあればその保存名)
+        """
+        if Util.artifact_sink is not None:
+            Util.artifact_sink.put(file_name, html)
+            return
+
+        os.makedirs("temp", exist_ok=True)
+        with open(os.path.join("temp", file_name), "wb") as f:
+            f.write(html.encode("utf-8"))
+
     @staticmethod
     def save_formatted_html(html, file_name):
+        # 巨大なページではprettifyに数秒かかるので、定期実行ではsave_raw_htmlを使うこと
         # BeautifulSoupオブジェクトを作成
         soup = BeautifulSoup(html, "html.parser")
 
         # フォーマットされたHTMLを保存
         formatted_html = soup.prettify()
 
+        if Util.artifact_sink is not None:
+            Util.artifact_sink.put(file_name, formatted_html)
+            return
+
         # tempフォルダが存在しない場合は作成
         os.makedirs("temp", exist_ok=True)
 
@@ -0,0 +1,135 @@
+import io
+from functools import lru_cache
+
+from lxml import etree
+from lxml import html as lxml_html
+
+
+@lru_cache(maxsize=1024)
+def compile_selector(expression, css=False):
+    """XPath/CSSセレクタをコンパイルする。同じ式は2回目以降キャッシュを返す
+
+    Args:
+        expression (str): XPathまたはCSSセレクタ
+        css (bool, optional): TrueならCSSセレクタとして扱う. Defaults to False.
+
+    Returns:
+        _type_: 要素を受け取り一致したノードのリストを返すcallable
+    """
+    if css:
+        # cssselectはCSSを使う場合だけ必要
+        from lxml.cssselect import CSSSelector
+
+        return CSSSelector(expression)
+    return etree.XPath(expression)
+
+
+def parse_html(html):
+    """page_source(文字列またはbytes)をlxmlのツリーにする"""
+    return lxml_html.document_fromstring(html)
+
+
+class Field:
+    """_summary_
+    1レコードから取り出す1項目の定義。selectorはレコードの要素からの相対パス。
+
+    * attrを指定すると属性値、指定しなければ要素配下のテキストを取り出す
+    * XPathがtext()や@属性を指す場合はその文字列をそのまま取り出す
+    * many=Trueなら一致した全ての値のリスト、Falseなら最初の値(無ければdefault)
+
+        Usage:
+            Field("name", "td[2]")
+            Field("link", "td[2]/a", attr="href")
+            Field("tags", ".//span[@class='tag']", many=True)
+    """
+
+    def __init__(self, name, selector, attr=None, css=False, many=False, default=None):
+        self.name = name
+        self.selector = selector
+        self.attr = attr
+        self.css = css
+        self.many = many
+        self.default = default
+        self._compiled = compile_selector(selector, css)
+
+    def extract(self, element):
+        values = [self._value(node) for node in self._compiled(element)]
+        if self.many:
+            return values
+        return values[0] if values else self.default
+
+    def _value(self, node):
+        if isinstance(node, str):
+            return str(node).strip()
+        if self.attr is not None:
+            return node.get(self.attr, self.default)
+        # iterparseの要素はHtmlElementではない(text_contentが無い)のでitertextで連結する
+        return "".join(node.itertext()).strip()
+
+
+class Extractor:
+    """_summary_
+    row_selectorに一致する要素ごとにfieldsを取り出し、dictのリストにする。
+    BeautifulSoup(html.parser)より高速なlxmlで、コンパイル済みのセレクタを使う。
+
+        Usage:
+            extractor = Extractor("//table[@id='items']//tr[td]", [
+                Field("id", "td[1]"),
+                Field("name", "td[2]"),
+            ])
+            rows = extractor.extract(html)
+
+            # 巨大なページはiterextractで1レコードずつ取り出し、メモリ使用量を抑える
+            for row in extractor.iterextract(html, tag="tr", row_filter="td"):
+                ...
+    """
+
+    def __init__(self, row_selector, fields, css=False):
+        self.row_selector = row_selector
+        self.fields = fields
+        self.css = css
+        self._rows = compile_selector(row_selector, css)
+
+    def extract(self, html):
+        """html全体をパースしてレコードのリストを返す
+
+        Args:
+            html (str): page_source、またはパース済みのlxmlの要素
+
+        Returns:
+            list: {Field.name: 値}のリスト
+        """
+        tree = parse_html(html) if isinstance(html, (str, bytes)) else html
+        return [self.extract_row(row) for row in self._rows(tree)]
+
+    def extract_row(self, element):
+        return {field.name: field.extract(element) for field in self.fields}
+
+    def iterextract(self, source, tag, row_filter=None, encoding="utf-8"):
+        """iterparseでtagの要素が閉じるたびにレコードを返す。
+        処理済みの要素は破棄するので、巨大なページでもメモリ使用量が一定に保たれる。
+        row_selectorは使わず、fieldsのセレクタはtagの要素からの相対パスで評価する。
+
+        Args:
+            source (_type_): page_source(文字列/bytes)、ファイルパス、またはファイルオブジェクト
+            tag (str): レコードの要素のタグ名(例: "tr")
+            row_filter (str, optional): 要素を基準に評価し、一致する場合だけレコードにするXPath. Defaults to None.
+            encoding (str, optional): sourceが文字列の場合のエンコーディング. Defaults to "utf-8".
+
+        Yields:
+            dict: {Field.name: 値}
+        """
+        if isinstance(source, str) and source.lstrip().startswith("<"):
+            source = io.BytesIO(source.encode(encoding))
+        elif isinstance(source, bytes):
+            source = io.BytesIO(source)
+        row_filter = compile_selector(row_filter) if row_filter else None
+
+        for _, element in etree.iterparse(source, events=("end",), tag=tag, html=True):
+            if row_filter is None or row_filter(element):
+                yield self.extract_row(element)
+            # 処理済みの要素と、それより前の兄弟要素を解放する
+            element.clear()
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
@@ -0,0 +1,71 @@
+"""_summary_
+保存済みのHTMLを、見るときに初めて整形(prettify)する。
+保存時はUtil.save_raw_html/DownloadHTML(mode="raw")でpage_sourceをそのまま書き、
+整形のコストは人が見るときだけ払う。
+
+    Usage:
+        # temp/以下のファイルを整形して標準出力に出す
+        python -m lib.html_view temp/page.html
+
+        # ArtifactSinkのアーカイブからnameが一致する最新のHTMLを整形してファイルに出す
+        python -m lib.html_view artifacts page.html formatted.html
+"""
+import os
+import sys
+
+from bs4 import BeautifulSoup
+
+from lib.artifact_sink import iter_records
+
+
+def format_html(html):
+    """Util.save_formatted_htmlと同じ形式に整形する"""
+    return BeautifulSoup(html, "html.parser").prettify()
+
+
+def read_html(path, name=None):
+    """保存済みのHTMLを読む
+
+    Args:
+        path (str): HTMLファイル、またはArtifactSinkのアーカイブ(.packファイル/ディレクトリ)
+        name (str, optional): アーカイブから読む場合の保存名. 同名が複数あれば最新のもの. Defaults to None.
+
+    Raises:
+        FileNotFoundError: アーカイブにnameのHTMLが無い
+
+    Returns:
+        str: HTML
+    """
+    if not (os.path.isdir(path) or path.endswith(".pack")):
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8")
+
+    found = None
+    for header, data in iter_records(path):
+        if header["name"] == name and data is not None:
+            found = data
+    if found is None:
+        raise FileNotFoundError(f"{name} is not found in {path}")
+    return found.decode("utf-8")
+
+
+def main(argv):
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__)
+        return 1
+    path = argv[0]
+    archived = os.path.isdir(path) or path.endswith(".pack")
+    name = argv[1] if archived and len(argv) > 1 else None
+    output = argv[2 if archived else 1] if len(argv) > (2 if archived else 1) else None
+
+    formatted = format_html(read_html(path, name))
+    if output is None:
+        sys.stdout.write(formatted)
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(formatted)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
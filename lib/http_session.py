@@ -0,0 +1,125 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.operation import Fetch, Get
+
+
+class HttpSession:
+    """_summary_
+    JavaScriptが不要なページをブラウザを使わずに取得するためのセッション。
+    WebDriverと同じくpage_source/current_urlを持つので、Fetchオペレーションと
+    Case.exec_operationにdriverの代わりに渡せる。
+
+    * keep-aliveのコネクションプールを使い回す
+    * gzip/deflateで受信する
+    * ETag/Last-Modifiedで条件付きGETを行い、304の場合は前回の内容を返す
+    * import_cookiesでログイン済みのWebDriverのcookieを引き継げる
+
+        Usage:
+            session = HttpSession()
+            with pool.borrow() as driver:
+                Catalog.login_user(driver).exec_operation(driver)
+                session.import_cookies(driver)
+
+            case = Case(Fetch(session, const.BASE_URL + "/items"))
+            html = case.exec_operation(session)
+            scraper.extract(html)
+    """
+
+    def __init__(self, timeout=30, pool_maxsize=10, headers=None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        if headers:
+            self.session.headers.update(headers)
+        self.logger = logging.getLogger(__name__)
+
+        self.page_source = None
+        self.current_url = None
+        self.status_code = None
+        self.not_modified = 0  # 304で前回の内容を返した回数
+        self._validators = {}  # url -> (ETag, Last-Modified, 本文)
+
+    def import_cookies(self, driver, user_agent=True):
+        """WebDriverのcookie(とUser-Agent)をこのセッションにコピーする
+
+        Args:
+            driver (_type_): ログイン済みのWebDriver
+            user_agent (bool, optional): User-Agentもブラウザに揃える. Defaults to True.
+        """
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain"),
+                path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False),
+            )
+        if user_agent:
+            self.session.headers["User-Agent"] = driver.execute_script(
+                "return navigator.userAgent"
+            )
+
+    def get(self, url):
+        """urlを取得し、page_sourceに本文を設定する
+
+        Args:
+            url (str): 取得するURL
+
+        Returns:
+            str: 本文
+        """
+        headers = {}
+        validator = self._validators.get(url)
+        if validator is not None:
+            etag, last_modified, _ = validator
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        self.status_code = response.status_code
+        self.current_url = response.url
+        if response.status_code == 304 and validator is not None:
+            self.not_modified += 1
+            self.page_source = validator[2]
+            return self.page_source
+
+        response.raise_for_status()
+        self.page_source = response.text
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._validators[url] = (etag, last_modified, self.page_source)
+        return self.page_source
+
+    def run(self, case):
+        """GetとFetchだけで構成されたCaseを、ブラウザを使わずにこのセッションで実行する
+
+        Args:
+            case (Case): 実行するCase
+
+        Raises:
+            ValueError: ブラウザが必要なOperationが含まれている
+
+        Returns:
+            str: 最後に取得したページの本文(Case.exec_operationの戻り値と同じ形)
+        """
+        for operation in case.operations:
+            if not isinstance(operation, (Get, Fetch)):
+                raise ValueError(
+                    operation.__class__.__name__ + " requires a browser and cannot run in HTTP mode"
+                )
+        for operation in case.operations:
+            self.logger.debug("Fetching: " + operation.url)
+            self.get(operation.url)
+        return self.page_source
+
+    def close(self):
+        self.session.close()
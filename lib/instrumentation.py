@@ -0,0 +1,264 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# レイテンシのヒストグラムのバケット境界(秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+METRIC_PREFIX = "pynium_"
+METRIC_HELP = {
+    "operation_seconds": ("histogram", "Operation.exec latency", "operation"),
+    "ready_wait_seconds": ("histogram", "Wait for Operation.ready_condition after exec", "operation"),
+    "case_seconds": ("histogram", "Case.exec_operation latency", "case"),
+    "failures_total": ("counter", "Operation/Case calls that raised", "name"),
+    "webdriver_wait_polls_total": ("counter", "WebDriverWait condition evaluations", "operation"),
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+
+class Tracer:
+    """_summary_
+    Operation.exec/Case.exec_operationの所要時間を記録する。
+
+    * 無効(既定)のときは、ラップしたexecは属性を1つ確認して元の関数を呼ぶだけ
+    * 有効にすると、名前ごとのレイテンシのヒストグラム・WebDriverWaitのポーリング回数・
+      失敗回数を集計し、直近max_events件のスパンをトレースイベントとして保持する
+    * Chromeのトレースイベント形式(chrome://tracing、Perfetto)のJSONと、
+      Prometheusのテキスト形式(ファイル、HTTP)で出力できる
+
+        Usage:
+            from lib.instrumentation import tracer
+
+            tracer.enable()
+            Catalog.login_user(driver).exec_operation(driver)
+            tracer.export_chrome_trace("trace.json")
+            tracer.write_prometheus("/var/lib/node_exporter/pynium.prom")
+
+            # または http://localhost:9100/metrics で公開する
+            server = tracer.serve_prometheus(9100)
+    """
+
+    def __init__(self, max_events=100000):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}  # (metric, label) -> Histogram
+        self._counters = {}  # (metric, label) -> int
+        self._events = deque(maxlen=max_events)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._events.clear()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        """このスレッドで実行中の最も内側のスパンの(名前, key)。無ければ(None, None)"""
+        stack = self._stack()
+        return stack[-1] if stack else (None, None)
+
+    @contextmanager
+    def span(self, name, category="operation", metric="operation_seconds", key=None):
+        """withの中の処理をnameのスパンとして記録する。例外はfailures_totalに数えて再送出する"""
+        stack = self._stack()
+        stack.append((name, key))
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            ended = time.perf_counter()
+            stack.pop()
+            self.record(name, category, metric, started, ended, failed)
+
+    def record(self, name, category, metric, started, ended, failed=False):
+        """perf_counterのstarted〜endedをnameのスパンとして記録する"""
+        with self._lock:
+            histogram = self._histograms.get((metric, name))
+            if histogram is None:
+                histogram = self._histograms[(metric, name)] = Histogram()
+            histogram.observe(ended - started)
+            if failed:
+                self._counters[("failures_total", name)] = (
+                    self._counters.get(("failures_total", name), 0) + 1
+                )
+            self._events.append(
+                (name, category, started, ended, threading.get_ident(), failed)
+            )
+
+    def count(self, metric, label, n=1):
+        with self._lock:
+            self._counters[(metric, label)] = self._counters.get((metric, label), 0) + n
+
+    def summary(self):
+        """{metric: {名前: {"count", "sum", "avg"} または回数}}を返す"""
+        with self._lock:
+            result = {}
+            for (metric, label), histogram in self._histograms.items():
+                result.setdefault(metric, {})[label] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "avg": histogram.sum / histogram.count,
+                }
+            for (metric, label), value in self._counters.items():
+                result.setdefault(metric, {})[label] = value
+            return result
+
+    def chrome_trace(self):
+        """Chromeのトレースイベント形式のdictを返す"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": started * 1e6,
+                    "dur": (ended - started) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"failed": failed},
+                }
+                for name, category, started, ended, tid, failed in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def prometheus_text(self):
+        """Prometheusのテキスト形式(exposition format)の文字列を返す"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        for metric, (metric_type, help_text, label_name) in METRIC_HELP.items():
+            name = METRIC_PREFIX + metric
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "histogram":
+                for (hist_metric, label), histogram in histograms:
+                    if hist_metric != metric:
+                        continue
+                    label = f'{label_name}="{_escape(label)}"'
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        lines.append(f'{name}_bucket{{{label},le="{le}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+            else:
+                for (counter_metric, label), value in counters:
+                    if counter_metric == metric:
+                        lines.append(f'{name}{{{label_name}="{_escape(label)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """node_exporterのtextfile collector向けに、途中の内容が読まれないよう置き換えで書き込む"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve_prometheus(self, port=9100, host="0.0.0.0"):
+        """/metricsでprometheus_textを返すHTTPサーバーを別スレッドで起動する。停止はshutdown()"""
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# プロセス全体で共有するTracer
+tracer = Tracer()
+
+
+def traced(exec_func):
+    """Operation.execをラップする。Operation.__init_subclass__が自動で適用する"""
+
+    @functools.wraps(exec_func)
+    def exec(self, *args, **kwargs):
+        if not tracer.enabled or tracer.current()[1] is self:
+            # 無効時、またはsuper().exec()で同じOperationのスパン内にいる場合はそのまま呼ぶ
+            return exec_func(self, *args, **kwargs)
+        with tracer.span(self.__class__.__name__, key=self):
+            return exec_func(self, *args, **kwargs)
+
+    exec.__traced__ = True
+    return exec
+
+
+def counted(condition):
+    """WebDriverWait.untilに渡す条件をラップし、評価(ポーリング)回数を実行中のOperationに数える"""
+    if not tracer.enabled:
+        return condition
+
+    name = tracer.current()[0] or "unknown"
+
+    def poll(driver):
+        tracer.count("webdriver_wait_polls_total", name)
+        return condition(driver)
+
+    return poll
@@ -0,0 +1,108 @@
+import time
+
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from lib.instrumentation import counted
+
+
+class ElementLookup:
+    """_summary_
+    driverごとの要素検索。Operationはself.lookup経由で要素を探す。
+
+    * 待機は明示的な待機(WebDriverWait)だけを使う。implicitly_waitは設定しないこと
+      (暗黙の待機と重なると、要素が無い場合の失敗までの時間が倍になる)
+    * WebDriverWaitはtimeoutごとに1つ作成して使い回す
+    * 見つけた要素はxpathごとにttl秒だけ保持する。ページ遷移で古くなった要素を使い
+      StaleElementReferenceExceptionになった場合は、探し直して1回だけやり直す
+    * Get/SwitchToFrameなど、別のドキュメントに移る操作の後はinvalidate()で破棄する
+
+        Usage:
+            lookup = ElementLookup.of(driver)
+            lookup.perform("//button[@id='ok']", lambda element: element.click())
+    """
+
+    def __init__(self, driver, ttl=3.0, poll_frequency=0.1):
+        self.driver = driver
+        self.ttl = ttl
+        self.poll_frequency = poll_frequency
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._waits = {}  # timeout -> WebDriverWait
+        self._elements = {}  # (xpath, visible) -> (element, 期限)
+
+    @classmethod
+    def of(cls, driver):
+        """driverのElementLookupを返す。無ければ作成してdriverの属性に保持する
+        (driverを参照するのでWeakKeyDictionaryには入れられない。driverと一緒に破棄される)
+        """
+        lookup = getattr(driver, "_element_lookup", None)
+        if lookup is None:
+            lookup = driver._element_lookup = cls(driver)
+        return lookup
+
+    def wait(self, timeout=10):
+        """timeout秒のWebDriverWaitを返す。同じtimeoutなら同じインスタンスを使い回す"""
+        wait = self._waits.get(timeout)
+        if wait is None:
+            wait = self._waits[timeout] = WebDriverWait(
+                self.driver, timeout, poll_frequency=self.poll_frequency
+            )
+        return wait
+
+    def find(self, xpath, timeout=10, visible=False):
+        """xpathの要素を返す。ttl秒以内に見つけた要素があればそれを返す
+
+        Args:
+            xpath (str): 要素のXPath
+            timeout (int, optional): 要素が現れるまで待つ最大秒数. Defaults to 10.
+            visible (bool, optional): 表示されるまで待つ. Defaults to False.
+
+        Raises:
+            TimeoutException: timeout秒以内に要素が見つからなかった
+        """
+        key = (xpath, visible)
+        cached = self._elements.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0]
+
+        self.misses += 1
+        if visible:
+            condition = EC.visibility_of_element_located((By.XPATH, xpath))
+        else:
+            condition = EC.presence_of_element_located((By.XPATH, xpath))
+        element = self.wait(timeout).until(counted(condition))
+        self._elements[key] = (element, time.monotonic() + self.ttl)
+        return element
+
+    def perform(self, xpath, action, timeout=10, visible=False):
+        """xpathの要素にactionを実行する。要素が古くなっていたら探し直して1回だけやり直す
+
+        Args:
+            xpath (str): 要素のXPath
+            action (callable): 要素を受け取る関数
+            timeout (int, optional): findと同じ. Defaults to 10.
+            visible (bool, optional): findと同じ. Defaults to False.
+
+        Returns:
+            _type_: actionの戻り値
+        """
+        element = self.find(xpath, timeout, visible)
+        try:
+            return action(element)
+        except StaleElementReferenceException:
+            self.stale += 1
+            self.invalidate()
+            return action(self.find(xpath, timeout, visible))
+
+    def invalidate(self):
+        """保持している要素を全て破棄する"""
+        self._elements.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale}
@@ -1,15 +1,43 @@
 from lib.case import Case
+from lib.e2e_util import Util
 from lib.operation import Click, Get, Screenshot, Submit, Input, SelectBox, DownloadHTML, ExecuteJS, ClickUntilNotFound, SwitchToFrame
+from lib.plan import Param, Plan, Step
 
 import my_const as const
 
 class Catalog:
 
+    # driverに依存しない定義。実行時にbindでdriverとパラメータを当てはめる
+    LOGIN = Plan(
+        Step(Input, "//*[@name='login_id']", Param("login_id")),
+        Step(Input, "//*[@name='password']", Param("password")),
+        Step(Submit, "//form[@name='login_form']"),
+        name="login",
+    )
+
+    @staticmethod
+    def login_user(driver, login_id=const.ID, password=const.PASSWORD):
+        return Catalog.LOGIN.bind(driver, login_id=login_id, password=password)
+
+    @staticmethod
+    def is_logged_in(driver):
+        """ホーム画面を開き、ログインフォームに戻されなければTrue"""
+        Case(Get(driver, const.BASE_URL + "/home")).exec_operation()
+        return Util.count_elements_by_xpath(driver, "//form[@name='login_form']") == 0
+
     @staticmethod
-    def login_user(driver):
-        case = Case(
-            Input(driver, "//*[@name='login_id']", const.ID),
-            Input(driver, "//*[@name='password']", const.PASSWORD),
-            Submit(driver, "//form[@name='login_form']")
+    def ensure_logged_in(driver, session_cache, login_id=const.ID, password=const.PASSWORD):
+        """session_cache(lib.session_cache.SessionCache)のセッションを復元し、
+        使えなければログインする。ログインした場合は次回のためにセッションを保存する
+
+        Returns:
+            bool: 保存したセッションを使った場合True
+        """
+
+        def login(driver):
+            Case(Get(driver, const.BASE_URL + "/login")).exec_operation()
+            Catalog.login_user(driver, login_id, password).exec_operation()
+
+        return session_cache.ensure(
+            driver, const.BASE_URL, login_id, login, Catalog.is_logged_in
         )
-        return case
@@ -1,12 +1,18 @@
 import logging
 import time
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.select import Select
-import os
+from selenium.common.exceptions import (
+    ElementClickInterceptedException,
+    ElementNotInteractableException,
+    WebDriverException,
+)
 
+from lib.bulk_query import Query, bulk_query
 from lib.e2e_util import Util
+from lib.instrumentation import traced
+from lib.lookup import ElementLookup
+from lib.wait import DocumentReady, ElementStable, NavigationComplete, NetworkIdle, NoWait
 
 
 class Operation:
@@ -14,15 +20,50 @@ class Operation:
         self.driver = driver
         self.logger = logging.getLogger(__name__)
 
+    def __init_subclass__(cls, **kwargs):
+        # サブクラスのexecを計測用にラップする(lib.instrumentation.tracerが無効なら素通し)
+        super().__init_subclass__(**kwargs)
+        exec_func = cls.__dict__.get("exec")
+        if exec_func is not None and not getattr(exec_func, "__traced__", False):
+            cls.exec = traced(exec_func)
+
+    @property
+    def lookup(self):
+        """driverごとのElementLookup(WebDriverWaitと要素のキャッシュ)"""
+        return ElementLookup.of(self.driver)
+
+    def ready_condition(self):
+        """exec後にCaseが待機する条件を返す。サブクラスで操作に合わせて上書きする"""
+        return DocumentReady()
+
 
 class Get(Operation):
     def __init__(self, driver, url):
         super().__init__(driver)
         self.url = url
 
+    def ready_condition(self):
+        return NetworkIdle()
+
     def exec(self):
         self.logger.debug("Executing Get: " + self.url)
         self.driver.get(self.url)
+        self.lookup.invalidate()
+
+
+class Fetch(Operation):
+    """ブラウザを使わずにHttpSessionでurlを取得する。driverにはHttpSessionを渡す"""
+
+    def __init__(self, session, url):
+        super().__init__(session)
+        self.url = url
+
+    def ready_condition(self):
+        return NoWait()
+
+    def exec(self):
+        self.logger.debug("Executing Fetch: " + self.url)
+        self.driver.get(self.url)
 
 
 class Screenshot(Operation):
@@ -30,6 +71,9 @@ class Screenshot(Operation):
         super().__init__(driver)
         self.title = title
 
+    def ready_condition(self):
+        return NoWait()
+
     def exec(self):
         self.logger.debug("Executing Screenshot: " + self.title)
         Util.take_screenshot(self.driver, self.title)
@@ -40,20 +84,23 @@ class Click(Operation):
         super().__init__(driver)
         self.xpath = xpath
 
+    def ready_condition(self):
+        return NavigationComplete()
+
     def exec(self):
         self.logger.debug("Executing Click: " + self.xpath)
-        wait = WebDriverWait(self.driver, 10)
         try:
-            element = wait.until(EC.presence_of_element_located((By.XPATH, self.xpath)))
+            self.lookup.perform(self.xpath, self._click)
+        except WebDriverException:
+            self.logger.debug("elements not found")
+
+    def _click(self, element):
+        try:
+            element.click()
+        except (ElementClickInterceptedException, ElementNotInteractableException):
+            # 画面外・他の要素に隠れている場合はスクロールしてからクリックする
+            self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
             element.click()
-        except Exception as e:
-            try:
-                self.driver.execute_script(
-                    "arguments[0].scrollIntoView(true);", element
-                )
-                element.click()
-            except Exception as e:
-                self.logger.debug("elements not found")
 
 
 class Submit(Operation):
@@ -61,11 +108,12 @@ class Submit(Operation):
         super().__init__(driver)
         self.xpath = xpath
 
+    def ready_condition(self):
+        return NavigationComplete()
+
     def exec(self):
         self.logger.debug("Executing Submit: " + self.xpath)
-        wait = WebDriverWait(self.driver, 10)
-        element = wait.until(EC.presence_of_element_located((By.XPATH, self.xpath)))
-        element.submit()
+        self.lookup.perform(self.xpath, lambda element: element.submit())
 
 
 class Input(Operation):
@@ -74,11 +122,14 @@ class Input(Operation):
         self.xpath = xpath
         self.value = value
 
+    def ready_condition(self):
+        return ElementStable(self.xpath)
+
     def exec(self):
         self.logger.debug("Executing Input: " + self.xpath)
-        wait = WebDriverWait(self.driver, 10)
-        element = wait.until(EC.visibility_of_element_located((By.XPATH, self.xpath)))
-        element.send_keys(self.value)
+        self.lookup.perform(
+            self.xpath, lambda element: element.send_keys(self.value), visible=True
+        )
 
 
 class SelectBox(Operation):
@@ -87,27 +138,42 @@ class SelectBox(Operation):
         self.xpath = xpath
         self.value = value
 
+    def ready_condition(self):
+        return NavigationComplete()
+
     def exec(self):
         self.logger.debug("Executing SelectBox: " + self.xpath)
-        wait = WebDriverWait(self.driver, 10)
-        element = wait.until(EC.presence_of_element_located((By.XPATH, self.xpath)))
-        select = Select(element)
-        select.select_by_visible_text(self.value)
+        self.lookup.perform(
+            self.xpath, lambda element: Select(element).select_by_visible_text(self.value)
+        )
 
 
 class DownloadHTML(Operation):
-    def __init__(self, driver, filename):
+    """page_sourceをtemp/filenameに保存する
+
+    * mode="raw": page_sourceをそのまま保存する(整形はlib.html_viewで見るときに行う)
+    * mode="pretty": BeautifulSoupで整形してから保存する
+    """
+
+    MODES = ("raw", "pretty")
+
+    def __init__(self, driver, filename, mode="raw"):
         super().__init__(driver)
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}: {mode}")
         self.filename = filename
+        self.mode = mode
+
+    def ready_condition(self):
+        return NoWait()
 
     def exec(self):
         self.logger.debug("Executing DownloadHTML: " + self.filename)
         html = self.driver.page_source
-        os.makedirs(
-            "temp", exist_ok=True
-        )  # ディレクトリが存在しない場合にディレクトリを作成
-        with open(os.path.join("temp", self.filename), "w", encoding="utf-8") as f:
-            f.write(html)
+        if self.mode == "pretty":
+            Util.save_formatted_html(html, self.filename)
+        else:
+            Util.save_raw_html(html, self.filename)
 
 
 class ExecuteJS(Operation):
@@ -115,52 +181,219 @@ class ExecuteJS(Operation):
         super().__init__(driver)
         self.script = script
 
+    def ready_condition(self):
+        return NetworkIdle()
+
     def exec(self):
         self.logger.debug("Executing JavaScript: " + self.script)
         self.driver.execute_script(self.script)
 
 
-class ClickUntilNotFound(Click):
+class LoadMore(Operation):
+    """_summary_
+    「もっと見る」ボタンのクリック、またはページ末尾へのスクロールを、項目が増えなくなるまで繰り返す。
+
+    * 増えたかどうかはitem_xpathの要素数と、MutationObserverで観測したDOMの変更で判定する
+    * クリック/スクロール後、settle_time秒DOMの変更が無く要素数も増えていなければ終了する
+    * button_xpathの要素が無くなった場合、max_iterations回繰り返した場合、
+      time_budget秒を超えた場合も終了する。終了理由はstop_reasonに入る
+    * on_new_itemsを渡すと、読み込まれた項目を全件の読み込みを待たずに順次渡す
+      (fieldsはlib.bulk_query.Queryのfieldsと同じ形式。省略時は要素のテキスト)
+
+        Usage:
+            LoadMore(
+                driver,
+                "//table[@id='items']//tr[td]",
+                button_xpath="//button[@id='more']",
+                fields={"id": "td[1]", "name": "td[2]"},
+                on_new_items=lambda rows: writer.write_stream(rows),
+            )
+    """
+
+    # 初回だけMutationObserverを登録する。画面遷移した場合は登録し直す
+    OBSERVER_SCRIPT = """
+var state = window.__pyniumLoadMore;
+if (!state) {
+  state = window.__pyniumLoadMore = {seq: 0, last: performance.now(), action: 0};
+  new MutationObserver(function (records) {
+    state.seq += records.length;
+    state.last = performance.now();
+  }).observe(document.documentElement, {childList: true, subtree: true});
+}
+function count(xpath) {
+  if (!xpath) return 0;
+  return document.evaluate('count(' + xpath + ')', document, null,
+    XPathResult.NUMBER_TYPE, null).numberValue;
+}
+"""
+    ACTION_SCRIPT = OBSERVER_SCRIPT + """
+var before = count(arguments[0]);
+var seq = state.seq;
+if (arguments[1]) {
+  var button = document.evaluate(arguments[1], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+  if (!button) return null;
+  button.scrollIntoView({block: 'center'});
+  button.click();
+} else {
+  window.scrollTo(0, document.documentElement.scrollHeight);
+}
+state.action = performance.now();
+return [before, seq];
+"""
+    # [要素数, DOM変更の通し番号, 最後のDOM変更(またはクリック)からのミリ秒]
+    POLL_SCRIPT = OBSERVER_SCRIPT + """
+return [count(arguments[0]), state.seq, performance.now() - Math.max(state.last, state.action)];
+"""
+
+    def __init__(
+        self,
+        driver,
+        item_xpath,
+        button_xpath=None,
+        max_iterations=50,
+        time_budget=60,
+        settle_time=1.0,
+        iteration_timeout=10,
+        poll_interval=0.1,
+        on_new_items=None,
+        fields=None,
+    ):
+        super().__init__(driver)
+        self.item_xpath = item_xpath
+        self.button_xpath = button_xpath
+        self.max_iterations = max_iterations
+        self.time_budget = time_budget
+        self.settle_time = settle_time
+        self.iteration_timeout = iteration_timeout
+        self.poll_interval = poll_interval
+        self.on_new_items = on_new_items
+        self.fields = fields
+
+        self.iterations = 0
+        self.item_count = 0
+        self.stop_reason = None
+
+    def ready_condition(self):
+        # exec内で読み込みの完了を待っている
+        return NoWait()
+
     def exec(self):
-        self.logger.debug("Executing ClickUntilNotFound: " + self.xpath)
-        wait = WebDriverWait(self.driver, 3)
+        self.logger.debug(
+            f"Executing {self.__class__.__name__}: {self.button_xpath or 'scroll'}"
+        )
+        deadline = time.perf_counter() + self.time_budget
+        self.iterations = 0
+        self.stop_reason = None
+        streamed = 0
+        while True:
+            if self.iterations >= self.max_iterations:
+                self.stop_reason = "max_iterations"
+                break
+            if time.perf_counter() >= deadline:
+                self.stop_reason = "time_budget"
+                break
+            result = self.driver.execute_script(
+                self.ACTION_SCRIPT, self.item_xpath, self.button_xpath
+            )
+            if result is None:
+                self.stop_reason = "exhausted"
+                break
+            before, seq = result
+            streamed = self._stream(streamed, before)
+            self.iterations += 1
+            if not self._wait_for_growth(before, seq, deadline):
+                self.stop_reason = "no_growth"
+                break
+
+        self.item_count = self.driver.execute_script(self.POLL_SCRIPT, self.item_xpath)[0]
+        self._stream(streamed, self.item_count)
+        self.logger.debug(
+            f"{self.__class__.__name__} stopped ({self.stop_reason}):"
+            f" {self.iterations} iterations, {self.item_count} items"
+        )
+
+    def _wait_for_growth(self, before, seq, deadline):
+        # 項目が増えたらTrue、DOMが落ち着いても増えなければFalse
+        iteration_deadline = min(deadline, time.perf_counter() + self.iteration_timeout)
         while True:
             try:
-                element = wait.until(
-                    EC.presence_of_element_located((By.XPATH, self.xpath))
+                count, current_seq, quiet_ms = self.driver.execute_script(
+                    self.POLL_SCRIPT, self.item_xpath
                 )
-                element.click()
-            except Exception as e:
-                try:
-                    # 要素が見つからない場合、スクロールしてから再度クリックを試みる
-                    self.driver.execute_script(
-                        "arguments[0].scrollIntoView(true);", element
-                    )
-                    element.click()
-                except Exception as e:
-                    # スクロールしても要素が見つからない場合、ループを終了
-                    self.logger.debug("No more elements found, stopping.")
-                    break
+            except WebDriverException:
+                # 画面遷移中はスクリプト実行に失敗することがある
+                count, current_seq, quiet_ms = before, seq, 0
+            settled = quiet_ms >= self.settle_time * 1000
+            if self.item_xpath is not None:
+                if count > before:
+                    return True
+            elif current_seq != seq and settled:
+                return True
+            if settled or time.perf_counter() >= iteration_deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def _stream(self, streamed, count):
+        # streamed件目からcount件目までをon_new_itemsに渡し、渡し終えた件数を返す
+        if self.on_new_items is None or self.item_xpath is None or count <= streamed:
+            return streamed
+        query = Query(
+            self.item_xpath, fields=self.fields, offset=streamed, limit=count - streamed
+        )
+        rows = bulk_query(self.driver, {"rows": query})["rows"]
+        if rows:
+            self.on_new_items(rows)
+        return streamed + len(rows)
+
+
+class ClickUntilNotFound(LoadMore):
+    """xpathの要素が無くなるまでクリックする。
+    クリックしてもDOMが変化しなくなった場合、max_clicks回・time_budget秒に達した場合も終了する
+    """
+
+    def __init__(self, driver, xpath, max_clicks=100, time_budget=60, settle_time=0.5):
+        super().__init__(
+            driver,
+            None,
+            button_xpath=xpath,
+            max_iterations=max_clicks,
+            time_budget=time_budget,
+            settle_time=settle_time,
+        )
+
+    @property
+    def xpath(self):
+        return self.button_xpath
+
+    @xpath.setter
+    def xpath(self, xpath):
+        self.button_xpath = xpath
 
 
 class SwitchToFrame(Operation):
-    def __init__(self, driver, reference_type, frame_reference=None):
+    def __init__(self, driver, reference_type, frame_reference=None, timeout=10):
         super().__init__(driver)
         self.frame_reference = frame_reference
         self.reference_type = reference_type
+        self.timeout = timeout
 
     def exec(self):
-        time.sleep(1)  # FIXME: フレーム変更はwaitをいれると壊れる？
         self.logger.debug("Switching to frame: " + str(self.frame_reference))
         if self.reference_type == "index":
             if self.frame_reference is None:
                 raise ValueError(
                     "frame_reference must be provided when reference_type is 'index'."
                 )
-            self.driver.switch_to.frame(int(self.frame_reference))
+            # 固定のsleepではなく、フレームが読み込まれて切り替えられるまで待つ
+            self.lookup.wait(self.timeout).until(
+                EC.frame_to_be_available_and_switch_to_it(int(self.frame_reference))
+            )
         elif self.reference_type == "parent":
             self.driver.switch_to.parent_frame()
         else:
             raise ValueError(
                 "Invalid reference_type. It should be either 'index' or 'parent'."
             )
+        # 別のドキュメントに移ったので、見つけた要素は使えない
+        self.lookup.invalidate()
@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+def extract_and_format(scraper, html):
+    """プロセスプールのワーカーで実行する。scraperはpickleされて渡される"""
+    return scraper.format(scraper.extract(html))
+
+
+class ParsePool:
+    """_summary_
+    Scraper.extract/formatを別プロセスで実行するプール。複数のScrapePipelineで共有する。
+    結果はキューを経由して1本の出力スレッドでScraper.outputに渡される。
+
+    * workers: パース用のプロセス数. Noneならコア数
+    * max_pending: 投入済みでoutputが終わっていないページの上限。
+      上限に達するとsubmit(=ブラウザ側のスレッド)が空きを待つ
+    * ワーカーはforkではなくforkserver(無い環境ではspawn)で起動する。
+      scraperのクラスはimportできるモジュールのトップレベルで定義すること
+
+        Usage:
+            parse_pool = ParsePool(workers=4, max_pending=8)
+            scheduler = AsyncScheduler(max_workers=2, driver_pool=driver_pool)
+            scheduler.add(5, ScrapePipeline(MyScraper1(), parse_pool))
+            scheduler.add(10, ScrapePipeline(MyScraper2(), parse_pool))
+            scheduler.start()
+            parse_pool.close()
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        # ブラウザ側のスレッドやロックを持つプロセスからforkすると、ワーカーがデッドロックしうる
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+        )
+        self.logger = logging.getLogger(__name__)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._results = queue.Queue()
+        self._output_thread = threading.Thread(target=self._output_loop, daemon=True)
+        self._output_thread.start()
+
+    def submit(self, scraper, html, timeout=None, on_output=None):
+        """htmlのextract/formatをプロセスプールに投入する
+
+        Args:
+            scraper (Scraper): extract/format/outputを実装したscraper(pickle可能であること)
+            html (str): Case.exec_operationが返却したpage_source
+            timeout (float, optional): 空きを待つ最大秒数. Noneなら無制限.
+            on_output (callable, optional): outputが成功した後に出力スレッドで呼ぶ関数. Defaults to None.
+
+        Raises:
+            TimeoutError: timeout秒以内に空きができなかった
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("ParsePool is full")
+        try:
+            future = self.executor.submit(extract_and_format, scraper, html)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._results.put((scraper, f, on_output)))
+
+    def close(self, wait=True):
+        """投入済みのページを処理してから終了する"""
+        self.executor.shutdown(wait=wait)
+        self._results.put(None)
+        if wait:
+            self._output_thread.join()
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": self.submitted - self.completed - self.failed,
+        }
+
+    def _output_loop(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                return
+            scraper, future, on_output = item
+            try:
+                scraper.output(future.result())
+                if on_output is not None:
+                    on_output()
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                self.logger.exception(f"{scraper.__class__.__name__} failed to parse")
+            finally:
+                self._slots.release()
+
+
+class ScrapePipeline:
+    """_summary_
+    ブラウザ操作(exec_selenium)だけを呼び出し元のスレッドで行い、
+    パース以降をParsePoolに任せる。Scheduler/AsyncSchedulerにはscraperの代わりに登録する。
+
+    scraper.exec_seleniumはpage_source(またはそのリスト)を返却すること。
+    scraperにcontent_cacheがあれば、前回と同じ内容のページはParsePoolに投入しない。
+    """
+
+    def __init__(self, scraper, parse_pool):
+        self.scraper = scraper
+        self.parse_pool = parse_pool
+
+    @property
+    def driver_pool(self):
+        return self.scraper.driver_pool
+
+    @driver_pool.setter
+    def driver_pool(self, driver_pool):
+        self.scraper.driver_pool = driver_pool
+
+    def exec(self):
+        pages = self.scraper.exec_selenium()
+        if isinstance(pages, str):
+            pages = [pages]
+        for page_key, html in enumerate(pages):
+            digest = self.scraper.page_digest(html, page_key)
+            if digest is None:
+                continue
+            self.parse_pool.submit(
+                self.scraper,
+                html,
+                on_output=lambda html=html, digest=digest, page_key=page_key: (
+                    self.scraper.commit_page(html, digest, page_key)
+                ),
+            )
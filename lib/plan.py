@@ -0,0 +1,251 @@
+import inspect
+import json
+import threading
+
+from lib.case import Case
+from lib.operation import Operation
+
+
+_MISSING = object()
+
+
+class Param:
+    """Planの実行時に値を渡す引数。Step(Input, xpath, Param("login_id"))のように使う"""
+
+    __slots__ = ("name", "default")
+
+    def __init__(self, name, default=_MISSING):
+        self.name = name
+        self.default = default
+
+    def resolve(self, params):
+        value = params.get(self.name, self.default)
+        if value is _MISSING:
+            raise ValueError(f"missing plan parameter: {self.name}")
+        return value
+
+    def to_json(self):
+        if self.default is _MISSING:
+            return {"param": self.name}
+        return {"param": self.name, "default": self.default}
+
+    def __repr__(self):
+        return f"Param({self.name!r})"
+
+
+class Step:
+    """driverに依存しないOperationの定義。argsはdriverを除いたOperationのコンストラクタ引数"""
+
+    __slots__ = ("operation", "args", "kwargs")
+
+    def __init__(self, operation, *args, **kwargs):
+        if not (inspect.isclass(operation) and issubclass(operation, Operation)):
+            raise ValueError(f"Step requires an Operation class: {operation!r}")
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+
+    def build(self, driver, params):
+        """paramsを当てはめてOperationを作成する"""
+        args = [_resolve(arg, params) for arg in self.args]
+        kwargs = {name: _resolve(value, params) for name, value in self.kwargs.items()}
+        return self.operation(driver, *args, **kwargs)
+
+    def param_slots(self):
+        """(コンストラクタの引数名, Param)のリスト。
+        引数名と同じ名前の属性が無いOperation(ClickUntilNotFoundのmax_clicks等)もあるので、
+        Plan.bindは属性が無い場合はOperationを作り直す
+        """
+        names = list(inspect.signature(self.operation.__init__).parameters)[2:]
+        slots = [(names[i], arg) for i, arg in enumerate(self.args) if isinstance(arg, Param)]
+        slots.extend((name, value) for name, value in self.kwargs.items() if isinstance(value, Param))
+        return slots
+
+    def to_json(self):
+        step = {"op": self.operation.__name__, "args": [_to_json(arg) for arg in self.args]}
+        if self.kwargs:
+            step["kwargs"] = {name: _to_json(value) for name, value in self.kwargs.items()}
+        return step
+
+    def __repr__(self):
+        return f"Step({self.operation.__name__}, {self.args!r})"
+
+
+def _resolve(value, params):
+    return value.resolve(params) if isinstance(value, Param) else value
+
+
+def _to_json(value):
+    return value.to_json() if isinstance(value, Param) else value
+
+
+def _from_json(value):
+    if isinstance(value, dict) and "param" in value:
+        return Param(value["param"], value.get("default", _MISSING))
+    return value
+
+
+def operation_registry():
+    """{クラス名: Operationのサブクラス}。JSON/YAMLから読み込むときに使う"""
+    registry = {}
+    pending = [Operation]
+    while pending:
+        cls = pending.pop()
+        for subclass in cls.__subclasses__():
+            registry.setdefault(subclass.__name__, subclass)
+            pending.append(subclass)
+    return registry
+
+
+class Plan:
+    """_summary_
+    driverに依存しないCaseの定義。一度だけ定義し、実行時にdriverとパラメータを当てはめる。
+
+    * Planの入れ子は定義時に1回だけ展開する
+    * bindはdriverごとに作成したCase(Operation)をdriverに保持し、2回目以降はParamの属性を
+      書き換えるだけなので、実行のたびにOperationのグラフを作り直さない。
+      引数名と同じ名前の属性が無いOperationだけは作り直す
+    * to_json/to_yamlで保存し、from_json/from_yaml/loadでPythonのCatalogなしに読み込める
+
+        Usage:
+            LOGIN = Plan(
+                Step(Input, "//*[@name='login_id']", Param("login_id")),
+                Step(Input, "//*[@name='password']", Param("password")),
+                Step(Submit, "//form[@name='login_form']"),
+                name="login",
+            )
+
+            with pool.borrow() as driver:
+                LOGIN.bind(driver, login_id="user01", password="...").exec_operation(driver)
+
+            LOGIN.save("plans/login.json")
+            login = Plan.load("plans/login.json")
+    """
+
+    # driverごとのCaseの作成・書き換えを排他する
+    _bind_lock = threading.Lock()
+
+    def __init__(self, *steps, name="Plan", timeout=10, poll_interval=0.05):
+        flattened = []
+        for step in steps:
+            if isinstance(step, Plan):
+                flattened.extend(step.steps)
+            elif isinstance(step, Step):
+                flattened.append(step)
+            else:
+                raise ValueError("Invalid argument type")
+        self.steps = tuple(flattened)
+        self.name = name
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        # (Operationの位置, 属性名, Param)
+        self._slots = tuple(
+            (index, attr, param)
+            for index, step in enumerate(self.steps)
+            for attr, param in step.param_slots()
+        )
+
+    @property
+    def params(self):
+        """Planが受け取るパラメータ名"""
+        return sorted({param.name for _, _, param in self._slots})
+
+    def bind(self, driver, **params):
+        """driverとparamsを当てはめたCaseを返す。同じdriverには同じCaseを返すので、
+        同時に同じdriverで実行しないこと(DriverPoolから借りたdriverなら問題ない)
+
+        Args:
+            driver (_type_): WebDriver、またはHttpSession
+            **params: Paramの名前と値
+
+        Returns:
+            Case: 実行するCase
+        """
+        # CaseはOperation経由でdriverを参照するので、WeakKeyDictionaryではなくdriverの属性に
+        # {Plan: (Case, 作り直すOperationの位置)}を保持する。driverと一緒に破棄される
+        with Plan._bind_lock:
+            cases = getattr(driver, "_plan_cases", None)
+            if cases is None:
+                cases = driver._plan_cases = {}
+            bound = cases.get(self)
+            if bound is None:
+                operations = [step.build(driver, params) for step in self.steps]
+                rebuild = frozenset(
+                    index for index, attr, _ in self._slots if not hasattr(operations[index], attr)
+                )
+                case = Case(
+                    *operations,
+                    timeout=self.timeout,
+                    poll_interval=self.poll_interval,
+                    name=self.name,
+                )
+                cases[self] = (case, rebuild)
+                return case
+
+            case, rebuild = bound
+            operations = case.operations
+            for index in rebuild:
+                operations[index] = self.steps[index].build(driver, params)
+            for index, attr, param in self._slots:
+                if index not in rebuild:
+                    setattr(operations[index], attr, param.resolve(params))
+            return case
+
+    def exec_operation(self, driver, **params):
+        return self.bind(driver, **params).exec_operation(driver)
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "timeout": self.timeout,
+            "poll_interval": self.poll_interval,
+            "steps": [step.to_json() for step in self.steps],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """to_jsonの形式のdictからPlanを作成する"""
+        registry = operation_registry()
+        steps = []
+        for step in data["steps"]:
+            operation = registry.get(step["op"])
+            if operation is None:
+                raise ValueError(f"unknown operation: {step['op']}")
+            args = [_from_json(arg) for arg in step.get("args", [])]
+            kwargs = {name: _from_json(value) for name, value in step.get("kwargs", {}).items()}
+            steps.append(Step(operation, *args, **kwargs))
+        return cls(
+            *steps,
+            name=data.get("name", "Plan"),
+            timeout=data.get("timeout", 10),
+            poll_interval=data.get("poll_interval", 0.05),
+        )
+
+    def to_yaml(self):
+        import yaml  # PyYAMLはYAMLを使う場合だけ必要
+
+        return yaml.safe_dump(self.to_json(), allow_unicode=True, sort_keys=False)
+
+    @classmethod
+    def from_yaml(cls, text):
+        import yaml
+
+        return cls.from_json(yaml.safe_load(text))
+
+    def save(self, path):
+        """拡張子が.yaml/.ymlならYAML、それ以外はJSONで保存する"""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                f.write(self.to_yaml())
+            else:
+                json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                return cls.from_yaml(f.read())
+            return cls.from_json(json.load(f))
+
+    def __repr__(self):
+        return f"Plan({self.name!r}, {len(self.steps)} steps)"
@@ -0,0 +1,393 @@
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+
+from selenium.common import exceptions as selenium_exceptions
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.remote.webelement import WebElement
+
+
+ARCHIVE_VERSION = 1
+# この長さ以上の文字列(page_source等)は本体から分けて、同じ内容を1つにまとめて保存する
+BLOB_MIN_LENGTH = 256
+
+
+class ReplayMiss(WebDriverException):
+    """記録に無いコマンドをReplayDriverで実行した"""
+
+
+def _key(target, name, args=None, kwargs=None):
+    # argsがNoneなら属性の取得、リストならメソッドの呼び出し
+    if args is not None:
+        args = [_encode_arg(arg) for arg in args]
+        if kwargs:
+            args.append({key: _encode_arg(value) for key, value in sorted(kwargs.items())})
+    return json.dumps([target, name, args], sort_keys=True, separators=(",", ":"))
+
+
+def _encode_arg(value):
+    if isinstance(value, (WebElement, _Recorder, ReplayElement)):
+        return {"__element__": value.id}
+    if isinstance(value, (list, tuple)):
+        return [_encode_arg(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _encode_arg(item) for key, item in value.items()}
+    return value
+
+
+class ReplayArchive:
+    """_summary_
+    RecordingDriverが記録し、ReplayDriverが再生するコマンドと応答の集まり。
+
+    * (対象, コマンド, 引数)ごとに、応答を記録した順に保持する
+    * page_source等の長い文字列は内容のハッシュで1つにまとめる(blobs)
+    * gzipしたJSONファイルに保存する
+
+        Usage:
+            archive = ReplayArchive.load("fixtures/login.replay.gz")
+            for html in archive.pages():
+                scraper.extract(html)
+    """
+
+    def __init__(self, responses=None, blobs=None):
+        self.responses = responses or {}  # キー -> 応答のリスト
+        self.blobs = blobs or {}  # sha256 -> 文字列(bytesはbase64)
+        self._lock = threading.Lock()
+
+    def record(self, target, name, args, value, kwargs=None):
+        """応答を追加する。valueは記録用に変換済みの値(RecordingDriverが変換する)"""
+        key = _key(target, name, args, kwargs)
+        value = self._store(value)
+        with self._lock:
+            self.responses.setdefault(key, []).append(value)
+
+    def _store(self, value):
+        if isinstance(value, str) and len(value) >= BLOB_MIN_LENGTH:
+            return {"__blob__": self._blob(value)}
+        if isinstance(value, bytes):
+            return {"__bytes__": self._blob(base64.b64encode(value).decode("ascii"))}
+        if isinstance(value, list):
+            return [self._store(item) for item in value]
+        if isinstance(value, dict) and "__element__" not in value and "__error__" not in value:
+            return {key: self._store(item) for key, item in value.items()}
+        return value
+
+    def _blob(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.blobs.setdefault(digest, text)
+        return digest
+
+    def resolve(self, value):
+        """記録した値から長い文字列・bytesを復元する"""
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if isinstance(value, dict):
+            if "__blob__" in value:
+                return self.blobs[value["__blob__"]]
+            if "__bytes__" in value:
+                return base64.b64decode(self.blobs[value["__bytes__"]])
+            if "__element__" in value or "__error__" in value:
+                return value
+            return {key: self.resolve(item) for key, item in value.items()}
+        return value
+
+    def pages(self):
+        """記録したpage_sourceを順に返す(同じ内容が続く場合は1回だけ)"""
+        previous = None
+        for value in self.responses.get(_key("driver", "page_source"), []):
+            if value != previous:
+                yield self.resolve(value)
+            previous = value
+
+    def to_json(self):
+        return {"version": ARCHIVE_VERSION, "responses": self.responses, "blobs": self.blobs}
+
+    def save(self, path):
+        with self._lock:
+            data = json.dumps(self.to_json(), separators=(",", ":"))
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(data)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"unsupported replay archive version: {data.get('version')}")
+        return cls(data["responses"], data["blobs"])
+
+    def stats(self):
+        return {
+            "commands": len(self.responses),
+            "responses": sum(len(values) for values in self.responses.values()),
+            "blobs": len(self.blobs),
+            "blob_bytes": sum(len(blob) for blob in self.blobs.values()),
+        }
+
+
+class _Recorder:
+    """属性の取得・メソッドの呼び出しを実際のdriver(要素)に渡し、応答をarchiveに記録するプロキシ"""
+
+    def __init__(self, archive, target, wrapped):
+        object.__setattr__(self, "archive", archive)
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_wrapped", wrapped)
+
+    def __getattr__(self, name):
+        # ElementLookup等がdriverに持たせる属性("_element_lookup"等)はプロキシ自身に持つ
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            value = getattr(self._wrapped, name)
+        except WebDriverException as e:
+            self._record_error(name, None, None, e)
+            raise
+        if callable(value):
+            return self._recording_call(name, value)
+        return self._record(name, None, None, value)
+
+    def _recording_call(self, name, func):
+        def call(*args, **kwargs):
+            try:
+                result = func(*_unwrap(args), **_unwrap(kwargs))
+            except WebDriverException as e:
+                self._record_error(name, args, kwargs, e)
+                raise
+            return self._record(name, list(args), kwargs, result)
+
+        return call
+
+    def _record(self, name, args, kwargs, value):
+        try:
+            encoded = self._encode(value)
+        except TypeError:
+            # WebDriverの応答ではない値(lean_profile等)は記録せずにそのまま返す
+            return value
+        self.archive.record(self._target, name, args, encoded, kwargs)
+        return self._wrap(value)
+
+    def _record_error(self, name, args, kwargs, error):
+        # seleniumが例外の生成時にメッセージへ付け足す説明は、再生時にも付くので除く
+        message = (error.msg or "").split("; For documentation on this error")[0]
+        encoded = {"__error__": [error.__class__.__name__, message]}
+        self.archive.record(self._target, name, None if args is None else list(args), encoded, kwargs)
+
+    def _encode(self, value):
+        if value is None or isinstance(value, (str, bytes, int, float, bool)):
+            return value
+        if isinstance(value, WebElement):
+            return {"__element__": value.id}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(item) for item in value]
+        if isinstance(value, dict):
+            return {str(key): self._encode(item) for key, item in value.items()}
+        raise TypeError(type(value).__name__)
+
+    def _wrap(self, value):
+        if isinstance(value, WebElement):
+            return _Recorder(self.archive, "element:" + value.id, value)
+        if isinstance(value, list):
+            return [self._wrap(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._wrap(item) for key, item in value.items()}
+        return value
+
+    @property
+    def id(self):
+        # 要素の場合、WebElement.id
+        return self._wrapped.id
+
+    @property
+    def wrapped_element(self):
+        return self._wrapped
+
+    def __eq__(self, other):
+        return self._wrapped == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._wrapped)
+
+
+def _unwrap(value):
+    # seleniumに渡す引数の記録用プロキシを元のWebElementに戻す
+    if isinstance(value, _Recorder):
+        return value.wrapped_element
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _unwrap(item) for key, item in value.items()}
+    return value
+
+
+class RecordingDriver(_Recorder):
+    """_summary_
+    実際のWebDriverをラップし、OperationやCaseが実行したコマンド(get・要素の検索・
+    page_source・current_url・execute_script等)と応答をReplayArchiveに記録する。
+    記録したものはReplayDriverでブラウザ無しに再生できる。
+
+    * Operationのサブクラスは変更不要。WebDriverの代わりにこのdriverを渡す
+    * Util.take_screenshot等の型判定用に、元のdriverをwrapped_driverで参照できる
+    * DriverPoolのfactoryに渡せば、プールから借りたdriverの操作を記録できる
+
+        Usage:
+            driver = RecordingDriver(Util.create_driver(True, True))
+            html = Catalog.login_user(driver).exec_operation(driver)
+            driver.save("fixtures/login.replay.gz")
+            driver.quit()
+    """
+
+    def __init__(self, driver, archive=None):
+        super().__init__(archive or ReplayArchive(), "driver", driver)
+
+    @property
+    def wrapped_driver(self):
+        return self._wrapped
+
+    @property
+    def switch_to(self):
+        return _Recorder(self.archive, "switch_to", self._wrapped.switch_to)
+
+    def save(self, path):
+        self.archive.save(path)
+
+    def __repr__(self):
+        return f"RecordingDriver({self._wrapped!r})"
+
+
+class _Replayer:
+    """ReplayArchiveの応答を返すプロキシの共通部分"""
+
+    def __init__(self, replay, target):
+        object.__setattr__(self, "_replay", replay)
+        object.__setattr__(self, "_target", target)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        replay = self._replay
+        key = _key(self._target, name)
+        if key in replay.archive.responses:
+            return replay.next(key)
+        if (self._target, name) not in replay.methods:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return replay.next(_key(self._target, name, args, kwargs))
+
+        return call
+
+
+class ReplayElement(_Replayer):
+    """ReplayDriverが返す要素"""
+
+    def __init__(self, replay, element_id):
+        super().__init__(replay, "element:" + element_id)
+        object.__setattr__(self, "id", element_id)
+
+    def __eq__(self, other):
+        return isinstance(other, ReplayElement) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"ReplayElement({self.id})"
+
+
+class ReplayDriver(_Replayer):
+    """_summary_
+    ReplayArchiveに記録した応答を返す、WebDriverの代わり。ブラウザもネットワークも使わない。
+
+    * 同じコマンド・引数の応答は記録した順に返し、使い切ったら最後の応答を返し続ける
+    * 記録に無いコマンドはReplayMiss(WebDriverException)になる
+    * 記録時点で読み込みは終わっているので、CaseはOperationごとの待機条件を待たない
+    * Util.take_screenshotのようにdriverの種類で処理を変えるものは再生できない
+    * borrow()を持つので、Scraperのdriver_poolに渡せる(借りるたびに最初から再生する)
+
+        Usage:
+            replay = ReplayDriver.load("fixtures/login.replay.gz")
+            html = Catalog.login_user(replay).exec_operation(replay)
+            scraper = ItemScraper(driver_pool=replay)
+    """
+
+    # lib.wait.wait_until_readyが参照する
+    skip_ready_wait = True
+
+    def __init__(self, archive):
+        super().__init__(self, "driver")
+        object.__setattr__(self, "archive", archive)
+        object.__setattr__(self, "methods", self._methods(archive))
+        object.__setattr__(self, "misses", 0)
+        object.__setattr__(self, "_cursors", {})
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @classmethod
+    def load(cls, path):
+        return cls(ReplayArchive.load(path))
+
+    @staticmethod
+    def _methods(archive):
+        # 記録されている(対象, メソッド名)。属性の取得と区別するために使う
+        methods = set()
+        for key in archive.responses:
+            target, name, args = json.loads(key)
+            if args is not None:
+                methods.add((target, name))
+        return methods
+
+    @property
+    def switch_to(self):
+        return _Replayer(self, "switch_to")
+
+    def next(self, key):
+        """keyの次の応答を返す。記録した例外は送出する"""
+        values = self.archive.responses.get(key)
+        if not values:
+            with self._lock:
+                self.misses += 1
+            raise ReplayMiss(f"no recorded response for {key}")
+        with self._lock:
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+        return self._decode(values[min(index, len(values) - 1)])
+
+    def _decode(self, value):
+        if isinstance(value, list):
+            return [self._decode(item) for item in value]
+        if isinstance(value, dict):
+            if "__element__" in value:
+                return ReplayElement(self, value["__element__"])
+            if "__error__" in value:
+                name, message = value["__error__"]
+                error = getattr(selenium_exceptions, name, WebDriverException)
+                raise error(message)
+            if "__blob__" in value or "__bytes__" in value:
+                return self.archive.resolve(value)
+            return {key: self._decode(item) for key, item in value.items()}
+        return value
+
+    def rewind(self):
+        """最初の応答から再生し直す"""
+        with self._lock:
+            self._cursors.clear()
+        lookup = self.__dict__.get("_element_lookup")
+        if lookup is not None:
+            lookup.invalidate()
+
+    @contextmanager
+    def borrow(self, timeout=None, lean_allow=()):
+        """DriverPool.borrowと同じ形で自分自身を貸し出す"""
+        self.rewind()
+        yield self
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def __repr__(self):
+        return f"ReplayDriver({self.archive.stats()['commands']} commands)"
@@ -1,5 +1,11 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
 import schedule
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Scheduler:
@@ -13,9 +19,10 @@ class Scheduler:
                 scraper1 = MyScraper1()
                 scraper2 = MyScraper2()
 
-                # スケジューラーのインスタンスを作成
-                scheduler1 = Scheduler(5, scraper1)
-                scheduler2 = Scheduler(10, scraper2)
+                # スケジューラーのインスタンスを作成(driverはプールから借りる)
+                driver_pool = DriverPool(is_chrome=True, is_headless=True, max_size=2)
+                scheduler1 = Scheduler(5, scraper1, driver_pool)
+                scheduler2 = Scheduler(10, scraper2, driver_pool)
 
                 # スケジューラーを別々のスレッドで開始
                 thread1 = threading.Thread(target=scheduler1.start)
@@ -30,19 +37,210 @@ class Scheduler:
     
     """
 
-    def __init__(self, interval, scraper):
+    def __init__(self, interval, scraper, driver_pool=None):
         self.interval = interval
         self.scraper = scraper
+        self.driver_pool = driver_pool
+        if driver_pool is not None:
+            # scraperはこのプールからdriverを借りる
+            self.scraper.driver_pool = driver_pool
+        # scheduleのデフォルトスケジューラーは全インスタンスで共有されるので使わない
+        self.schedule = schedule.Scheduler()
 
     def start(self):
         self.scraper.exec()
-        schedule.every(self.interval).minutes.do(self.scraper.exec)
+        self.schedule.every(self.interval).minutes.do(self.scraper.exec)
 
         while True:
-            schedule.run_pending()
+            self.schedule.run_pending()
+            if self.driver_pool is not None:
+                self.driver_pool.evict_idle()
             time.sleep(1)
             
     # def start(self):
     #     while True:
     #         self.scraper.exec()
     #         time.sleep(self.interval * 60)  # intervalは分単位なので秒単位に変換
+
+
+class ScheduledJob:
+    """AsyncSchedulerに登録されたscraperと、その実行状況"""
+
+    def __init__(self, interval, scraper, jitter):
+        self.interval = interval  # 分
+        self.scraper = scraper
+        self.jitter = jitter  # 秒
+        self.next_base = 0.0  # jitterを加える前の次回実行時刻(loop.time())
+        self.running = False
+        self.pending = False  # 実行中に次の実行時刻が来た
+        self.runs = 0
+        self.failures = 0
+        self.overlaps = 0
+        self.last_duration = None
+
+    def __repr__(self):
+        return f"ScheduledJob({self.scraper.__class__.__name__}, every {self.interval}min)"
+
+
+class AsyncScheduler:
+    """_summary_
+    1つのイベントループで複数のscraperを指定間隔で実行する。
+    Schedulerをscraperごとにスレッドで動かす代わりに使う。
+
+    * 次回実行時刻をヒープで管理し、次の実行時刻まで眠るので待機中はCPUを使わない
+    * scraper.execはブロッキングなので、max_workers個のスレッドで実行する
+    * 同じscraperは重複実行しない。実行中に次の実行時刻が来た場合、終了後すぐに実行する
+    * jitter秒以内のランダムな遅延を加え、同じ間隔のscraperが同時に動き出すのを避ける
+    * scraperの例外はログに出力し、他のscraperやそのscraperの次回実行には影響させない
+
+        Usage:
+            def main():
+                driver_pool = DriverPool(is_chrome=True, is_headless=True, max_size=2)
+                scheduler = AsyncScheduler(max_workers=2, driver_pool=driver_pool)
+                scheduler.add(5, MyScraper1(), jitter=10)
+                scheduler.add(10, MyScraper2(), jitter=10)
+                scheduler.start()
+    """
+
+    # driver_poolのidleなdriverを破棄する間隔(秒)
+    EVICT_INTERVAL = 60
+
+    def __init__(self, max_workers=4, driver_pool=None):
+        self.max_workers = max_workers
+        self.driver_pool = driver_pool
+        self.jobs = []
+        self.logger = logging.getLogger(__name__)
+        self._heap = []
+        self._counter = itertools.count()
+        self._loop = None
+        self._wakeup = None
+        self._stopped = None
+
+    def add(self, interval, scraper, jitter=0.0):
+        """scraperを登録する。実行中のスケジューラーにも別スレッドから登録できる
+
+        Args:
+            interval (int): 実行間隔(分)
+            scraper (Scraper): 実行するscraper
+            jitter (float, optional): 実行時刻に加えるランダムな遅延の最大秒数. Defaults to 0.0.
+
+        Returns:
+            ScheduledJob: 登録したジョブ
+        """
+        if self.driver_pool is not None:
+            scraper.driver_pool = self.driver_pool
+        job = ScheduledJob(interval, scraper, jitter)
+        self.jobs.append(job)
+        if self._loop is None:
+            return job
+        self._loop.call_soon_threadsafe(self._push_first_run, job)
+        return job
+
+    def start(self):
+        """stop()が呼ばれるまでブロックする"""
+        asyncio.run(self.run())
+
+    def stop(self):
+        """スケジューラーを停止する。別スレッドから呼べる"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_now)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        for job in self.jobs:
+            self._push_first_run(job)
+
+        tasks = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        evictor = None
+        if self.driver_pool is not None:
+            evictor = asyncio.create_task(self._evict_idle(executor))
+        try:
+            while not self._stopped.is_set():
+                delay = self._heap[0][0] - self._loop.time() if self._heap else None
+                if delay is None or delay > 0:
+                    await self._sleep(delay)
+                    continue
+
+                _, _, job = heapq.heappop(self._heap)
+                job.next_base += job.interval * 60
+                self._push(job)
+                if job.running:
+                    job.overlaps += 1
+                    job.pending = True
+                    continue
+                task = asyncio.create_task(self._run_job(job, executor))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if evictor is not None:
+                evictor.cancel()
+            # 実行中のscraperは中断できないので終了を待つ
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown(wait=True)
+            self._loop = None
+
+    def stats(self):
+        """scraperごとの実行状況を返却する
+
+        Returns:
+            list: ジョブごとの実行回数・失敗回数・重複回数・直近の所要時間
+        """
+        return [
+            {
+                "scraper": job.scraper.__class__.__name__,
+                "interval": job.interval,
+                "runs": job.runs,
+                "failures": job.failures,
+                "overlaps": job.overlaps,
+                "running": job.running,
+                "last_duration": job.last_duration,
+            }
+            for job in self.jobs
+        ]
+
+    async def _run_job(self, job, executor):
+        while True:
+            job.running = True
+            started = time.perf_counter()
+            try:
+                await self._loop.run_in_executor(executor, job.scraper.exec)
+            except Exception:
+                job.failures += 1
+                self.logger.exception(f"{job} failed")
+            finally:
+                job.runs += 1
+                job.last_duration = time.perf_counter() - started
+                job.running = False
+            if not job.pending or self._stopped.is_set():
+                return
+            job.pending = False
+
+    def _push_first_run(self, job):
+        job.next_base = self._loop.time()
+        self._push(job)
+
+    def _push(self, job):
+        due = job.next_base + random.uniform(0, job.jitter)
+        heapq.heappush(self._heap, (due, next(self._counter), job))
+        self._wakeup.set()
+
+    def _stop_now(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    async def _sleep(self, delay):
+        # 次の実行時刻まで眠る。ジョブの追加・停止で起こされる
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _evict_idle(self, executor):
+        while True:
+            await asyncio.sleep(self.EVICT_INTERVAL)
+            await self._loop.run_in_executor(executor, self.driver_pool.evict_idle)
@@ -1,4 +1,8 @@
 import logging
+from contextlib import contextmanager
+
+from lib.e2e_util import Util
+from lib.extractor import Extractor
 
 
 class Scraper:
@@ -11,10 +15,119 @@ class Scraper:
             
         * サイトごとに変わる処理・パラメータを継承先のクラスで定義すること
         * SchedulerクラスのメンバにこのScraperクラスが存在し、Schedulerがexecを叩く
+        * ScrapePipelineで使う場合、exec_seleniumはpage_sourceを返却すること。
+          extract/formatは別プロセスで実行されるので、driverに依存しないこと
+        * driverはborrow_driver()で借りること。driver_poolが設定されていればプールから借りる
+
+            e.g.)
+                def exec_selenium(self):
+                    with self.borrow_driver() as driver:
+                        return Catalog.login_user(driver).exec_operation(driver)
+
+        * row_selectorとfieldsを定義すれば、extractを実装しなくてもlxmlで抽出できる
+
+            e.g.)
+                class ItemScraper(MyScraper):
+                    row_selector = "//table[@id='items']//tr[td]"
+                    fields = [Field("id", "td[1]"), Field("name", "td[2]")]
+
+        * content_cache(lib.content_cache.ContentCache)を渡すと、processは前回と同じ内容の
+          ページのextract/format/outputを省略する。毎回変わるノードはvolatile_xpathsで除外する
+
+            e.g.)
+                class ItemScraper(MyScraper):
+                    volatile_xpaths = ["//span[@id='updated_at']"]
+
+                def exec(self):
+                    self.process(self.exec_selenium())
     """
 
-    def __init__(self):
+    # driver_poolが無い場合に作成するdriverの種類
+    is_chrome = True
+    is_headless = False
+
+    # 宣言的に抽出する場合のレコードのセレクタと項目(lib.extractor.Fieldのリスト)
+    row_selector = None
+    fields = None
+    css = False
+
+    # content_cacheでハッシュを取る前に取り除く、毎回内容が変わるノードのXPath
+    volatile_xpaths = ()
+
+    # driver_poolが無い場合に作成するdriverの軽量設定(lib.browser_profile.LeanProfile)
+    lean_profile = None
+    # driverがLeanProfileで起動されている場合に、このscraperだけ読み込みを許可する種類・URLパターン
+    lean_allow = ()
+
+    def __init__(self, driver_pool=None, content_cache=None):
         self.logger = logging.getLogger(__name__)
+        self.driver_pool = driver_pool
+        self.content_cache = content_cache
+
+    @property
+    def cache_namespace(self):
+        """content_cacheでハッシュとヒット率を記録する単位"""
+        return self.__class__.__name__
+
+    @contextmanager
+    def borrow_driver(self):
+        """driverを借りる。driver_poolが無い場合は作成し、使い終わったら終了する"""
+        if self.driver_pool is not None:
+            # プールは許可リストごとに、それを反映して起動したdriverを貸し出す
+            with self.driver_pool.borrow(lean_allow=self.lean_allow) as driver:
+                yield driver
+            return
+
+        lean = self.lean_profile
+        if lean is not None and self.lean_allow:
+            # 画像の許可などは起動時にしか反映できないので、許可リストを含めて起動する
+            lean = lean.allowing(self.lean_allow)
+        driver = Util.create_driver(self.is_chrome, self.is_headless, lean)
+        try:
+            yield driver
+        finally:
+            driver.quit()
+
+    def __getstate__(self):
+        # ParsePoolのワーカーに渡すとき、driver_pool(ロックやdriverを含む)は送らない
+        state = self.__dict__.copy()
+        state["driver_pool"] = None
+        state["content_cache"] = None
+        return state
+
+    def page_digest(self, html, page_key=0):
+        """前回から内容が変わっていればhtmlのハッシュ値を返す。
+        変わっていなければNone、content_cacheが無ければ空文字を返す
+
+        Args:
+            html (str): page_source
+            page_key (optional): 1回の実行で複数ページを取得する場合のページの識別子. Defaults to 0.
+        """
+        if self.content_cache is None:
+            return ""
+        digest = self.content_cache.fingerprint(html, self.volatile_xpaths)
+        if self.content_cache.is_unchanged(self.cache_namespace, page_key, digest):
+            self.logger.info(f"{self.cache_namespace}: page {page_key} is unchanged, skipped")
+            return None
+        return digest
+
+    def commit_page(self, html, digest, page_key=0):
+        """outputが終わったページをcontent_cacheに記録する"""
+        if self.content_cache is not None and digest:
+            self.content_cache.commit(self.cache_namespace, page_key, digest, html)
+
+    def process(self, html, page_key=0):
+        """htmlをextract/format/outputする。前回と同じ内容ならスキップする
+
+        Returns:
+            bool: outputした場合True
+        """
+        digest = self.page_digest(html, page_key)
+        if digest is None:
+            return False
+        self.output(self.format(self.extract(html)))
+        self.commit_page(html, digest, page_key)
+        return True
 
     def exec(self):
         raise NotImplementedError
@@ -23,7 +136,9 @@ class Scraper:
         raise NotImplementedError
 
     def extract(self, html):
-        raise NotImplementedError
+        if self.row_selector is None or self.fields is None:
+            raise NotImplementedError
+        return Extractor(self.row_selector, self.fields, self.css).extract(html)
 
     def format(self, scraped_data):
         raise NotImplementedError
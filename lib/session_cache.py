@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from cryptography.fernet import Fernet, InvalidToken
+from selenium.common.exceptions import WebDriverException
+
+
+SESSION_DIR = os.path.join(".cache", "sessions")
+# 鍵を渡さず、環境変数も無い場合に作成・使用する鍵ファイル
+SESSION_KEY_FILE = os.path.join(os.path.expanduser("~"), ".cache", "pynium", "session.key")
+SESSION_KEY_ENV = "PYNIUM_SESSION_KEY"
+
+STORAGE_SNAPSHOT_SCRIPT = """
+function dump(storage) {
+  var items = {};
+  try {
+    for (var i = 0; i < storage.length; i++) {
+      var key = storage.key(i);
+      items[key] = storage.getItem(key);
+    }
+  } catch (e) {}
+  return items;
+}
+return {origin: location.origin, local: dump(window.localStorage), session: dump(window.sessionStorage)};
+"""
+
+STORAGE_RESTORE_SCRIPT = """
+var snapshot = arguments[0];
+try {
+  for (var key in snapshot.local) window.localStorage.setItem(key, snapshot.local[key]);
+  for (var key in snapshot.session) window.sessionStorage.setItem(key, snapshot.session[key]);
+} catch (e) {}
+"""
+
+
+def _read_session_key(timeout=5.0):
+    # 他のプロセスが作成した直後は、まだ書き込まれていないことがある
+    deadline = time.monotonic() + timeout
+    while True:
+        with open(SESSION_KEY_FILE, "rb") as f:
+            key = f.read().strip()
+        if key or time.monotonic() >= deadline:
+            return key
+        time.sleep(0.05)
+
+
+def load_session_key():
+    """環境変数PYNIUM_SESSION_KEY、無ければ鍵ファイルの鍵を返す。鍵ファイルも無ければ作成する"""
+    key = os.environ.get(SESSION_KEY_ENV)
+    if key:
+        return key.encode()
+    try:
+        return _read_session_key()
+    except FileNotFoundError:
+        pass
+    key = Fernet.generate_key()
+    os.makedirs(os.path.dirname(SESSION_KEY_FILE), exist_ok=True)
+    try:
+        # 所有者だけが読めるように作成する
+        fd = os.open(SESSION_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 同時に起動した他のプロセスが先に作成した。その鍵を使う
+        return _read_session_key()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class SessionCache:
+    """_summary_
+    ログイン後のcookie・localStorage・sessionStorageを保存し、次回はログインを省略する。
+
+    * サイトとアカウントごとに、Fernet(cryptography)で暗号化してファイルに保存する
+    * ttl秒を過ぎたスナップショットは使わない
+    * restoreでdriverに復元し、probeでログイン状態を確認する。失敗したらログインし直して保存する
+
+        Usage:
+            sessions = SessionCache(ttl=6 * 60 * 60)
+            with pool.borrow() as driver:
+                Catalog.ensure_logged_in(driver, sessions)
+                ...
+            print(sessions.stats())
+    """
+
+    def __init__(self, directory=SESSION_DIR, key=None, ttl=3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.fernet = Fernet(key or load_session_key())
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self._lock = threading.Lock()
+
+    def _path(self, site, account):
+        name = hashlib.sha256(f"{site}\n{account}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".session")
+
+    def snapshot(self, driver, site, account):
+        """driverの現在のページのオリジンのcookieとstorageを保存する。ログイン直後に呼ぶこと"""
+        storage = driver.execute_script(STORAGE_SNAPSHOT_SCRIPT)
+        now = time.time()
+        state = {
+            "site": site,
+            "created": now,
+            "expires": now + self.ttl,
+            "origin": storage["origin"],
+            "cookies": driver.get_cookies(),
+            "local": storage["local"],
+            "session": storage["session"],
+        }
+        token = self.fernet.encrypt(json.dumps(state).encode("utf-8"))
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(site, account)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(token)
+        os.replace(tmp_path, path)
+
+    def load(self, site, account):
+        """有効なスナップショットを返す。無い・期限切れ・復号できない場合はNone"""
+        path = self._path(site, account)
+        try:
+            with open(path, "rb") as f:
+                token = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            state = json.loads(self.fernet.decrypt(token))
+        except (InvalidToken, ValueError):
+            self.logger.warning(f"discard unreadable session snapshot for {site}")
+            self.invalidate(site, account)
+            return None
+        if state["expires"] <= time.time():
+            self.invalidate(site, account)
+            return None
+        return state
+
+    def restore(self, driver, site, account):
+        """スナップショットをdriverに復元する。オリジンのページに遷移する
+
+        Returns:
+            bool: 復元した場合True。スナップショットが無ければFalse
+        """
+        state = self.load(site, account)
+        if state is None:
+            return False
+        now = time.time()
+        cookies = [c for c in state["cookies"] if c.get("expiry") is None or c["expiry"] > now]
+        driver.get(state["origin"] + "/")
+        for cookie in cookies:
+            try:
+                driver.add_cookie(cookie)
+            except WebDriverException:
+                self.logger.debug(f"failed to restore cookie {cookie.get('name')}")
+        driver.execute_script(STORAGE_RESTORE_SCRIPT, state)
+        return True
+
+    def invalidate(self, site, account):
+        try:
+            os.remove(self._path(site, account))
+        except FileNotFoundError:
+            pass
+
+    def ensure(self, driver, site, account, login, probe):
+        """保存したセッションを復元し、probeで確認する。使えなければloginを実行して保存する
+
+        Args:
+            driver (_type_): driver
+            site (str): サイトの識別子(URL等)
+            account (str): アカウントの識別子(ログインID等)
+            login (callable): driverを受け取り、ログインを行う関数
+            probe (callable): driverを受け取り、ログイン済みならTrueを返す関数
+
+        Returns:
+            bool: 保存したセッションを使った場合True、ログインした場合False
+        """
+        if self.restore(driver, site, account):
+            if probe(driver):
+                with self._lock:
+                    self.hits += 1
+                self.logger.debug(f"restored session for {site}")
+                return True
+            with self._lock:
+                self.invalid += 1
+            self.logger.info(f"restored session for {site} is no longer valid, logging in")
+            self.invalidate(site, account)
+
+        with self._lock:
+            self.misses += 1
+        login(driver)
+        if not probe(driver):
+            raise RuntimeError(f"login to {site} failed")
+        self.snapshot(driver, site, account)
+        return False
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "invalid": self.invalid}
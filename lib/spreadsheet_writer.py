@@ -1,28 +1,98 @@
+import hashlib
+import json
 import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import gspread
+from gspread.utils import DateTimeOption, ValueRenderOption
+import httplib2
 from oauth2client.service_account import ServiceAccountCredentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from lib.ttl_cache import TTLCache
+
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# upsertで書き込んだ行のハッシュを保存するディレクトリ
+ROW_HASH_DIR = os.path.join('.cache', 'sheet_hashes')
+
+
+class DeleteResult:
+    """
+    一括削除の結果。
+
+    :ivar deleted: 削除できたファイルIDのリスト
+    :ivar failed: 削除できなかったファイルIDとエラーのdict
+    """
+
+    def __init__(self):
+        self.deleted = []
+        self.failed = {}
+
+    def merge(self, other):
+        self.deleted.extend(other.deleted)
+        self.failed.update(other.failed)
+
+    def __repr__(self):
+        return f'DeleteResult(deleted={len(self.deleted)}, failed={len(self.failed)})'
+
 
 class SpreadsheetWriter:
     """
     Googleスプレッドシートに書き込むためのクラス。
     """
 
-    def __init__(self, json_keyfile_name, spreadsheet_name, folder_path=None):
+    # 1回のAPI呼び出しで書き込む行数
+    CHUNK_SIZE = 500
+    # 429/quotaエラー時のリトライ回数と待機時間(秒)。待機時間は指数的に増やす
+    MAX_RETRIES = 6
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 64.0
+    # フォルダID・ファイルIDのキャッシュの有効期限(秒)
+    CACHE_TTL = 600
+    # files().listの1ページの件数(Drive APIの上限は1000)
+    PAGE_SIZE = 1000
+    # 1つのバッチリクエストにまとめる削除件数(Drive APIの上限は100)
+    BATCH_SIZE = 100
+    # 同時に実行するバッチリクエスト数
+    MAX_IN_FLIGHT = 4
+
+    # 同じ認証情報のインスタンス間で共有するDriveサービスとIDキャッシュ
+    _drive_services = {}
+    _drive_lock = threading.Lock()
+    _thread_local = threading.local()
+    _folder_ids = TTLCache(ttl=CACHE_TTL)  # (認証情報, フォルダパス) -> フォルダID
+    _file_ids = TTLCache(ttl=CACHE_TTL)  # (認証情報, 名前, mimeType) -> [ファイルID]
+    # キャッシュにより省略できたDrive APIの呼び出し回数
+    saved_api_calls = 0
+
+    def __init__(self, json_keyfile_name, spreadsheet_name, folder_path=None, client=None,
+                 drive_service=None):
         """
         コンストラクタ。
 
         :param json_keyfile_name: サービスアカウントのJSONキーファイル名
         :param spreadsheet_name: スプレッドシート名
         :param folder_path: スプレッドシートを作成するフォルダのパス
+        :param client: gspreadのクライアント。省略時はjson_keyfile_nameで認証する(テスト用にfakeを渡せる)
+        :param drive_service: Drive APIのサービス。省略時は同じ認証情報のインスタンス間で共有するものを使う
         """
         scope = ['https://spreadsheets.google.com/feeds',
                  'https://www.googleapis.com/auth/drive']
-        self.creds = ServiceAccountCredentials.from_json_keyfile_name(
-            json_keyfile_name, scope)
-        self.client = gspread.authorize(self.creds)
+        if client is None:
+            self.creds = ServiceAccountCredentials.from_json_keyfile_name(
+                json_keyfile_name, scope)
+            client = gspread.authorize(self.creds)
+        else:
+            self.creds = None
+        self.client = client
+        # Driveサービス・IDキャッシュを共有する単位
+        self.creds_key = os.path.abspath(json_keyfile_name) if json_keyfile_name else id(client)
+        self._drive_service = drive_service
 
         # スプレッドシートが新規作成されたかどうかを示すフラグ
         self.is_new = False
@@ -33,37 +103,94 @@ class SpreadsheetWriter:
         except gspread.SpreadsheetNotFound:
             self.sheet = self.client.create(spreadsheet_name).sheet1
             self.is_new = True
+            self._file_ids.delete((self.creds_key, spreadsheet_name, SPREADSHEET_MIME_TYPE))
 
         if folder_path:
             self.move_to_folder(spreadsheet_name, folder_path)
 
-    def write(self, obj_list):
+    def write(self, obj_list, chunk_size=None):
         """
         スプレッドシートにデータを書き込む。
+        ヘッダー行とレコードをchunk_size行ずつまとめて追記する。
 
         :param obj_list: 書き込むデータのリスト
+        :param chunk_size: 1回のAPI呼び出しで書き込む行数。省略時はCHUNK_SIZE
         """
-        # カラム名としてメンバ変数名を出力
-        self.sheet.append_row(list(obj_list[0].keys()))
-        # 各オブジェクトの値を1行のレコードとして出力
-        for obj in obj_list:
-            self.sheet.append_row(list(obj.values()))
+        self.write_stream(obj_list, chunk_size)
+
+    def write_stream(self, records, chunk_size=None):
+        """
+        dictのイテレータを受け取り、chunk_size行ずつスプレッドシートに追記する。
+        全件をメモリに載せないので、大量のレコードの書き込みに使う。
+
+        :param records: 書き込むdictのイテラブル。カラムは最初のdictのキー順
+        :param chunk_size: 1回のAPI呼び出しで書き込む行数。省略時はCHUNK_SIZE
+        :return: 書き込んだレコード数
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        self._forget_row_hashes()
+        header = None
+        chunk = []
+        count = 0
+        for obj in records:
+            if header is None:
+                # カラム名としてメンバ変数名を出力
+                header = list(obj.keys())
+                chunk.append(header)
+            chunk.append([obj.get(key, '') for key in header])
+            count += 1
+            if len(chunk) >= chunk_size:
+                self._append_rows(chunk)
+                chunk = []
+        if chunk:
+            self._append_rows(chunk)
+        return count
+
+    def _append_rows(self, rows):
+        self.call_with_backoff(self.sheet.append_rows, rows)
+
+    def call_with_backoff(self, func, *args, **kwargs):
+        """
+        429/quota超過/5xxエラーの場合に、待機時間を指数的に増やしながらfuncをリトライする。
+
+        :param func: 呼び出すAPI
+        :return: funcの戻り値
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except (gspread.exceptions.APIError, HttpError) as error:
+                if attempt == self.MAX_RETRIES or not self._is_retryable(error):
+                    raise
+                wait = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt)
+                wait += random.uniform(0, self.BACKOFF_BASE)
+                self.logger.debug(f"APIの制限に達したため{wait:.1f}秒後にリトライします: {error}")
+                time.sleep(wait)
+
+    @staticmethod
+    def _is_retryable(error):
+        if isinstance(error, HttpError):
+            status = getattr(error.resp, 'status', None)
+        else:
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            status = None
+        if status == 429 or (status is not None and status >= 500):
+            return True
+        # 403 rateLimitExceeded/userRateLimitExceeded等もリトライする
+        message = str(error).replace(' ', '').replace('_', '').lower()
+        return 'ratelimitexceeded' in message or 'quotaexceeded' in message
 
     def delete(self, spreadsheet_name):
         """
         スプレッドシートを削除する。
 
         :param spreadsheet_name: 削除するスプレッドシート名
+        :return: DeleteResult
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
-        response = drive_service.files().list(q=f"name='{spreadsheet_name}' and mimeType='application/vnd.google-apps.spreadsheet'",
-                                              spaces='drive',
-                                              fields='nextPageToken, files(id, name)').execute()
-        for file in response.get('files', []):
-            try:
-                drive_service.files().delete(fileId=file.get('id')).execute()
-            except HttpError as error:
-                print(f'An error occurred: {error}')
+        return self._delete_by_name(spreadsheet_name, SPREADSHEET_MIME_TYPE)
 
     def clear_and_write(self, obj_list):
         """
@@ -81,47 +208,379 @@ class SpreadsheetWriter:
         writer.clear_and_write(data)
         """
         # スプレッドシートの内容をクリア
+        self._forget_row_hashes()
         self.sheet.clear()
         # データを書き込む
         self.write(obj_list)
 
+    def upsert(self, obj_list, key, force=False):
+        """
+        キーで行を突き合わせ、変更のあった行だけをスプレッドシートに反映する。
+        clear_and_writeと違い、シートが空になる瞬間が無く、変更の無い行は書き込まない。
+
+        * シートを1回読み込み、キーごとに追加・更新・削除を計算する
+        * 更新と、削除する行の位置を再利用する追加は1回のvalues.batchUpdateで書き込む
+        * 再利用しきれなかった追加行はappend_rowsで末尾に追記する(グリッドはAPIが拡張する)
+        * 残った削除行は1回のspreadsheets.batchUpdateでまとめて削除する
+        * API呼び出しは読み込み1回と書き込み最大3回(batch_update・append_rows・削除)
+        * 書き込んだ行のハッシュをROW_HASH_DIRに保存し、前回と同じ内容ならAPIを一切呼ばない。
+          シートを手で編集した場合などはforce=Trueで必ずシートと突き合わせる
+
+        :param obj_list: 書き込むデータのリスト。空の場合は何もしない
+        :param key: 行を識別するカラム名
+        :param force: Trueなら保存済みのハッシュを使わずにシートと突き合わせる
+        :return: 追加・更新・削除した行数のdict
+
+        使用例:
+        writer = SpreadsheetWriter('client_secret.json', 'your_spreadsheet_name')
+        writer.upsert(data, key='name')
+        """
+        result = {'inserted': 0, 'updated': 0, 'deleted': 0}
+        if not obj_list:
+            return result
+        header = list(obj_list[0].keys())
+        if key not in header:
+            raise ValueError(f"key '{key}' is not in columns: {header}")
+        # 値はそのまま書き込み、比較は_cellで揃えた文字列で行う
+        new_rows = {}
+        for obj in obj_list:
+            new_rows[self._cell(obj[key])] = [obj.get(column, '') for column in header]
+        row_hashes = {
+            'key': key,
+            'header': header,
+            'rows': {k: self._row_hash(row) for k, row in new_rows.items()},
+        }
+        if not force and self._load_row_hashes() == row_hashes:
+            self.logger.debug('変更が無いため書き込みをスキップしました。')
+            return result
+
+        # 表示形式に左右されないように、書式を適用しない値で読み込んで_cellで揃えて比較する
+        values = self.call_with_backoff(
+            self.sheet.get_all_values,
+            value_render_option=ValueRenderOption.unformatted,
+            date_time_render_option=DateTimeOption.formatted_string,
+        )
+        values = [[self._cell(value) for value in row] for row in values]
+        current_header = list(values[0]) if values else []
+        while current_header and current_header[-1] == '':
+            current_header.pop()
+        if current_header != header:
+            # 空のシートやカラム構成が変わった場合は全体を書き直す
+            self.clear_and_write(obj_list)
+            self._save_row_hashes(row_hashes)
+            result['inserted'] = len(new_rows)
+            return result
+
+        key_index = header.index(key)
+        existing = {}
+        free_rows = []  # 削除対象の行番号
+        for row_number, row in enumerate(values[1:], start=2):
+            row = (row + [''] * len(header))[:len(header)]
+            row_key = row[key_index]
+            if row_key in new_rows and row_key not in existing:
+                existing[row_key] = (row_number, row)
+            else:
+                free_rows.append(row_number)
+
+        data = []
+        inserts = []
+        for row_key, row in new_rows.items():
+            if row_key not in existing:
+                inserts.append(row)
+            elif existing[row_key][1] != [self._cell(value) for value in row]:
+                data.append({'range': f'A{existing[row_key][0]}', 'values': [row]})
+                result['updated'] += 1
+        result['inserted'] = len(inserts)
+
+        # 追加行は削除予定の行を上書きして再利用する
+        free_rows.sort()
+        reused = min(len(free_rows), len(inserts))
+        for row_number, row in zip(free_rows[:reused], inserts[:reused]):
+            data.append({'range': f'A{row_number}', 'values': [row]})
+        free_rows = free_rows[reused:]
+        appends = inserts[reused:]
+
+        if data:
+            self.call_with_backoff(self.sheet.batch_update, data)
+        if appends:
+            # worksheet.row_countはキャッシュされた値で、行の削除や他のクライアントの編集で
+            # 実際のグリッドと食い違う。固定の範囲ではなくappendで追記し、グリッドの拡張はAPIに任せる
+            self._append_rows(appends)
+        if free_rows:
+            self._delete_row_numbers(free_rows)
+        result['deleted'] = len(free_rows)
+        self._save_row_hashes(row_hashes)
+        return result
+
+    @staticmethod
+    def _cell(value):
+        # 書き込む値と、UNFORMATTED_VALUEで読み込んだ値を同じ文字列に揃える。
+        # 数値はJSONの数値として返るので、3.0は3として読み込まれる
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'TRUE' if value else 'FALSE'
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    def _delete_row_numbers(self, row_numbers):
+        """
+        行番号(1始まり)の行を1回のbatchUpdateで削除する。
+        連続する行はまとめ、行番号がずれないように下の行から削除する。
+        """
+        ranges = []
+        for row_number in sorted(set(row_numbers), reverse=True):
+            if ranges and ranges[-1][0] == row_number + 1:
+                ranges[-1][0] = row_number
+            else:
+                ranges.append([row_number, row_number + 1])
+        requests = [{
+            'deleteDimension': {
+                'range': {
+                    'sheetId': self.sheet.id,
+                    'dimension': 'ROWS',
+                    'startIndex': start - 1,
+                    'endIndex': end - 1,
+                }
+            }
+        } for start, end in ranges]
+        self.call_with_backoff(self.sheet.spreadsheet.batch_update, {'requests': requests})
+
+    @staticmethod
+    def _row_hash(row):
+        return hashlib.sha1(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+    def _row_hash_path(self):
+        return os.path.join(ROW_HASH_DIR, f'{self.sheet.spreadsheet.id}_{self.sheet.id}.json')
+
+    def _load_row_hashes(self):
+        try:
+            with open(self._row_hash_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_row_hashes(self, row_hashes):
+        os.makedirs(ROW_HASH_DIR, exist_ok=True)
+        with open(self._row_hash_path(), 'w', encoding='utf-8') as f:
+            json.dump(row_hashes, f, ensure_ascii=False)
+
+    def _forget_row_hashes(self):
+        # upsert以外でシートを変更した場合、次回のupsertは必ずシートと突き合わせる
+        try:
+            os.remove(self._row_hash_path())
+        except OSError:
+            pass
+
+    @property
+    def drive_service(self):
+        """
+        Drive APIのサービス。discoveryドキュメントの解析は重いので、
+        同じ認証情報のインスタンス間で1つを共有し、初回アクセス時に作成する。
+        """
+        if self._drive_service is None:
+            with SpreadsheetWriter._drive_lock:
+                service = SpreadsheetWriter._drive_services.get(self.creds_key)
+                if service is None:
+                    service = build('drive', 'v3', credentials=self.creds, cache_discovery=False)
+                    SpreadsheetWriter._drive_services[self.creds_key] = service
+            self._drive_service = service
+        return self._drive_service
+
+    def _execute(self, request):
+        """
+        Drive APIのリクエストを実行する。
+        httplib2.Httpはスレッドセーフではないので、スレッドごとの認証済みHttpを使う。
+        """
+        http = self._thread_http()
+        if http is None:
+            return self.call_with_backoff(request.execute)
+        return self.call_with_backoff(request.execute, http=http)
+
+    def _thread_http(self):
+        if self.creds is None:
+            return None
+        https = getattr(SpreadsheetWriter._thread_local, 'https', None)
+        if https is None:
+            https = SpreadsheetWriter._thread_local.https = {}
+        http = https.get(self.creds_key)
+        if http is None:
+            http = https[self.creds_key] = self.creds.authorize(httplib2.Http())
+        return http
+
+    def _list_files(self, q):
+        """
+        qに一致するファイルを、nextPageTokenをたどって全ページ分返す。
+        """
+        page_token = None
+        while True:
+            response = self._execute(self.drive_service.files().list(
+                q=q,
+                spaces='drive',
+                pageSize=self.PAGE_SIZE,
+                pageToken=page_token,
+                fields='nextPageToken, files(id, name)'))
+            yield from response.get('files', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    def delete_files(self, file_ids, max_in_flight=None):
+        """
+        ファイルをBATCH_SIZE件ずつのバッチリクエストで削除する。
+        バッチは最大max_in_flight個を並行して送信し、429等で失敗したファイルは待機してから再送する。
+
+        :param file_ids: 削除するファイルIDのイテラブル
+        :param max_in_flight: 同時に実行するバッチリクエスト数。省略時はMAX_IN_FLIGHT
+        :return: DeleteResult
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        batches = [file_ids[i:i + self.BATCH_SIZE] for i in range(0, len(file_ids), self.BATCH_SIZE)]
+        result = DeleteResult()
+        if not batches:
+            return result
+        with ThreadPoolExecutor(max_workers=min(max_in_flight or self.MAX_IN_FLIGHT, len(batches))) as executor:
+            for batch_result in executor.map(self._delete_batch, batches):
+                result.merge(batch_result)
+        for file_id, error in result.failed.items():
+            print(f'An error occurred: {error}')
+        return result
+
+    def _delete_batch(self, file_ids):
+        result = DeleteResult()
+        for attempt in range(self.MAX_RETRIES + 1):
+            retry = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    result.deleted.append(request_id)
+                elif attempt < self.MAX_RETRIES and self._is_retryable(exception):
+                    retry.append(request_id)
+                else:
+                    result.failed[request_id] = exception
+
+            batch = self.drive_service.new_batch_http_request(callback=callback)
+            for file_id in file_ids:
+                batch.add(self.drive_service.files().delete(fileId=file_id), request_id=file_id)
+            http = self._thread_http()
+            try:
+                if http is None:
+                    self.call_with_backoff(batch.execute)
+                else:
+                    self.call_with_backoff(batch.execute, http=http)
+            except HttpError as error:
+                # バッチ自体が失敗した場合は、結果の出ていないファイルを全て失敗とする
+                for file_id in file_ids:
+                    if file_id not in result.deleted and file_id not in retry:
+                        result.failed[file_id] = error
+                return result
+            if not retry:
+                return result
+            file_ids = retry
+            wait = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt)
+            time.sleep(wait + random.uniform(0, self.BACKOFF_BASE))
+        return result
+
+    @classmethod
+    def _count_saved(cls, count):
+        with cls._drive_lock:
+            cls.saved_api_calls += count
+
+    @classmethod
+    def cache_stats(cls):
+        """
+        Drive APIのキャッシュの統計情報を返す。
+
+        :return: 省略できたAPI呼び出し回数と、キャッシュごとのヒット数・ミス数
+        """
+        return {
+            'saved_api_calls': cls.saved_api_calls,
+            'folder_id_hits': cls._folder_ids.hits,
+            'folder_id_misses': cls._folder_ids.misses,
+            'file_id_hits': cls._file_ids.hits,
+            'file_id_misses': cls._file_ids.misses,
+        }
+
+    @staticmethod
+    def _quote(value):
+        return value.replace('\\', '\\\\').replace("'", "\\'")
+
+    def _find_file_ids(self, name, mime_type):
+        """
+        名前とmimeTypeが一致するファイルのIDを返す。結果はCACHE_TTL秒キャッシュする。
+        """
+        key = (self.creds_key, name, mime_type)
+        file_ids = self._file_ids.get(key)
+        if file_ids is not None:
+            self._count_saved(1)
+            return file_ids
+        file_ids = [file.get('id') for file in self._list_files(
+            f"name='{self._quote(name)}' and mimeType='{mime_type}'")]
+        # 後から作成される可能性があるので、見つからなかった結果はキャッシュしない
+        if file_ids:
+            self._file_ids.set(key, file_ids)
+        return file_ids
+
+    def _delete_by_name(self, name, mime_type):
+        result = self.delete_files(self._find_file_ids(name, mime_type))
+        self._file_ids.delete((self.creds_key, name, mime_type))
+        if mime_type == FOLDER_MIME_TYPE:
+            self._forget_folders()
+        return result
+
+    def _forget_folders(self):
+        # フォルダが削除されるとその配下のパスも無効になるので、この認証情報のフォルダIDを全て破棄する
+        self._folder_ids.delete_if(lambda key: key[0] == self.creds_key)
+
     def move_to_folder(self, spreadsheet_name, folder_path):
-        drive_service = build('drive', 'v3', credentials=self.creds)
-        response = drive_service.files().list(q=f"name='{spreadsheet_name}' and mimeType='application/vnd.google-apps.spreadsheet'",
-                                              spaces='drive',
-                                              fields='nextPageToken, files(id, name)').execute()
-        for file in response.get('files', []):
-            file_id = file.get('id')
+        folder_id = None
+        for file_id in self._find_file_ids(spreadsheet_name, SPREADSHEET_MIME_TYPE):
             # Get the folder ID
-            folder_id = self.get_folder_id(folder_path)
+            if folder_id is None:
+                folder_id = self.get_folder_id(folder_path)
             # Move the file to the folder
-            file = drive_service.files().get(fileId=file_id,
-                                             fields='parents').execute()
+            file = self._execute(self.drive_service.files().get(fileId=file_id,
+                                                                 fields='parents'))
             previous_parents = ",".join(file.get('parents'))
-            file = drive_service.files().update(fileId=file_id,
-                                                addParents=folder_id,
-                                                removeParents=previous_parents,
-                                                fields='id, parents').execute()
+            self._execute(self.drive_service.files().update(fileId=file_id,
+                                                            addParents=folder_id,
+                                                            removeParents=previous_parents,
+                                                            fields='id, parents'))
 
     def get_folder_id(self, folder_path):
-        drive_service = build('drive', 'v3', credentials=self.creds)
+        """
+        フォルダパスのIDを返す。存在しないフォルダは作成する。
+        途中のパスも含めてIDをCACHE_TTL秒キャッシュするので、同じパスの2回目以降はAPIを呼ばない。
+
+        :param folder_path: '/FolderA/FolderB'形式のフォルダパス
+        :return: フォルダID
+        """
         folders = folder_path.strip("/").split("/")
         folder_id = 'root'
-        for folder in folders:
-            response = drive_service.files().list(q=f"name='{folder}' and mimeType='application/vnd.google-apps.folder' and '{folder_id}' in parents",
-                                                  spaces='drive',
-                                                  fields='nextPageToken, files(id, name)').execute()
+        for depth, folder in enumerate(folders, start=1):
+            key = (self.creds_key, "/".join(folders[:depth]))
+            cached_id = self._folder_ids.get(key)
+            if cached_id is not None:
+                self._count_saved(1)
+                folder_id = cached_id
+                continue
+            response = self._execute(self.drive_service.files().list(
+                q=f"name='{self._quote(folder)}' and mimeType='{FOLDER_MIME_TYPE}' and '{folder_id}' in parents",
+                spaces='drive',
+                fields='nextPageToken, files(id, name)'))
             if response.get('files'):
                 folder_id = response.get('files')[0].get('id')
             else:
                 file_metadata = {
                     'name': folder,
-                    'mimeType': 'application/vnd.google-apps.folder',
+                    'mimeType': FOLDER_MIME_TYPE,
                     'parents': [folder_id]
                 }
-                file = drive_service.files().create(body=file_metadata,
-                                                    fields='id').execute()
+                file = self._execute(self.drive_service.files().create(body=file_metadata,
+                                                                       fields='id'))
                 folder_id = file.get('id')
+            self._folder_ids.set(key, folder_id)
         return folder_id
 
     def share_with_user(self, email_address):
@@ -130,7 +589,6 @@ class SpreadsheetWriter:
 
         :param email_address: 共有するユーザーのメールアドレス
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
         file_id = self.sheet.spreadsheet.id  # スプレッドシートのIDを取得
         def_permission = {
             'type': 'user',
@@ -138,10 +596,10 @@ class SpreadsheetWriter:
             'emailAddress': email_address
         }
         try:
-            drive_service.permissions().create(
+            self._execute(self.drive_service.permissions().create(
                 fileId=file_id,
                 body=def_permission
-            ).execute()
+            ))
             print(f'Successfully shared the spreadsheet with {email_address}')
         except HttpError as error:
             print(f'An error occurred: {error}')
@@ -152,17 +610,16 @@ class SpreadsheetWriter:
 
         :return: スプレッドシートのURL
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
         file_id = self.sheet.spreadsheet.id  # スプレッドシートのIDを取得
         def_permission = {
             'type': 'anyone',
             'role': 'writer',  # 'reader', 'writer', 'commenter'から選択
         }
         try:
-            drive_service.permissions().create(
+            self._execute(self.drive_service.permissions().create(
                 fileId=file_id,
                 body=def_permission
-            ).execute()
+            ))
             print(f'Successfully shared the spreadsheet with anyone who has the link.')
             return f'https://docs.google.com/spreadsheets/d/{file_id}'
         except HttpError as error:
@@ -173,87 +630,86 @@ class SpreadsheetWriter:
         スプレッドシートを削除する。
 
         :param spreadsheet_name: 削除するスプレッドシート名
+        :return: DeleteResult
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
-        response = drive_service.files().list(q=f"name='{spreadsheet_name}' and mimeType='application/vnd.google-apps.spreadsheet'",
-                                              spaces='drive',
-                                              fields='nextPageToken, files(id, name)').execute()
-        for file in response.get('files', []):
-            try:
-                drive_service.files().delete(fileId=file.get('id')).execute()
-            except HttpError as error:
-                print(f'An error occurred: {error}')
+        return self._delete_by_name(spreadsheet_name, SPREADSHEET_MIME_TYPE)
 
     def delete_folder(self, folder_name):
         """
         フォルダを削除する。
 
         :param folder_name: 削除するフォルダ名
+        :return: DeleteResult
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
-        response = drive_service.files().list(q=f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder'",
-                                              spaces='drive',
-                                              fields='nextPageToken, files(id, name)').execute()
-        for file in response.get('files', []):
-            try:
-                drive_service.files().delete(fileId=file.get('id')).execute()
-            except HttpError as error:
-                print(f'An error occurred: {error}')
+        return self._delete_by_name(folder_name, FOLDER_MIME_TYPE)
 
     def delete_all_spreadsheets(self):
         """
         すべてのスプレッドシートを削除する。
+
+        :return: DeleteResult
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
-        response = drive_service.files().list(q="mimeType='application/vnd.google-apps.spreadsheet'",
-                                              spaces='drive',
-                                              fields='nextPageToken, files(id, name)').execute()
-        for file in response.get('files', []):
-            try:
-                drive_service.files().delete(fileId=file.get('id')).execute()
-            except HttpError as error:
-                print(f'An error occurred: {error}')
+        return self._delete_all(SPREADSHEET_MIME_TYPE)
 
     def delete_all_folders(self):
         """
         すべてのフォルダを削除する。
+
+        :return: DeleteResult
         """
-        drive_service = build('drive', 'v3', credentials=self.creds)
-        response = drive_service.files().list(q="mimeType='application/vnd.google-apps.folder'",
-                                              spaces='drive',
-                                              fields='nextPageToken, files(id, name)').execute()
-        for file in response.get('files', []):
-            try:
-                drive_service.files().delete(fileId=file.get('id')).execute()
-            except HttpError as error:
-                print(f'An error occurred: {error}')
+        return self._delete_all(FOLDER_MIME_TYPE)
+
+    def _delete_all(self, mime_type):
+        # 削除しながらページをたどると取りこぼすので、先に全件のIDを集める
+        file_ids = [file.get('id') for file in self._list_files(f"mimeType='{mime_type}'")]
+        result = self.delete_files(file_ids)
+        self._file_ids.delete_if(lambda key: key[0] == self.creds_key and key[2] == mime_type)
+        if mime_type == FOLDER_MIME_TYPE:
+            self._forget_folders()
+        return result
 
     def delete_rows_by_column_value(self, column_name, value):
         """
         指定したカラムの値が指定した値に一致する行をスプレッドシートから削除します。
+        シートの読み込み1回・削除のbatchUpdate1回で、一致した行だけを削除します。
 
         :param column_name: 値をチェックするカラムの名前
-        :param value: 削除する行のカラムの値
+        :param value: 削除する行のカラムの値。値のset/list、またはセルの値(文字列)を受け取り
+                      削除するならTrueを返す関数も指定できる
+        :return: 削除した行数
+
+        使用例:
+        writer.delete_rows_by_column_value('name', 'Alice')
+        writer.delete_rows_by_column_value('name', {'Alice', 'Bob'})
+        writer.delete_rows_by_column_value('age', lambda age: int(age) >= 30)
         """
-        # スプレッドシートのヘッダー行を取得
-        header = self.sheet.row_values(1)
+        if callable(value):
+            matches = value
+        elif isinstance(value, (set, frozenset, list, tuple)):
+            values = {str(v) for v in value}
+            matches = values.__contains__
+        else:
+            matches = str(value).__eq__
+
+        # スプレッドシートの全ての行を取得(1行目はヘッダー)
+        rows = self.call_with_backoff(self.sheet.get_all_values)
+        header = rows[0] if rows else []
         # 指定したカラム名のインデックスを取得
         if column_name in header:
             column_index = header.index(column_name)
         else:
             self.logger.debug(f"カラム'{column_name}'が見つかりませんでした。")
-            return
-
-        # スプレッドシートの全ての行を取得
-        rows = self.sheet.get_all_values()
+            return 0
 
         # 指定したカラムの値が指定した値に一致する行を特定
-        rows_to_delete = [i for i, row in enumerate(rows, start=1) if row[column_index] == value]
+        rows_to_delete = [i for i, row in enumerate(rows[1:], start=2)
+                          if matches(row[column_index] if column_index < len(row) else '')]
 
-        # 一致する行を削除
+        # 一致する行だけを削除
         if rows_to_delete:
-            self.sheet.delete_rows(min(rows_to_delete), max(rows_to_delete))
-
+            self._forget_row_hashes()
+            self._delete_row_numbers(rows_to_delete)
+        return len(rows_to_delete)
 
 if __name__ == "__main__":
     writer = SpreadsheetWriter('client_secret.json', 'your_sheet_name')
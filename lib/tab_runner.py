@@ -0,0 +1,351 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.remote.webelement import WebElement
+
+
+# 遷移前のドキュメントに目印を付けてから遷移する。目印が消えたら新しいドキュメントに切り替わっている
+NAVIGATE_SCRIPT = "window.__pyniumTabNav = arguments[1]; window.location.href = arguments[0];"
+COMMITTED_SCRIPT = "return window.__pyniumTabNav !== arguments[0] && document.readyState;"
+
+
+def _unwrap(value):
+    # seleniumに渡す引数のTabElementを元のWebElementに戻す
+    if isinstance(value, TabElement):
+        return value.wrapped_element
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _unwrap(item) for key, item in value.items()}
+    return value
+
+
+class _TabProxy:
+    """属性へのアクセス・メソッド呼び出しを、タブを切り替えてからロック内で行うプロキシの共通部分"""
+
+    def __init__(self, tab, target):
+        object.__setattr__(self, "_tab", tab)
+        object.__setattr__(self, "_target", target)
+
+    def __getattr__(self, name):
+        tab = self._tab
+        with tab.runner.lock:
+            tab.runner.activate(tab)
+            value = getattr(self._target, name)
+        if callable(value):
+            return tab.wrap_call(value)
+        return tab.wrap(value)
+
+
+class TabElement(_TabProxy):
+    """TabDriverが返す要素。操作する前に要素のあるタブに切り替える"""
+
+    @property
+    def wrapped_element(self):
+        return self._target
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"TabElement({self._target!r})"
+
+
+class TabSwitchTo(_TabProxy):
+    """TabDriver.switch_to。タブごとにフレームの位置を記録し、タブを切り替えたときに復元する"""
+
+    def frame(self, frame_reference):
+        tab = self._tab
+        frame_reference = _unwrap(frame_reference)
+        with tab.runner.lock:
+            tab.runner.activate(tab)
+            tab.runner.driver.switch_to.frame(frame_reference)
+            tab.frames.append(frame_reference)
+
+    def parent_frame(self):
+        tab = self._tab
+        with tab.runner.lock:
+            tab.runner.activate(tab)
+            tab.runner.driver.switch_to.parent_frame()
+            if tab.frames:
+                tab.frames.pop()
+
+    def default_content(self):
+        tab = self._tab
+        with tab.runner.lock:
+            tab.runner.activate(tab)
+            tab.runner.driver.switch_to.default_content()
+            tab.frames.clear()
+
+    def window(self, window_name):
+        raise ValueError("TabDriver is bound to its own tab and cannot switch windows")
+
+    def new_window(self, type_hint=None):
+        raise ValueError("TabDriver is bound to its own tab and cannot open windows")
+
+
+class TabDriver(_TabProxy):
+    """_summary_
+    TabRunnerの1タブ分のdriver。WebDriverと同じように使えるので、OperationやCaseをそのまま実行できる。
+
+    * コマンドごとにロックを取り、このタブ(とフレーム)に切り替えてから実行する
+    * getはページ遷移の開始を確認した時点で返り、読み込みの完了はCaseの待機条件に任せる。
+      その間ロックを持たないので、他のタブの操作・読み込みと重なる
+    * Util.take_screenshot等の型判定用に、元のdriverをwrapped_driverで参照できる
+    """
+
+    def __init__(self, runner, handle):
+        super().__init__(self, runner.driver)
+        object.__setattr__(self, "runner", runner)
+        object.__setattr__(self, "handle", handle)
+        object.__setattr__(self, "frames", [])
+        # ElementLookup・Planのキャッシュは元のdriverではなくタブごとに持つ
+        object.__setattr__(self, "_element_lookup", None)
+        object.__setattr__(self, "_plan_cases", None)
+        object.__setattr__(self, "_lean_blocked", None)
+
+    @property
+    def wrapped_driver(self):
+        return self.runner.driver
+
+    @property
+    def switch_to(self):
+        return TabSwitchTo(self, self.runner.driver.switch_to)
+
+    def wrap(self, value):
+        if isinstance(value, WebElement):
+            return TabElement(self, value)
+        if isinstance(value, list):
+            return [self.wrap(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.wrap(item) for key, item in value.items()}
+        return value
+
+    def wrap_call(self, func):
+        def call(*args, **kwargs):
+            args = _unwrap(args)
+            kwargs = _unwrap(kwargs)
+            with self.runner.lock:
+                self.runner.activate(self)
+                result = func(*args, **kwargs)
+            return self.wrap(result)
+
+        return call
+
+    def get(self, url):
+        token = uuid.uuid4().hex
+        with self.runner.lock:
+            self.runner.activate(self)
+            # フレーム内にいる場合はフレームではなくタブ全体を遷移させる
+            if self.frames:
+                self.runner.driver.switch_to.default_content()
+                self.frames.clear()
+            self.runner.driver.execute_script(NAVIGATE_SCRIPT, url, token)
+
+        deadline = time.monotonic() + self.runner.navigation_timeout
+        while time.monotonic() < deadline:
+            try:
+                with self.runner.lock:
+                    self.runner.activate(self)
+                    state = self.runner.driver.execute_script(COMMITTED_SCRIPT, token)
+                if state:
+                    return
+            except WebDriverException:
+                # 遷移中はスクリプトを実行できないことがある
+                pass
+            time.sleep(self.runner.poll_interval)
+        raise TimeoutException(f"navigation to {url} did not start in time")
+
+    def close(self):
+        raise ValueError("tabs are closed by TabRunner.close()")
+
+    def quit(self):
+        raise ValueError("tabs share one browser; quit the driver passed to TabRunner instead")
+
+    def __repr__(self):
+        return f"TabDriver({self.handle})"
+
+
+class TabResult:
+    """TabRunner.runの1ジョブ分の結果"""
+
+    def __init__(self, index, tab, value=None, error=None, elapsed=0.0):
+        self.index = index
+        self.tab = tab  # 実行したタブの番号
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        status = "error" if self.error is not None else "ok"
+        return f"TabResult({self.index}, tab={self.tab}, {status}, {self.elapsed:.3f}s)"
+
+
+def process_tree_rss(pid):
+    """pidとその子孫プロセスのRSSの合計(bytes)を返す。/procが無い環境ではNone"""
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    rss = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_size
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+def driver_rss(driver):
+    """driver(chromedriver/geckodriverとブラウザ)のRSSの合計。取得できなければNone"""
+    try:
+        return process_tree_rss(driver.service.process.pid)
+    except AttributeError:
+        return None
+
+
+class TabRunner:
+    """_summary_
+    1つのWebDriverセッションの複数タブで、独立したCaseを並行に実行する。
+    ブラウザ1つ分のメモリで、複数のscraperのページ読み込みを重ねられる。
+
+    * タブごとにスレッドを1つ割り当て、ジョブ(driverを受け取る関数)にTabDriverを渡す
+    * Operationのサブクラスは変更不要。TabDriverがタブ・フレームの切り替えを行う
+    * chromedriverは読み込み中のタブへのコマンドを読み込み完了まで待たせるので、
+      pageLoadStrategyはeager/none(LeanProfile等)で起動したdriverを使うこと
+    * タブはcookieを共有する。同じサイトに別のユーザーでログインするジョブは同時に実行しないこと
+    * Util.create_driver(lean=...)で起動したdriverなら、各タブにLeanProfileのURLのブロックを設定する
+
+        Usage:
+            driver = Util.create_driver(True, True, lean=LeanProfile(page_load_strategy="none"))
+            runner = TabRunner(driver, tabs=4)
+            results = runner.run([
+                lambda tab: Case(Get(tab, url1), DownloadHTML(tab, "1.html")).exec_operation(tab),
+                lambda tab: Catalog.login_user(tab).exec_operation(tab),
+            ])
+            print(runner.report())
+            runner.close()
+    """
+
+    def __init__(self, driver, tabs=4, navigation_timeout=30, poll_interval=0.05):
+        self.driver = driver
+        self.navigation_timeout = navigation_timeout
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger(__name__)
+        self._current = None
+        self.elapsed = 0.0
+        self.results = []
+
+        self._original_handle = driver.current_window_handle
+        self.tabs = [TabDriver(self, self._original_handle)]
+        for _ in range(tabs - 1):
+            driver.switch_to.new_window("tab")
+            self.tabs.append(TabDriver(self, driver.current_window_handle))
+        self._current = self.tabs[-1]
+
+        # LeanProfileのURLのブロックはタブごとの設定なので、開いたタブにも設定する
+        lean = getattr(driver, "lean_profile", None)
+        if lean is not None:
+            for tab in self.tabs:
+                lean.apply(tab)
+
+    def activate(self, tab):
+        """tabのウィンドウとフレームに切り替える。lockを取得した状態で呼ぶこと"""
+        if self._current is tab:
+            return
+        self.driver.switch_to.window(tab.handle)
+        for frame in tab.frames:
+            self.driver.switch_to.frame(frame)
+        self._current = tab
+
+    def run(self, jobs):
+        """jobsを空いているタブで並行に実行する
+
+        Args:
+            jobs (list): TabDriverを受け取る関数のリスト
+
+        Returns:
+            list: jobsと同じ順のTabResult
+        """
+        pending = queue.Queue()
+        for index, job in enumerate(jobs):
+            pending.put((index, job))
+        results = [None] * len(jobs)
+
+        def worker(tab_index, tab):
+            while True:
+                try:
+                    index, job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.perf_counter()
+                try:
+                    results[index] = TabResult(index, tab_index, value=job(tab))
+                except Exception as e:
+                    self.logger.exception(f"job {index} failed in tab {tab_index}")
+                    results[index] = TabResult(index, tab_index, error=e)
+                results[index].elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=worker, args=(i, tab), daemon=True)
+            for i, tab in enumerate(self.tabs[: max(1, len(jobs))])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - started
+        self.results = results
+        return results
+
+    def report(self):
+        """直近のrunの件数・スループット・ブラウザのメモリ使用量を返す"""
+        done = sum(1 for result in self.results if result.error is None)
+        failed = len(self.results) - done
+        throughput = len(self.results) / self.elapsed if self.elapsed else 0.0
+        lines = [
+            f"tabs {len(self.tabs)}  jobs {len(self.results)} (failed {failed})"
+            f"  elapsed {self.elapsed:.2f}s  throughput {throughput:.2f} jobs/s"
+        ]
+        rss = driver_rss(self.driver)
+        if rss is not None:
+            lines.append(
+                f"browser RSS {rss / 1024 ** 2:.1f}MiB"
+                f"  ({rss / len(self.tabs) / 1024 ** 2:.1f}MiB per concurrent tab)"
+            )
+        for result in self.results:
+            lines.append(f"  {result!r}")
+        return "\n".join(lines)
+
+    def close(self):
+        """追加したタブを閉じ、最初のタブに戻す。driverは終了しない"""
+        with self.lock:
+            for tab in self.tabs[1:]:
+                try:
+                    self.driver.switch_to.window(tab.handle)
+                    self.driver.close()
+                except WebDriverException:
+                    pass
+            self.driver.switch_to.window(self._original_handle)
+            self._current = None
@@ -0,0 +1,67 @@
+import threading
+import time
+
+
+class TTLCache:
+    """_summary_
+    有効期限付きのスレッドセーフなキャッシュ。
+    ttl秒を過ぎたエントリは取得時に破棄される。
+
+        Usage:
+            cache = TTLCache(ttl=600)
+            cache.set("key", "value")
+            cache.get("key")  # => "value"
+    """
+
+    def __init__(self, ttl=600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._purge(now)
+            self._entries[key] = (now + self.ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_if(self, predicate):
+        """predicate(key)がTrueになるエントリを削除する"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self, now):
+        # 期限切れを削除し、それでも上限を超える場合は期限の近いものから削除する
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        overflow = len(self._entries) - self.max_entries + 1
+        if overflow > 0:
+            oldest = sorted(self._entries, key=lambda k: self._entries[k][0])[:overflow]
+            for key in oldest:
+                del self._entries[key]
@@ -0,0 +1,219 @@
+import logging
+import time
+from selenium.common.exceptions import WebDriverException
+
+
+class ReadyCondition:
+    """_summary_
+    Operation実行後に「次の操作に進んでよい状態か」を判定する条件のベースクラス。
+    Caseはexec()の後、is_ready()がTrueを返すまでポーリングする。
+
+    状態を持つ条件(NetworkIdle等)があるため、Operation.ready_condition()は
+    呼ばれるたびに新しいインスタンスを返すこと。
+    """
+
+    def prepare(self, driver):
+        """Operation.exec()の前に呼ばれる。操作前の状態を記録する条件が上書きする"""
+
+    def is_ready(self, driver):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return self.__class__.__name__
+
+
+class NoWait(ReadyCondition):
+    """待機不要(スクショ・HTML保存などページ状態を変えない操作)"""
+
+    def is_ready(self, driver):
+        return True
+
+
+class DocumentReady(ReadyCondition):
+    """document.readyStateがcompleteになるまで待つ"""
+
+    def is_ready(self, driver):
+        return driver.execute_script("return document.readyState") == "complete"
+
+
+class NavigationComplete(ReadyCondition):
+    """操作で画面遷移した場合は遷移先のdocument.readyStateがcompleteになるまで待つ。
+    遷移しなかった場合は、grace秒待っても遷移が始まらなければ待機を終える
+
+    * 遷移前のドキュメントのreadyStateはcompleteのままなので、readyStateだけでは
+      遷移前のページを見て待機を終えてしまう。prepareで操作前のドキュメントに目印を付け、
+      目印の無いドキュメントに替わったら遷移がコミットされたとみなす
+    * 遷移の開始はbeforeunloadで記録する。開始していれば遷移先が読み込まれるまで待つ
+    * 目印はtrue/falseだけなので、スクリプトと引数は毎回同じ(lib.replayで記録・再生できる)
+    """
+
+    PREPARE_SCRIPT = """
+window.__pyniumNav = {leaving: false};
+if (!window.__pyniumNavListener) {
+  window.__pyniumNavListener = true;
+  window.addEventListener('beforeunload', function () {
+    if (window.__pyniumNav) window.__pyniumNav.leaving = true;
+  });
+}
+"""
+    SCRIPT = """
+var nav = window.__pyniumNav;
+return [nav ? (nav.leaving ? 'leaving' : 'same') : 'new', document.readyState];
+"""
+
+    def __init__(self, grace=0.15):
+        self.grace = grace
+        self._since = None
+
+    def prepare(self, driver):
+        driver.execute_script(self.PREPARE_SCRIPT)
+
+    def is_ready(self, driver):
+        document, state = driver.execute_script(self.SCRIPT)
+        if document == "new":
+            return state == "complete"
+        if document == "leaving" or state != "complete":
+            self._since = None
+            return False
+        # フォームの送信などは遷移の開始が少し遅れるので、grace秒は遷移が始まるのを待つ
+        now = time.perf_counter()
+        if self._since is None:
+            self._since = now
+        return now - self._since >= self.grace
+
+
+# NetworkIdleで数えないリソース(定期的なポーリング・解析用のビーコン等)のURLに含まれる文字列
+DEFAULT_IGNORED_URLS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "/collect",
+    "/beacon",
+    "longpoll",
+    "long-poll",
+    "/socket.io/",
+    "/sockjs/",
+)
+
+
+class NetworkIdle(ReadyCondition):
+    """document.readyStateがcompleteかつ、idle_time秒の間
+    新しいリソース(XHR/fetch含む)の読み込み完了が観測されなくなるまで待つ
+
+    * sendBeaconと、URLにignoreの文字列を含むリソースは数えない
+      (ポーリングが続くページでも、毎回timeoutまで待たないようにする)
+    * リソースのバッファ(既定250件)は拡張する。それでも一杯なら増えたか判定できないので未完了とする
+    """
+
+    BUFFER_SIZE = 10000
+    SCRIPT = """
+var ignore = arguments[0], bufferSize = arguments[1];
+if (window.__pyniumBufferSize !== bufferSize) {
+  try { performance.setResourceTimingBufferSize(bufferSize); } catch (e) {}
+  window.__pyniumBufferSize = bufferSize;
+}
+var entries = performance.getEntriesByType('resource');
+var count = 0;
+for (var i = 0; i < entries.length; i++) {
+  if (entries[i].initiatorType === 'beacon') continue;
+  var ignored = false;
+  for (var j = 0; j < ignore.length; j++) {
+    if (entries[i].name.indexOf(ignore[j]) >= 0) { ignored = true; break; }
+  }
+  if (!ignored) count++;
+}
+return [document.readyState, count, entries.length >= bufferSize];
+"""
+
+    def __init__(self, idle_time=0.5, ignore=DEFAULT_IGNORED_URLS):
+        self.idle_time = idle_time
+        self.ignore = list(ignore)
+        self._last_count = None
+        self._since = None
+
+    def is_ready(self, driver):
+        state, count, full = driver.execute_script(self.SCRIPT, self.ignore, self.BUFFER_SIZE)
+        now = time.perf_counter()
+        if state != "complete" or full or count != self._last_count:
+            self._last_count = count
+            self._since = now
+            return False
+        return now - self._since >= self.idle_time
+
+
+class ElementStable(ReadyCondition):
+    """xpathの要素の位置・サイズがstable_time秒変化しなくなるまで待つ。
+    要素が存在しない場合(画面遷移した等)は待たない。
+    """
+
+    SCRIPT = (
+        "var e = document.evaluate(arguments[0], document, null,"
+        " XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;"
+        "if (!e) return null;"
+        "var r = e.getBoundingClientRect();"
+        "return [r.x, r.y, r.width, r.height];"
+    )
+
+    def __init__(self, xpath, stable_time=0.1):
+        self.xpath = xpath
+        self.stable_time = stable_time
+        self._last_rect = None
+        self._since = None
+
+    def is_ready(self, driver):
+        rect = driver.execute_script(self.SCRIPT, self.xpath)
+        if rect is None:
+            return True
+        now = time.perf_counter()
+        if rect != self._last_rect:
+            self._last_rect = rect
+            self._since = now
+            return False
+        return now - self._since >= self.stable_time
+
+    def __repr__(self):
+        return f"ElementStable({self.xpath})"
+
+
+def prepare_ready(driver, condition):
+    """Operation.exec()の前にconditionのprepareを呼ぶ
+
+    Args:
+        driver (_type_): Selenium WebDriverのインスタンス
+        condition (ReadyCondition): 待機条件
+    """
+    if getattr(driver, "skip_ready_wait", False):
+        return
+    try:
+        condition.prepare(driver)
+    except WebDriverException:
+        # アラート表示中などで記録できなければ、prepare無しで判定する
+        logging.getLogger(__name__).debug(f"failed to prepare {condition!r}", exc_info=True)
+
+
+def wait_until_ready(driver, condition, timeout=10, poll_interval=0.05):
+    """conditionが成立するまでポーリングする
+
+    Args:
+        driver (_type_): Selenium WebDriverのインスタンス
+        condition (ReadyCondition): 待機条件
+        timeout (int, optional): 最大待機秒数. Defaults to 10.
+        poll_interval (float, optional): ポーリング間隔(秒). Defaults to 0.05.
+
+    Returns:
+        bool: タイムアウトまでに条件が成立したらTrue
+    """
+    if getattr(driver, "skip_ready_wait", False):
+        # 記録済みの応答を返すdriver(lib.replay.ReplayDriver)は待つ必要が無い
+        return True
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            if condition.is_ready(driver):
+                return True
+        except WebDriverException:
+            # 画面遷移中はスクリプト実行に失敗することがあるので未完了扱い
+            pass
+        if time.perf_counter() >= deadline:
+            logging.getLogger(__name__).warning(f"{condition!r} was not ready within {timeout}s")
+            return False
+        time.sleep(poll_interval)
@@ -1,7 +1,7 @@
-from lib.scheduler import Scheduler
+from lib.driver_pool import DriverPool
+from lib.scheduler import AsyncScheduler
 
 import logging
-import threading
 
 
 def init():
@@ -17,20 +17,19 @@ def main():
     )  # ※自身のプロジェクトではMyScraperを継承したクラスをインスタンス化する
     scraper2 = MyScraper()
 
-    # スケジューラーのインスタンスを作成
-    scheduler1 = Scheduler(5, scraper1)
-    scheduler2 = Scheduler(10, scraper2)
-
-    # スケジューラーを別々のスレッドで開始
-    thread1 = threading.Thread(target=scheduler1.start)
-    thread2 = threading.Thread(target=scheduler2.start)
-
-    thread1.start()
-    thread2.start()
-
-    # 全てのスレッドが終了するまで待つ
-    thread1.join()
-    thread2.join()
+    # スケジューラーのインスタンスを作成(driverは共有のプールから借りる)
+    driver_pool = DriverPool(is_chrome=True, is_headless=True, max_size=2)
+    # ブラウザは並列に起動しておく
+    driver_pool.warm(2)
+    scheduler = AsyncScheduler(max_workers=2, driver_pool=driver_pool)
+    scheduler.add(5, scraper1, jitter=10)
+    scheduler.add(10, scraper2, jitter=10)
+
+    # 1つのイベントループで全てのスクレイパーを実行する
+    try:
+        scheduler.start()
+    finally:
+        driver_pool.close()
 
 
 if __name__ == "__main__":
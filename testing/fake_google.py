@@ -0,0 +1,336 @@
+"""_summary_
+テスト・ベンチマーク用のインプロセスのgspreadクライアントとDrive APIのfake。
+API呼び出し回数をcallsに記録し、fail_everyを指定すると429エラーを発生させる。
+
+    Usage:
+        client = FakeGspreadClient()
+        drive = FakeDriveService()
+        writer = SpreadsheetWriter(None, "sheet", client=client, drive_service=drive)
+        writer.write(data)
+        print(client.calls, drive.calls)
+"""
+import itertools
+import json
+import re
+from collections import Counter
+
+import gspread
+import httplib2
+from gspread.utils import ValueRenderOption
+from googleapiclient.errors import HttpError
+
+
+class FakeResponse:
+    """gspread.exceptions.APIErrorに渡すレスポンス"""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = json.dumps(
+            {"error": {"code": status_code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+        )
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeGspreadClient:
+    def __init__(self, fail_every=None):
+        self.calls = Counter()
+        self.fail_every = fail_every
+        self.spreadsheets = {}
+        self._count = 0
+        self._next_id = 0
+
+    def record(self, name):
+        """API呼び出しを記録する。fail_every回に1回、429エラーを発生させる"""
+        self._count += 1
+        if self.fail_every and self._count % self.fail_every == 0:
+            self.calls["429"] += 1
+            raise gspread.exceptions.APIError(
+                FakeResponse(429, "Quota exceeded for quota metric 'Write requests'")
+            )
+        self.calls[name] += 1
+
+    def open(self, name):
+        self.record("open")
+        if name not in self.spreadsheets:
+            raise gspread.SpreadsheetNotFound
+        return self.spreadsheets[name]
+
+    def create(self, name):
+        self.record("create")
+        self._next_id += 1
+        spreadsheet = FakeSpreadsheet(self, f"fake-{self._next_id}", name)
+        self.spreadsheets[name] = spreadsheet
+        return spreadsheet
+
+
+def cell(value):
+    """RAWで書き込んだ値をget_all_valuesで読んだときの表示値"""
+    value = unformatted(value)
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+def unformatted(value):
+    """RAWで書き込んだ値をvalue_render_option=UNFORMATTED_VALUEで読んだときの値。
+    数値はJSONの数値として返るので、整数のfloatはintになる
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, id, title):
+        self.client = client
+        self.id = id
+        self.title = title
+        self.sheet1 = FakeWorksheet(self)
+
+    def batch_update(self, body):
+        """spreadsheets.batchUpdate。deleteDimension(ROWS)だけを実装する"""
+        self.client.record("spreadsheet.batch_update")
+        for request in body["requests"]:
+            target = request["deleteDimension"]["range"]
+            assert target["sheetId"] == self.sheet1.id and target["dimension"] == "ROWS"
+            self.sheet1.delete_range(target["startIndex"], target["endIndex"])
+        return {"replies": [{} for _ in body["requests"]]}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.id = 0
+        self.row_count = 1000
+        self.rows = []  # 表示値(文字列)
+        self.values = []  # 書き込んだ値
+
+    def append_row(self, values, **kwargs):
+        self.client.record("append_row")
+        self._set_row(len(self.rows) + 1, values)
+
+    def append_rows(self, values, **kwargs):
+        self.client.record("append_rows")
+        for row in values:
+            self._set_row(len(self.rows) + 1, row)
+
+    def add_rows(self, rows):
+        self.client.record("add_rows")
+        self.row_count += rows
+
+    def batch_update(self, data, **kwargs):
+        """values.batchUpdate。'A{行番号}'形式の範囲だけを実装する"""
+        self.client.record("batch_update")
+        for item in data:
+            start = int(re.fullmatch(r"A(\d+)", item["range"]).group(1))
+            if start + len(item["values"]) - 1 > self.row_count:
+                raise gspread.exceptions.APIError(
+                    FakeResponse(400, f"Range {item['range']} exceeds grid limits")
+                )
+            for offset, row in enumerate(item["values"]):
+                self._set_row(start + offset, row)
+
+    def delete_range(self, start_index, end_index):
+        # 0始まりの[start_index, end_index)の行を削除する
+        del self.rows[start_index:end_index]
+        del self.values[start_index:end_index]
+        self.row_count -= end_index - start_index
+
+    def _set_row(self, row_number, values):
+        while len(self.rows) < row_number:
+            self.rows.append([])
+            self.values.append([])
+        self.rows[row_number - 1] = [cell(v) for v in values]
+        self.values[row_number - 1] = [unformatted(v) for v in values]
+        self.row_count = max(self.row_count, len(self.rows))
+
+    def clear(self):
+        self.client.record("clear")
+        self.rows = []
+        self.values = []
+
+    def row_values(self, row):
+        self.client.record("row_values")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def get_all_values(self, value_render_option=None, **kwargs):
+        self.client.record("get_all_values")
+        if value_render_option in (ValueRenderOption.unformatted, "UNFORMATTED_VALUE"):
+            return [list(row) for row in self.values]
+        return [list(row) for row in self.rows]
+
+    def delete_rows(self, start_index, end_index=None):
+        self.client.record("delete_rows")
+        end_index = end_index or start_index
+        self.delete_range(start_index - 1, end_index)
+
+
+SPREADSHEET_MIME_TYPE = "application/vnd.google-apps.spreadsheet"
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+def http_error(status, message):
+    resp = httplib2.Response({"status": str(status)})
+    resp.reason = message
+    content = json.dumps({"error": {"code": status, "message": message}}).encode()
+    return HttpError(resp, content)
+
+
+class FakeRequest:
+    """googleapiclientのHttpRequestのfake。execute()で初めて処理される"""
+
+    def __init__(self, service, name, func):
+        self.service = service
+        self.name = name
+        self.func = func
+
+    def execute(self, http=None, num_retries=0):
+        self.service.calls[self.name] += 1
+        return self.func()
+
+
+class FakeBatchRequest:
+    """googleapiclientのBatchHttpRequestのfake。1回のexecuteで1回のAPI呼び出しとして数える"""
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if len(self.requests) >= 1000:
+            raise ValueError("too many requests in a batch")
+        self.requests.append((request, callback or self.callback, request_id))
+
+    def execute(self, http=None):
+        self.service.calls["batch"] += 1
+        for request, callback, request_id in self.requests:
+            self.service.calls["batch:" + request.name] += 1
+            try:
+                if self.service.rate_limited():
+                    raise http_error(429, "Rate Limit Exceeded")
+                response, exception = request.func(), None
+            except HttpError as error:
+                response, exception = None, error
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class FakeDriveService:
+    """Drive API v3のfake。files()とpermissions()の一部だけを実装する。
+    rate_limit_everyを指定すると、バッチ内のリクエストがその回数に1回429エラーになる
+    """
+
+    def __init__(self, rate_limit_every=None):
+        self.calls = Counter()
+        self.files_by_id = {}
+        self.permissions = []
+        self.rate_limit_every = rate_limit_every
+        self._ids = itertools.count(1)
+        self._count = 0
+
+    def rate_limited(self):
+        self._count += 1
+        return bool(self.rate_limit_every) and self._count % self.rate_limit_every == 0
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+    def add_file(self, name, mime_type=SPREADSHEET_MIME_TYPE, parents=("root",)):
+        file_id = f"file-{next(self._ids)}"
+        self.files_by_id[file_id] = {
+            "id": file_id,
+            "name": name,
+            "mimeType": mime_type,
+            "parents": list(parents),
+        }
+        return file_id
+
+    def files(self):
+        return FakeFilesResource(self)
+
+    def permissions(self):
+        return FakePermissionsResource(self)
+
+
+class FakeFilesResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, q="", spaces=None, fields=None, pageSize=100, pageToken=None, **kwargs):
+        def run():
+            matched = [f for f in self.service.files_by_id.values() if self._match(f, q)]
+            start = int(pageToken or 0)
+            page = matched[start:start + pageSize]
+            response = {"files": [{"id": f["id"], "name": f["name"]} for f in page]}
+            if start + pageSize < len(matched):
+                response["nextPageToken"] = str(start + pageSize)
+            return response
+
+        return FakeRequest(self.service, "files.list", run)
+
+    def get(self, fileId, fields=None):
+        return FakeRequest(self.service, "files.get", lambda: dict(self._file(fileId)))
+
+    def create(self, body, fields=None):
+        def run():
+            file_id = self.service.add_file(
+                body["name"], body["mimeType"], body.get("parents", ["root"])
+            )
+            return {"id": file_id}
+
+        return FakeRequest(self.service, "files.create", run)
+
+    def update(self, fileId, addParents=None, removeParents=None, fields=None):
+        def run():
+            file = self._file(fileId)
+            removed = (removeParents or "").split(",")
+            file["parents"] = [p for p in file["parents"] if p not in removed]
+            if addParents:
+                file["parents"].extend(addParents.split(","))
+            return {"id": fileId, "parents": file["parents"]}
+
+        return FakeRequest(self.service, "files.update", run)
+
+    def delete(self, fileId):
+        def run():
+            self._file(fileId)
+            del self.service.files_by_id[fileId]
+            return ""
+
+        return FakeRequest(self.service, "files.delete", run)
+
+    def _file(self, file_id):
+        if file_id not in self.service.files_by_id:
+            raise http_error(404, f"File not found: {file_id}")
+        return self.service.files_by_id[file_id]
+
+    @staticmethod
+    def _match(file, q):
+        name = re.search(r"name='((?:\\.|[^'])*)'", q)
+        if name and file["name"] != re.sub(r"\\(.)", r"\1", name.group(1)):
+            return False
+        mime_type = re.search(r"mimeType='([^']*)'", q)
+        if mime_type and file["mimeType"] != mime_type.group(1):
+            return False
+        parent = re.search(r"'([^']*)' in parents", q)
+        if parent and parent.group(1) not in file["parents"]:
+            return False
+        return True
+
+
+class FakePermissionsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def create(self, fileId, body):
+        def run():
+            self.service.permissions.append((fileId, body))
+            return {"id": f"permission-{len(self.service.permissions)}"}
+
+        return FakeRequest(self.service, "permissions.create", run)
@@ -0,0 +1,88 @@
+"""_summary_
+ArtifactSinkの書き込み・重複排除・アーカイブの切り替えと削除・満杯時の破棄を確認する。
+"""
+import os
+import threading
+import time
+
+from lib.artifact_sink import ArtifactSink, iter_records
+
+HTML = "<html><body>" + "<p>row</p>" * 200 + "</body></html>"
+PNG = b"\x89PNG\r\n\x1a\n" + os.urandom(256)
+
+
+def read_all(directory):
+    return [(header["name"], header, data) for header, data in iter_records(directory)]
+
+
+def test_artifacts_are_written_in_the_background_and_read_back(tmp_path):
+    sink = ArtifactSink(str(tmp_path), codec="gzip")
+    assert sink.put("page.html", HTML)
+    assert sink.put("shot.png", PNG, kind="png")
+    sink.close()
+
+    records = read_all(str(tmp_path))
+    assert [(name, data) for name, _, data in records] == [
+        ("page.html", HTML.encode("utf-8")),
+        ("shot.png", PNG),
+    ]
+    assert [header["codec"] for _, header, _ in records] == ["gzip", "none"]
+    stats = sink.stats()
+    assert (stats["written"], stats["failed"]) == (2, 0)
+    # HTMLは圧縮され、PNGはそのまま保存される
+    assert stats["bytes_out"] < stats["bytes_in"]
+
+
+def test_duplicates_are_stored_as_references(tmp_path):
+    sink = ArtifactSink(str(tmp_path), codec="gzip")
+    for i in range(3):
+        sink.put(f"page{i}.html", HTML)
+    sink.close()
+
+    records = read_all(str(tmp_path))
+    assert [data for _, _, data in records] == [HTML.encode("utf-8")] * 3
+    assert ["ref" in header for _, header, _ in records] == [False, True, True]
+    assert sink.stats()["deduplicated"] == 2
+
+
+def test_references_stay_inside_a_segment_and_old_segments_are_removed(tmp_path):
+    # 1件書くごとにアーカイブを切り替え、書き込み中のアーカイブの他に2つ分だけ残す
+    sink = ArtifactSink(str(tmp_path), segment_bytes=1, codec="gzip")
+    sink.put("first.html", HTML)
+    sink.flush()
+    segment_size = os.path.getsize(os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0]))
+    # ヘッダーの時刻の桁数でアーカイブの大きさは数バイト変わる
+    sink.max_total_bytes = segment_size * 2 + segment_size // 2
+    for i in range(4):
+        sink.put(f"page{i}.html", HTML)
+    sink.close()
+
+    records = read_all(str(tmp_path))
+    assert [name for name, _, _ in records] == ["page1.html", "page2.html", "page3.html"]
+    # 別のアーカイブを参照しないので、古いアーカイブを削除しても読み出せる
+    assert all("ref" not in header for _, header, _ in records)
+    assert all(data == HTML.encode("utf-8") for _, _, data in records)
+    assert sink.stats()["deduplicated"] == 0
+
+
+def test_put_without_blocking_drops_when_the_queue_is_full(tmp_path):
+    sink = ArtifactSink(str(tmp_path), max_queue=1, codec="gzip")
+    release = threading.Event()
+    write = sink._write
+
+    def slow_write(*args):
+        release.wait(5)
+        write(*args)
+
+    sink._write = slow_write
+    sink.put("writing.html", HTML)
+    # 書き込みスレッドが取り出すまで待ち、キューの空き1つを埋める
+    while sink._queue.qsize():
+        time.sleep(0.001)
+    assert sink.put("queued.html", HTML, block=False)
+    assert not sink.put("dropped.html", HTML, block=False)
+
+    release.set()
+    sink.close()
+    assert [name for name, _, _ in read_all(str(tmp_path))] == ["writing.html", "queued.html"]
+    assert sink.stats()["dropped"] == 1
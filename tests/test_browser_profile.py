@@ -0,0 +1,50 @@
+"""_summary_
+LeanProfileが起動オプション・ブロックするURLパターンに許可リストを反映することを確認する。
+"""
+from selenium.webdriver import ChromeOptions, FirefoxOptions
+
+from lib.browser_profile import LeanProfile
+
+IMAGES_PREF = "profile.managed_default_content_settings.images"
+
+
+def test_chrome_disables_images_unless_allowed():
+    options = LeanProfile().chrome_options(ChromeOptions())
+    assert options.experimental_options["prefs"][IMAGES_PREF] == 2
+    assert options.page_load_strategy == "eager"
+
+    allowed = LeanProfile().allowing(("image",)).chrome_options(ChromeOptions())
+    assert IMAGES_PREF not in allowed.experimental_options.get("prefs", {})
+
+
+def test_chrome_keeps_existing_prefs():
+    options = ChromeOptions()
+    options.add_experimental_option("prefs", {"download.default_directory": "/tmp"})
+    LeanProfile().chrome_options(options)
+    assert options.experimental_options["prefs"] == {
+        "download.default_directory": "/tmp",
+        IMAGES_PREF: 2,
+    }
+
+
+def test_firefox_preferences_follow_allow():
+    blocked = LeanProfile().firefox_options(FirefoxOptions()).preferences
+    assert blocked["permissions.default.image"] == 2
+    assert blocked["gfx.downloadable_fonts.enabled"] is False
+
+    allowed = LeanProfile().allowing(("image",)).firefox_options(FirefoxOptions()).preferences
+    assert "permissions.default.image" not in allowed
+    assert allowed["gfx.downloadable_fonts.enabled"] is False
+
+
+def test_allowing_removes_types_and_urls_from_blocked_patterns():
+    profile = LeanProfile()
+    patterns = profile.blocked_patterns()
+    assert "*.png" in patterns and "*google-analytics.com*" in patterns
+
+    allowed = profile.allowing(("image", "*google-analytics.com*"))
+    assert allowed.allow == ("image", "*google-analytics.com*")
+    assert profile.allow == ()
+    assert "*.png" not in allowed.blocked_patterns()
+    assert "*google-analytics.com*" not in allowed.blocked_patterns()
+    assert "*.woff" in allowed.blocked_patterns()
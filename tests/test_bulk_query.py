@@ -0,0 +1,71 @@
+"""_summary_
+bulk_queryがQueryをページ内のスクリプトに渡す形式と、count_table_rowsの判定を確認する。
+スクリプト自体はブラウザが必要なので、ここでは1回のexecute_scriptに渡す引数を確認する。
+"""
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+from lib.bulk_query import BULK_QUERY_SCRIPT, Query, bulk_query, count_table_rows
+
+
+class RecordingDriver:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def execute_script(self, script, *args):
+        self.calls.append((script, args))
+        return self.result
+
+
+def test_fields_are_sent_as_selector_and_projection():
+    query = Query(
+        "//table[@id='items']//tr[td]",
+        fields={
+            "id": "td[1]",
+            "row_class": "@class",
+            "html": "html",
+            "link": ("td[2]/a", "@href"),
+        },
+        offset=10,
+        limit=5,
+    )
+
+    assert query.to_json() == {
+        "selector": "//table[@id='items']//tr[td]",
+        "css": False,
+        "count_only": False,
+        "offset": 10,
+        "limit": 5,
+        "fields": {
+            "id": {"selector": "td[1]", "projection": "text"},
+            "row_class": {"selector": None, "projection": "@class"},
+            "html": {"selector": None, "projection": "html"},
+            "link": {"selector": "td[2]/a", "projection": "@href"},
+        },
+    }
+
+
+def test_all_queries_are_evaluated_in_one_call():
+    driver = RecordingDriver({"rows": [], "title": ["Items"]})
+    result = bulk_query(driver, {
+        "rows": Query("tr", css=True, fields={"id": "td"}),
+        "title": Query("//h1"),
+    })
+
+    assert result == {"rows": [], "title": ["Items"]}
+    [(script, (payload,))] = driver.calls
+    assert script == BULK_QUERY_SCRIPT
+    assert payload["rows"]["css"] is True
+    assert payload["title"]["fields"] is None
+
+
+def test_count_table_rows_requires_the_table():
+    driver = RecordingDriver({"tables": 1, "rows": 21})
+    assert count_table_rows(driver, "//table[@id='items']") == 21
+    [(_, (payload,))] = driver.calls
+    assert payload["rows"]["selector"] == "(//table[@id='items'])[1]//tr"
+    assert payload["rows"]["count_only"] is True
+
+    with pytest.raises(NoSuchElementException):
+        count_table_rows(RecordingDriver({"tables": 0, "rows": 0}), "//table")
@@ -0,0 +1,204 @@
+"""_summary_
+Caseの待機条件を、時間経過で画面遷移が進むfakeのdriverで確認する。
+"""
+import time
+
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+from lib.case import Case
+from lib.operation import Click, Operation, Submit
+from lib.wait import (
+    DocumentReady,
+    ElementStable,
+    NavigationComplete,
+    NetworkIdle,
+    wait_until_ready,
+)
+
+
+class Document:
+    def __init__(self, url, state="complete"):
+        self.url = url
+        self.state = state
+        self.nav = None  # PREPARE_SCRIPTで付けるwindow.__pyniumNav
+
+
+class FakeElement:
+    def __init__(self, driver, href, submit_delay):
+        self.driver = driver
+        self.href = href
+        self.submit_delay = submit_delay
+
+    def click(self):
+        self.driver.navigate(self.href, self.submit_delay)
+
+    def submit(self):
+        self.driver.navigate(self.href, self.submit_delay)
+
+
+class SlowNavigationDriver:
+    """リンクをクリックすると、start秒後に遷移が始まり(beforeunload)、commit秒後に
+    遷移先のドキュメントに替わり、さらにload秒後にreadyStateがcompleteになるブラウザ
+    """
+
+    def __init__(self, start=0.0, commit=0.3, load=0.3):
+        self.start = start
+        self.commit = commit
+        self.load = load
+        self.document = Document("/start")
+        self._pending = None  # (url, 開始時刻)
+        self._loaded_at = None
+        self.links = {"//a[@id='slow']": "/slow", "//form[@id='login']": "/home"}
+
+    def navigate(self, url, start):
+        self._pending = (url, time.perf_counter() + start)
+
+    def _advance(self):
+        now = time.perf_counter()
+        if self._pending is not None:
+            url, started = self._pending
+            if now >= started and self.document.nav is not None:
+                self.document.nav["leaving"] = True
+            if now >= started + self.commit:
+                self.document = Document(url, "loading")
+                self._pending = None
+                self._loaded_at = now + self.load
+        if self._loaded_at is not None and now >= self._loaded_at:
+            self.document.state = "complete"
+            self._loaded_at = None
+
+    def find_element(self, by, value):
+        self._advance()
+        if value not in self.links:
+            raise NoSuchElementException(value)
+        return FakeElement(self, self.links[value], self.start)
+
+    def execute_script(self, script, *args):
+        self._advance()
+        if script == NavigationComplete.PREPARE_SCRIPT:
+            self.document.nav = {"leaving": False}
+            return None
+        if script == NavigationComplete.SCRIPT:
+            nav = self.document.nav
+            document = "new" if nav is None else ("leaving" if nav["leaving"] else "same")
+            return [document, self.document.state]
+        if script == "return document.readyState":
+            return self.document.state
+        raise AssertionError(f"unexpected script: {script}")
+
+
+class ReadUrl(Operation):
+    """実行した時点のURLと読み込み状態を記録する"""
+
+    def __init__(self, driver):
+        super().__init__(driver)
+        self.seen = None
+
+    def exec(self):
+        self.driver._advance()
+        self.seen = (self.driver.document.url, self.driver.document.state)
+
+
+def test_document_ready_alone_does_not_wait_for_a_slow_navigation():
+    driver = SlowNavigationDriver()
+    driver.find_element("xpath", "//a[@id='slow']").click()
+    # 遷移前のページはcompleteなので、すぐに待機を終えてしまう
+    assert wait_until_ready(driver, DocumentReady(), timeout=2)
+    assert driver.document.url == "/start"
+
+
+def test_click_waits_until_the_slow_page_has_loaded():
+    driver = SlowNavigationDriver(commit=0.3, load=0.3)
+    read = ReadUrl(driver)
+    case = Case(Click(driver, "//a[@id='slow']"), read, timeout=5, poll_interval=0.01)
+
+    case.exec_operation()
+
+    assert read.seen == ("/slow", "complete")
+    assert case.timings[0].ready
+    assert case.timings[0].wait_time >= 0.6
+
+
+def test_submit_waits_for_a_navigation_that_starts_late():
+    # フォームの送信は遷移の開始が遅れる
+    driver = SlowNavigationDriver(start=0.05, commit=0.2, load=0.1)
+    read = ReadUrl(driver)
+    case = Case(Submit(driver, "//form[@id='login']"), read, timeout=5, poll_interval=0.01)
+
+    case.exec_operation()
+
+    assert read.seen == ("/home", "complete")
+
+
+def test_click_without_navigation_waits_only_the_grace_period():
+    driver = SlowNavigationDriver()
+    # 遷移しないボタン
+    driver.links["//button[@id='toggle']"] = None
+    driver.navigate = lambda url, start: None
+    read = ReadUrl(driver)
+    case = Case(Click(driver, "//button[@id='toggle']"), read, timeout=5, poll_interval=0.01)
+
+    case.exec_operation()
+
+    assert read.seen == ("/start", "complete")
+    assert case.timings[0].ready
+    assert case.timings[0].wait_time < 1.0
+
+
+class ScriptedDriver:
+    """execute_scriptの結果を、最初の呼び出しからの経過秒数で決めるdriver"""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.started = time.perf_counter()
+        self.calls = 0
+
+    def execute_script(self, script, *args):
+        self.calls += 1
+        return self.respond(time.perf_counter() - self.started)
+
+
+def test_network_idle_waits_until_resources_stop_loading():
+    # 0.3秒間、リソースの読み込みが続く
+    driver = ScriptedDriver(lambda elapsed: ["complete", min(int(elapsed * 100), 30), False])
+    started = time.perf_counter()
+
+    assert wait_until_ready(driver, NetworkIdle(idle_time=0.2), timeout=5, poll_interval=0.01)
+    assert time.perf_counter() - started >= 0.5
+
+
+def test_network_idle_is_not_ready_while_the_buffer_is_full():
+    driver = ScriptedDriver(lambda elapsed: ["complete", 10000, True])
+    assert not wait_until_ready(driver, NetworkIdle(idle_time=0.05), timeout=0.3, poll_interval=0.01)
+
+
+def test_element_stable_waits_for_the_element_to_stop_moving():
+    # 0.2秒間アニメーションする
+    driver = ScriptedDriver(lambda elapsed: [0, min(elapsed, 0.2) * 100, 10, 10])
+    started = time.perf_counter()
+
+    assert wait_until_ready(driver, ElementStable("//div", stable_time=0.1), timeout=5, poll_interval=0.01)
+    assert time.perf_counter() - started >= 0.3
+
+    # 要素が無ければ待たない
+    missing = ScriptedDriver(lambda elapsed: None)
+    assert wait_until_ready(missing, ElementStable("//div"), timeout=5)
+    assert missing.calls == 1
+
+
+def test_script_errors_count_as_not_ready():
+    def respond(elapsed):
+        if elapsed < 0.1:
+            raise WebDriverException("navigation in progress")
+        return "complete"
+
+    driver = ScriptedDriver(respond)
+    assert wait_until_ready(driver, DocumentReady(), timeout=5, poll_interval=0.01)
+    assert driver.calls > 1
+
+
+def test_replay_drivers_skip_the_wait():
+    driver = ScriptedDriver(lambda elapsed: "loading")
+    driver.skip_ready_wait = True
+    assert wait_until_ready(driver, DocumentReady(), timeout=5)
+    assert driver.calls == 0
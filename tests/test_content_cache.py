@@ -0,0 +1,80 @@
+"""_summary_
+ContentCacheのハッシュの比較・volatile_xpathsの除外・容量を超えたときの削除を確認する。
+"""
+import os
+import time
+
+from lib.content_cache import ContentCache
+
+PAGE = "<html><body><p>{}</p><span id='now'>{}</span></body></html>"
+
+
+def blob_size(cache, namespace, digest):
+    return os.path.getsize(cache._blob_path(namespace, digest))
+
+
+def test_committed_page_is_unchanged_until_its_content_changes(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    digest = cache.fingerprint(PAGE.format("a", 1))
+    assert not cache.is_unchanged("Items", 0, digest)
+    cache.commit("Items", 0, digest, PAGE.format("a", 1))
+
+    assert cache.is_unchanged("Items", 0, digest)
+    assert not cache.is_unchanged("Items", 1, digest)
+    assert not cache.is_unchanged("Items", 0, cache.fingerprint(PAGE.format("b", 1)))
+    assert cache.load("Items", digest) == PAGE.format("a", 1)
+    assert cache.stats()["Items"] == {"hits": 1, "misses": 3, "hit_rate": 0.25}
+
+    # index.jsonに保存されるので、別のインスタンスでも同じ結果になる
+    assert ContentCache(str(tmp_path)).is_unchanged("Items", 0, digest)
+
+
+def test_volatile_nodes_are_ignored(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    volatile = ["//span[@id='now']"]
+
+    assert cache.fingerprint(PAGE.format("a", 1), volatile) == cache.fingerprint(
+        PAGE.format("a", 2), volatile
+    )
+    assert cache.fingerprint(PAGE.format("a", 1), volatile) != cache.fingerprint(
+        PAGE.format("b", 1), volatile
+    )
+
+
+def test_least_recently_used_pages_are_evicted_over_max_bytes(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    pages = [PAGE.format(str(i) * 200, i) for i in range(4)]
+    digests = [cache.fingerprint(page) for page in pages]
+    for key, (digest, page) in enumerate(zip(digests[:3], pages)):
+        cache.commit("Items", key, digest, page)
+        # mtimeの分解能より長く間を空けて、使われた順を区別できるようにする
+        time.sleep(0.01)
+    sizes = [blob_size(cache, "Items", digest) for digest in digests[:3]]
+
+    # ページ0を使ったので、最も古いのはページ1になる
+    assert cache.is_unchanged("Items", 0, digests[0])
+    time.sleep(0.01)
+    cache.max_bytes = sum(sizes)
+    cache.commit("Items", 3, digests[3], pages[3])
+
+    assert cache.load("Items", digests[1]) is None
+    assert all(cache.load("Items", digest) for digest in (digests[0], digests[2], digests[3]))
+    assert cache._total == sizes[0] + sizes[2] + blob_size(cache, "Items", digests[3])
+    # 削除したページは次回は変更ありとして処理される
+    assert not cache.is_unchanged("Items", 1, digests[1])
+    assert not ContentCache(str(tmp_path)).is_unchanged("Items", 1, digests[1])
+    assert cache.is_unchanged("Items", 0, digests[0])
+
+
+def test_existing_blobs_count_towards_max_bytes(tmp_path):
+    first = ContentCache(str(tmp_path))
+    page = PAGE.format("x" * 500, 0)
+    first.commit("Items", 0, first.fingerprint(page), page)
+
+    # 別プロセスで作成したページも、最初のcommitで容量に数える
+    second = ContentCache(str(tmp_path), max_bytes=blob_size(first, "Items", first.fingerprint(page)))
+    other = PAGE.format("y" * 500, 0)
+    second.commit("Other", 0, second.fingerprint(other), other)
+
+    assert second.load("Items", first.fingerprint(page)) is None
+    assert second.load("Other", second.fingerprint(other)) == other
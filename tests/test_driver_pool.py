@@ -0,0 +1,277 @@
+"""_summary_
+DriverPoolの貸出・返却・破棄を、ブラウザを起動しないfakeのdriverで確認する。
+"""
+import threading
+
+import pytest
+
+from lib.browser_profile import LeanProfile
+from lib.driver_pool import MAX_HISTORY_ENTRIES, DriverPool
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current = handle
+
+    def default_content(self):
+        pass
+
+
+class FakeDriver:
+    """タブごとの履歴・originごとのstorage・cookieだけを持つ、CDPを使えないdriver"""
+
+    def __init__(self):
+        self.tabs = {"tab-0": ["about:blank"]}
+        self.current = "tab-0"
+        self.storage = {}  # origin -> {key: value}
+        self.cookies = set()  # domain
+        self.alive = True
+        self.quit_count = 0
+        self.switch_to = FakeSwitchTo(self)
+
+    @property
+    def window_handles(self):
+        return list(self.tabs)
+
+    def visit(self, url, new_tab=False):
+        """利用者の操作: ページを開き、そのoriginのstorageとcookieに書き込む"""
+        if new_tab:
+            self.current = f"tab-{len(self.tabs)}"
+            self.tabs[self.current] = []
+        self.get(url)
+        origin = "/".join(url.split("/")[:3])
+        self.storage.setdefault(origin, {})["token"] = "secret"
+        self.cookies.add(url.split("/")[2])
+
+    def get(self, url):
+        self.tabs[self.current].append(url)
+
+    def close(self):
+        del self.tabs[self.current]
+
+    def execute_script(self, script, *args):
+        if not self.alive:
+            # chromedriverが終了しているとurllib3の例外になる
+            raise ConnectionRefusedError("driver process is gone")
+        return 1
+
+    def delete_all_cookies(self):
+        self.cookies.clear()
+
+    def quit(self):
+        self.quit_count += 1
+
+
+class FakeChrome(FakeDriver):
+    """Page/Network/StorageのCDPコマンドに応答するdriver"""
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == "Page.getNavigationHistory":
+            return {"entries": [{"url": url} for url in self.tabs[self.current]]}
+        if cmd == "Network.getAllCookies":
+            return {"cookies": [{"domain": "." + domain} for domain in self.cookies]}
+        if cmd == "Storage.clearDataForOrigin":
+            assert params["storageTypes"] == "all"
+            self.storage.pop(params["origin"], None)
+        elif cmd == "Network.clearBrowserCookies":
+            self.cookies.clear()
+        return {}
+
+
+def make_pool(driver_cls=FakeChrome, **kwargs):
+    launched = []
+
+    def factory():
+        launched.append(driver_cls())
+        return launched[-1]
+
+    return DriverPool(factory=factory, **kwargs), launched
+
+
+def test_checkin_makes_the_driver_available_again():
+    pool, launched = make_pool(max_size=2)
+    first = pool.checkout()
+    pool.checkin(first)
+    second = pool.checkout()
+
+    assert second is first
+    assert len(launched) == 1
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["in_use"]) == (1, 1, 1)
+
+
+def test_checkout_launches_up_to_max_size_then_times_out():
+    pool, launched = make_pool(max_size=2)
+    drivers = [pool.checkout(), pool.checkout()]
+
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.05)
+    assert len(launched) == 2
+
+    # 返却されると待っていたcheckoutに渡る
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.checkout(timeout=5)))
+    waiter.start()
+    pool.checkin(drivers[0])
+    waiter.join()
+    assert borrowed == [drivers[0]]
+
+
+def test_checkin_clears_storage_of_every_visited_origin():
+    pool, _ = make_pool()
+    driver = pool.checkout()
+    driver.visit("https://a.example/login")
+    driver.visit("https://b.example/home", new_tab=True)
+    # iframeで開いたoriginはタブの履歴に残らないがcookieは残る
+    driver.cookies.add("c.example")
+    driver.storage["https://c.example"] = {"token": "secret"}
+    driver._element_lookup = object()
+    driver._plan_cases = {}
+
+    pool.checkin(driver)
+
+    assert driver.storage == {}
+    assert driver.cookies == set()
+    assert driver.window_handles == ["tab-0"]
+    assert driver.tabs["tab-0"][-1] == "about:blank"
+    assert not hasattr(driver, "_element_lookup")
+    assert not hasattr(driver, "_plan_cases")
+    assert pool.checkout() is driver
+
+
+def test_checkin_recycles_a_driver_whose_history_was_truncated():
+    pool, launched = make_pool()
+    driver = pool.checkout()
+    for i in range(MAX_HISTORY_ENTRIES):
+        driver.visit(f"https://site{i}.example/")
+
+    pool.checkin(driver)
+
+    assert driver.quit_count == 1
+    assert pool.stats()["recycled"] == 1
+    assert pool.checkout() is not driver
+    assert len(launched) == 2
+
+
+def test_checkin_recycles_a_driver_whose_storage_cannot_be_cleared():
+    pool, _ = make_pool(driver_cls=FakeDriver)
+    driver = pool.checkout()
+    driver.visit("https://a.example/")
+
+    pool.checkin(driver)
+
+    assert driver.quit_count == 1
+    assert pool.stats()["recycled"] == 1
+    assert pool.stats()["size"] == 0
+
+
+def test_driver_is_recycled_after_max_uses():
+    pool, _ = make_pool(max_uses=2)
+    driver = pool.checkout()
+    pool.checkin(driver)
+    assert pool.checkout() is driver
+    pool.checkin(driver)
+
+    assert driver.quit_count == 1
+    assert pool.checkout() is not driver
+    assert pool.stats()["recycled"] == 1
+
+
+def test_unhealthy_driver_is_replaced_on_checkout():
+    pool, _ = make_pool(max_size=1)
+    driver = pool.checkout()
+    pool.checkin(driver)
+    driver.alive = False
+
+    replacement = pool.checkout()
+
+    assert replacement is not driver
+    assert driver.quit_count == 1
+    stats = pool.stats()
+    assert (stats["unhealthy"], stats["size"]) == (1, 1)
+
+
+def test_failed_reset_discards_the_driver_and_frees_its_slot():
+    pool, _ = make_pool(max_size=1)
+    driver = pool.checkout()
+    # タブが無いのでreset_sessionのwindow_handles[0]で失敗する
+    driver.tabs.clear()
+
+    pool.checkin(driver)
+
+    assert pool.stats()["unhealthy"] == 1
+    assert pool.checkout(timeout=1) is not driver
+
+
+def test_borrow_discards_the_driver_when_the_block_raises():
+    pool, _ = make_pool()
+    with pytest.raises(RuntimeError):
+        with pool.borrow() as driver:
+            raise RuntimeError("scrape failed")
+
+    assert driver.quit_count == 1
+    assert pool.stats()["evicted"] == 1
+    assert pool.stats()["size"] == 0
+
+
+def test_idle_drivers_are_evicted_after_idle_timeout():
+    pool, _ = make_pool(idle_timeout=0)
+    assert pool.warm(2) == 2
+    drivers = [entry.driver for entry in pool._idle]
+
+    pool.evict_idle()
+
+    assert [driver.quit_count for driver in drivers] == [1, 1]
+    assert pool.stats()["size"] == 0
+
+
+def make_lean_pool(**kwargs):
+    launched = []
+
+    def factory(allow=()):
+        driver = FakeChrome()
+        launched.append((allow, driver))
+        return driver
+
+    return DriverPool(factory=factory, lean=LeanProfile(), **kwargs), launched
+
+
+def test_lean_allow_gets_a_driver_launched_with_that_allow():
+    pool, launched = make_lean_pool(max_size=2)
+    plain = pool.checkout()
+    pool.checkin(plain)
+    charts = pool.checkout(lean_allow=("image", "*cdn.example.com*"))
+
+    assert charts is not plain
+    assert [allow for allow, _ in launched] == [(), ("*cdn.example.com*", "image")]
+    pool.checkin(charts)
+
+    # 同じ許可リストなら起動済みのdriverを使い回す
+    assert pool.checkout(lean_allow=("*cdn.example.com*", "image")) is charts
+    assert pool.checkout() is plain
+    assert len(launched) == 2
+
+
+def test_idle_driver_with_another_allow_is_replaced_when_the_pool_is_full():
+    pool, launched = make_lean_pool(max_size=1)
+    plain = pool.checkout()
+    pool.checkin(plain)
+
+    charts = pool.checkout(timeout=1, lean_allow=("image",))
+
+    assert charts is not plain
+    assert plain.quit_count == 1
+    stats = pool.stats()
+    assert (stats["size"], stats["evicted"]) == (1, 1)
+
+
+def test_lean_allow_is_ignored_without_a_lean_profile():
+    pool, launched = make_pool()
+    driver = pool.checkout(lean_allow=("image",))
+    pool.checkin(driver)
+
+    assert pool.checkout() is driver
+    assert len(launched) == 1
@@ -0,0 +1,71 @@
+"""_summary_
+Util.count_*のtimeoutを、時間が経つと要素が現れるfakeのdriverで確認する。
+"""
+import time
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+from lib.bulk_query import BULK_QUERY_SCRIPT
+from lib.e2e_util import Util
+
+TABLE = "//table[@id='items']"
+
+
+class LateTableDriver:
+    """appear秒後に、rows行のテーブルが描画されるページ"""
+
+    def __init__(self, appear, rows=3):
+        self.shown_at = time.perf_counter() + appear
+        self.rows = rows
+        self.scripts = 0
+
+    def shown(self):
+        return time.perf_counter() >= self.shown_at
+
+    def count(self, selector):
+        if not self.shown():
+            return 0
+        return {TABLE: 1, f"({TABLE})[1]//tr": self.rows}.get(selector, 0)
+
+    def execute_script(self, script, payload):
+        assert script == BULK_QUERY_SCRIPT
+        self.scripts += 1
+        return {name: self.count(query["selector"]) for name, query in payload.items()}
+
+    def find_element(self, by, value):
+        if not self.count(value):
+            raise NoSuchElementException(value)
+        return object()
+
+
+def test_count_elements_by_xpath_does_not_wait_by_default():
+    driver = LateTableDriver(appear=0.2)
+    assert Util.count_elements_by_xpath(driver, TABLE) == 0
+    assert driver.scripts == 1
+
+
+def test_count_elements_by_xpath_waits_for_elements_to_appear():
+    driver = LateTableDriver(appear=0.2)
+    assert Util.count_elements_by_xpath(driver, TABLE, timeout=5) == 1
+
+
+def test_count_elements_by_xpath_returns_zero_after_timeout():
+    driver = LateTableDriver(appear=60)
+    started = time.perf_counter()
+    assert Util.count_elements_by_xpath(driver, TABLE, timeout=0.3) == 0
+    assert time.perf_counter() - started < 2
+
+
+def test_count_table_records_by_xpath_waits_for_the_table():
+    driver = LateTableDriver(appear=0.2, rows=4)
+    with pytest.raises(NoSuchElementException):
+        Util.count_table_records_by_xpath(driver, TABLE)
+
+    assert Util.count_table_records_by_xpath(driver, TABLE, timeout=5) == 4
+
+
+def test_count_table_records_by_xpath_raises_when_the_table_never_appears():
+    driver = LateTableDriver(appear=60)
+    with pytest.raises(NoSuchElementException):
+        Util.count_table_records_by_xpath(driver, TABLE, timeout=0.3)
@@ -0,0 +1,76 @@
+"""_summary_
+Extractor/Fieldによる抽出と、iterextractがextractと同じレコードを返すことを確認する。
+"""
+from lib.extractor import Extractor, Field, compile_selector
+from lib.scraper import Scraper
+
+HTML = """
+<html><body>
+<table id="items">
+  <tr><th>id</th><th>name</th><th>tags</th></tr>
+  <tr><td>1</td><td><a href="/items/1">  Apple </a></td><td><span class="tag">red</span><span class="tag">fruit</span></td></tr>
+  <tr><td>2</td><td><a href="/items/2">Banana</a></td><td></td></tr>
+  <tr><td>3</td><td>Cherry <b>(sold out)</b></td><td><span class="tag">red</span></td></tr>
+</table>
+</body></html>
+"""
+
+FIELDS = [
+    Field("id", "td[1]/text()"),
+    Field("name", "td[2]"),
+    Field("link", "td[2]/a", attr="href", default=""),
+    Field("tags", ".//span[@class='tag']", many=True),
+]
+
+EXPECTED = [
+    {"id": "1", "name": "Apple", "link": "/items/1", "tags": ["red", "fruit"]},
+    {"id": "2", "name": "Banana", "link": "/items/2", "tags": []},
+    {"id": "3", "name": "Cherry (sold out)", "link": "", "tags": ["red"]},
+]
+
+
+def test_extract_returns_one_dict_per_row():
+    extractor = Extractor("//table[@id='items']//tr[td]", FIELDS)
+    assert extractor.extract(HTML) == EXPECTED
+
+
+def test_css_selectors():
+    extractor = Extractor(
+        "table#items tr:not(:first-child)",
+        [Field("id", "td:first-child", css=True), Field("tags", "span.tag", css=True, many=True)],
+        css=True,
+    )
+    assert extractor.extract(HTML) == [
+        {"id": row["id"], "tags": row["tags"]} for row in EXPECTED
+    ]
+
+
+def test_iterextract_matches_extract():
+    extractor = Extractor("//table[@id='items']//tr[td]", FIELDS)
+    assert list(extractor.iterextract(HTML, tag="tr", row_filter="td")) == EXPECTED
+    assert list(extractor.iterextract(HTML.encode("utf-8"), tag="tr", row_filter="td")) == EXPECTED
+
+
+def test_iterextract_reads_files(tmp_path):
+    path = tmp_path / "items.html"
+    rows = "".join(f"<tr><td>{i}</td><td>item{i}</td></tr>" for i in range(1000))
+    path.write_text(f"<html><body><table>{rows}</table></body></html>", encoding="utf-8")
+    extractor = Extractor("//tr", [Field("id", "td[1]"), Field("name", "td[2]")])
+
+    extracted = list(extractor.iterextract(str(path), tag="tr"))
+
+    assert len(extracted) == 1000
+    assert extracted[-1] == {"id": "999", "name": "item999"}
+
+
+def test_selectors_are_compiled_once():
+    assert compile_selector("//tr[td]") is compile_selector("//tr[td]")
+    assert compile_selector("tr", True) is not compile_selector("tr")
+
+
+def test_scraper_extracts_declaratively():
+    class ItemScraper(Scraper):
+        row_selector = "//table[@id='items']//tr[td]"
+        fields = FIELDS
+
+    assert ItemScraper().extract(HTML) == EXPECTED
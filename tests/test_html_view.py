@@ -0,0 +1,53 @@
+"""_summary_
+生のまま保存したHTMLを、ファイル・ArtifactSinkのアーカイブから読み、見るときに整形できることを確認する。
+"""
+import pytest
+
+from lib.artifact_sink import ArtifactSink
+from lib.e2e_util import Util
+from lib.html_view import format_html, main, read_html
+
+HTML = "<html><body><div><p>こんにちは</p></div></body></html>"
+
+
+@pytest.fixture
+def sink(tmp_path, monkeypatch):
+    sink = ArtifactSink(str(tmp_path / "artifacts"), codec="gzip")
+    monkeypatch.setattr(Util, "artifact_sink", sink)
+    yield sink
+    sink.close()
+
+
+def test_save_raw_html_keeps_page_source_as_is(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Util.save_raw_html(HTML, "page.html")
+
+    assert (tmp_path / "temp" / "page.html").read_text(encoding="utf-8") == HTML
+    assert read_html(str(tmp_path / "temp" / "page.html")) == HTML
+
+
+def test_read_html_returns_the_latest_archived_page(sink):
+    Util.save_raw_html("<p>old</p>", "page.html")
+    Util.save_raw_html(HTML, "page.html")
+    Util.save_raw_html("<p>other</p>", "other.html")
+    sink.flush()
+
+    assert read_html(sink.directory, "page.html") == HTML
+    with pytest.raises(FileNotFoundError):
+        read_html(sink.directory, "missing.html")
+
+
+def test_main_prettifies_only_when_viewing(sink, tmp_path, capsys):
+    Util.save_raw_html(HTML, "page.html")
+    sink.flush()
+    output = tmp_path / "formatted.html"
+
+    assert main([sink.directory, "page.html", str(output)]) == 0
+    assert output.read_text(encoding="utf-8") == format_html(HTML)
+    assert "   <p>\n    こんにちは\n   </p>" in format_html(HTML)
+
+    raw = tmp_path / "raw.html"
+    raw.write_text(HTML, encoding="utf-8")
+    assert main([str(raw)]) == 0
+    assert capsys.readouterr().out == format_html(HTML)
+    assert main([]) == 1
@@ -0,0 +1,108 @@
+"""_summary_
+HttpSessionの条件付きGET・cookieの引き継ぎ・Caseの実行を、ローカルのHTTPサーバーで確認する。
+"""
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from lib.case import Case
+from lib.http_session import HttpSession
+from lib.operation import Click, Fetch, Get
+
+ITEMS = "<html><body>" + "<p>item</p>" * 100 + "</body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        Handler.requests_seen.append((self.path, dict(self.headers)))
+        if self.path == "/items":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = ITEMS.encode("utf-8")
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path == "/whoami":
+            body = f"{self.headers.get('Cookie')}|{self.headers.get('User-Agent')}".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class LoggedInDriver:
+    def get_cookies(self):
+        return [{"name": "sid", "value": "abc", "domain": "127.0.0.1", "path": "/"}]
+
+    def execute_script(self, script):
+        assert script == "return navigator.userAgent"
+        return "FakeBrowser/1.0"
+
+
+def test_unchanged_page_is_served_from_the_previous_response(server):
+    session = HttpSession()
+
+    assert session.get(server + "/items") == ITEMS
+    assert session.get(server + "/items") == ITEMS
+
+    assert session.status_code == 304
+    assert session.not_modified == 1
+    first, second = [headers for _, headers in Handler.requests_seen]
+    assert "gzip" in first["Accept-Encoding"]
+    assert second["If-None-Match"] == '"v1"'
+
+
+def test_cookies_and_user_agent_are_imported_from_the_browser(server):
+    session = HttpSession()
+    session.import_cookies(LoggedInDriver())
+
+    assert session.get(server + "/whoami") == "sid=abc|FakeBrowser/1.0"
+    assert session.current_url == server + "/whoami"
+
+
+def test_errors_are_raised(server):
+    with pytest.raises(requests.HTTPError):
+        HttpSession().get(server + "/missing")
+
+
+def test_run_executes_fetch_only_cases(server):
+    session = HttpSession()
+    html = session.run(Case(Get(session, server + "/whoami"), Fetch(session, server + "/items")))
+    assert html == ITEMS
+    assert [path for path, _ in Handler.requests_seen] == ["/whoami", "/items"]
+
+    assert Case(Fetch(session, server + "/items")).exec_operation(session) == ITEMS
+
+    with pytest.raises(ValueError, match="Click"):
+        session.run(Case(Click(session, "//a")))
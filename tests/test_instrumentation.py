@@ -0,0 +1,137 @@
+"""_summary_
+tracerがOperation/Caseの所要時間・失敗・WebDriverWaitのポーリング回数を集計し、
+Chromeのトレース形式とPrometheusの形式で出力できることを確認する。
+"""
+import time
+import urllib.request
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+from lib.case import Case
+from lib.instrumentation import Tracer, tracer
+from lib.lookup import ElementLookup
+from lib.operation import Operation
+
+
+class FakeDriver:
+    # 待機条件は使わない
+    skip_ready_wait = True
+
+    def __init__(self, missing=0):
+        self.missing = missing
+
+    def find_element(self, by, value):
+        # missing回だけ見つからない
+        if self.missing:
+            self.missing -= 1
+            raise NoSuchElementException(value)
+        return object()
+
+
+class Sleep(Operation):
+    def __init__(self, driver, seconds):
+        super().__init__(driver)
+        self.seconds = seconds
+
+    def exec(self):
+        time.sleep(self.seconds)
+
+
+class SleepTwice(Sleep):
+    def exec(self):
+        # super().exec()は同じOperationのスパンとして1回だけ数える
+        super().exec()
+        super().exec()
+
+
+class Fail(Operation):
+    def exec(self):
+        raise RuntimeError("broken")
+
+
+class FindSlowly(Operation):
+    def exec(self):
+        self.lookup.find("//a", timeout=5)
+
+
+@pytest.fixture
+def enabled():
+    tracer.reset()
+    tracer.enable()
+    yield tracer
+    tracer.disable()
+    tracer.reset()
+
+
+def test_disabled_tracer_records_nothing():
+    tracer.reset()
+    driver = FakeDriver()
+    Case(Sleep(driver, 0)).exec_operation()
+    assert tracer.summary() == {}
+
+
+def test_operations_and_cases_are_timed(enabled):
+    driver = FakeDriver()
+    Case(Sleep(driver, 0.02), SleepTwice(driver, 0.01), name="daily").exec_operation()
+
+    summary = enabled.summary()
+    assert summary["operation_seconds"]["Sleep"]["count"] == 1
+    assert summary["operation_seconds"]["Sleep"]["sum"] >= 0.02
+    assert summary["operation_seconds"]["SleepTwice"]["count"] == 1
+    assert summary["operation_seconds"]["SleepTwice"]["sum"] >= 0.02
+    assert summary["case_seconds"]["daily"]["count"] == 1
+    assert set(summary["ready_wait_seconds"]) == {"Sleep", "SleepTwice"}
+
+
+def test_failures_are_counted_and_reraised(enabled):
+    with pytest.raises(RuntimeError):
+        Case(Fail(FakeDriver()), name="broken").exec_operation()
+
+    summary = enabled.summary()
+    assert summary["failures_total"] == {"Fail": 1, "broken": 1}
+    events = enabled.chrome_trace()["traceEvents"]
+    assert [(e["name"], e["cat"], e["args"]["failed"]) for e in events] == [
+        ("Fail", "operation", True),
+        ("broken", "case", True),
+    ]
+
+
+def test_webdriver_wait_polls_are_counted_per_operation(enabled):
+    driver = FakeDriver(missing=2)
+    driver._element_lookup = ElementLookup(driver, poll_frequency=0.01)
+    Case(FindSlowly(driver)).exec_operation()
+    assert enabled.summary()["webdriver_wait_polls_total"] == {"FindSlowly": 3}
+
+
+def test_prometheus_text_has_cumulative_buckets(tmp_path):
+    local = Tracer()
+    for seconds in (0.001, 0.03, 0.03, 7.0):
+        local.record('Input "q"', "operation", "operation_seconds", 0.0, seconds)
+
+    text = local.prometheus_text()
+
+    label = 'operation="Input \\"q\\""'
+    assert f'pynium_operation_seconds_bucket{{{label},le="0.005"}} 1' in text
+    assert f'pynium_operation_seconds_bucket{{{label},le="0.05"}} 3' in text
+    assert f'pynium_operation_seconds_bucket{{{label},le="+Inf"}} 4' in text
+    assert f"pynium_operation_seconds_count{{{label}}} 4" in text
+    assert "# TYPE pynium_failures_total counter" in text
+
+    path = tmp_path / "pynium.prom"
+    local.write_prometheus(str(path))
+    assert path.read_text(encoding="utf-8") == text
+
+
+def test_metrics_are_served_over_http():
+    local = Tracer()
+    local.count("failures_total", "Get")
+    server = local.serve_prometheus(port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 'pynium_failures_total{name="Get"} 1' in body
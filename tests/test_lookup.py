@@ -0,0 +1,92 @@
+"""_summary_
+ElementLookupの要素のキャッシュ・古くなった要素のやり直し・明示的な待機を、fakeのdriverで確認する。
+"""
+import time
+
+import pytest
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from selenium.webdriver.remote.webelement import WebElement
+
+from lib.lookup import ElementLookup
+
+
+class FakeElement(WebElement):
+    def is_displayed(self):
+        return self.parent.visible
+
+    def click(self):
+        if self.id != self.parent.document:
+            raise StaleElementReferenceException(self.id)
+        self.parent.clicks += 1
+
+
+class FakeDriver:
+    """documentが変わると、それまでに返した要素は古くなる"""
+
+    def __init__(self, appear_after=0.0):
+        self.document = "doc-1"
+        self.visible = True
+        self.shown_at = time.monotonic() + appear_after
+        self.finds = 0
+        self.clicks = 0
+
+    def find_element(self, by, value):
+        self.finds += 1
+        if time.monotonic() < self.shown_at:
+            raise NoSuchElementException(value)
+        return FakeElement(self, self.document)
+
+
+def test_lookup_is_kept_per_driver():
+    driver = FakeDriver()
+    assert ElementLookup.of(driver) is ElementLookup.of(driver)
+    assert ElementLookup.of(driver) is not ElementLookup.of(FakeDriver())
+    lookup = ElementLookup.of(driver)
+    assert lookup.wait(5) is lookup.wait(5)
+    assert lookup.wait(5) is not lookup.wait(10)
+
+
+def test_found_elements_are_reused_until_ttl_or_invalidate():
+    driver = FakeDriver()
+    lookup = ElementLookup(driver, ttl=0.2)
+    first = lookup.find("//a")
+
+    assert lookup.find("//a") is first
+    assert driver.finds == 1
+    time.sleep(0.2)
+    assert lookup.find("//a") is not first
+    lookup.invalidate()
+    lookup.find("//a")
+    assert driver.finds == 3
+    assert lookup.stats() == {"hits": 1, "misses": 3, "stale": 0}
+
+
+def test_stale_element_is_found_again_once():
+    driver = FakeDriver()
+    lookup = ElementLookup(driver)
+    lookup.perform("//a", lambda element: element.click())
+    # ページが書き換わり、キャッシュした要素が古くなった
+    driver.document = "doc-2"
+
+    lookup.perform("//a", lambda element: element.click())
+
+    assert driver.clicks == 2
+    assert lookup.stats()["stale"] == 1
+
+
+def test_find_waits_for_the_element_and_times_out():
+    driver = FakeDriver(appear_after=0.2)
+    lookup = ElementLookup(driver, poll_frequency=0.01)
+    assert lookup.find("//a", timeout=5).id == "doc-1"
+    assert driver.finds > 1
+
+    hidden = FakeDriver()
+    hidden.visible = False
+    lookup = ElementLookup(hidden, poll_frequency=0.01)
+    assert lookup.find("//a", timeout=0.1)
+    with pytest.raises(TimeoutException):
+        lookup.find("//a", timeout=0.1, visible=True)
@@ -0,0 +1,112 @@
+"""_summary_
+ScrapePipeline/ParsePoolで、extract/formatが別プロセスで実行され、
+outputとcontent_cacheへの記録が出力スレッドで行われることを確認する。
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from lib.content_cache import ContentCache
+from lib.pipeline import ParsePool, ScrapePipeline
+from lib.scraper import Scraper
+
+
+class PageScraper(Scraper):
+    """ワーカーでimportできるように、モジュールのトップレベルで定義する"""
+
+    def __init__(self, pages, content_cache=None):
+        super().__init__(content_cache=content_cache)
+        self.pages = pages
+        self.outputs = []
+        self.output_threads = set()
+
+    def exec_selenium(self):
+        return self.pages
+
+    def extract(self, html):
+        if html.startswith("sleep:"):
+            time.sleep(float(html.split(":")[1]))
+        if html == "broken":
+            raise ValueError("unexpected page")
+        return html.upper()
+
+    def format(self, scraped_data):
+        return scraped_data, os.getpid()
+
+    def output(self, data_list):
+        self.outputs.append(data_list)
+        self.output_threads.add(threading.current_thread().name)
+
+
+@pytest.fixture
+def parse_pool():
+    pool = ParsePool(workers=2, max_pending=4)
+    yield pool
+    pool.close()
+
+
+def wait_for_outputs(pool, submitted):
+    deadline = time.monotonic() + 30
+    while pool.completed + pool.failed < submitted:
+        assert time.monotonic() < deadline, pool.stats()
+        time.sleep(0.01)
+
+
+def test_pages_are_parsed_in_worker_processes(parse_pool):
+    scraper = PageScraper(["<p>a</p>", "<p>b</p>", "<p>c</p>"])
+
+    ScrapePipeline(scraper, parse_pool).exec()
+    wait_for_outputs(parse_pool, 3)
+
+    assert sorted(data for data, _ in scraper.outputs) == ["<P>A</P>", "<P>B</P>", "<P>C</P>"]
+    assert os.getpid() not in {pid for _, pid in scraper.outputs}
+    # outputは1本の出力スレッドで呼ばれる
+    assert len(scraper.output_threads) == 1
+    assert threading.current_thread().name not in scraper.output_threads
+    assert parse_pool.stats() == {"submitted": 3, "completed": 3, "failed": 0, "pending": 0}
+
+
+def test_unchanged_pages_are_not_submitted(parse_pool, tmp_path):
+    cache = ContentCache(str(tmp_path / "pages"))
+    scraper = PageScraper(["<p>a</p>", "<p>b</p>"], content_cache=cache)
+    pipeline = ScrapePipeline(scraper, parse_pool)
+    pipeline.exec()
+    wait_for_outputs(parse_pool, 2)
+
+    scraper.pages = ["<p>a</p>", "<p>b2</p>"]
+    pipeline.exec()
+    wait_for_outputs(parse_pool, 3)
+
+    assert parse_pool.submitted == 3
+    assert [data for data, _ in scraper.outputs][-1] == "<P>B2</P>"
+    assert cache.stats()["PageScraper"]["hits"] == 1
+
+
+def test_failed_page_is_not_committed(parse_pool, tmp_path):
+    cache = ContentCache(str(tmp_path / "pages"))
+    scraper = PageScraper(["broken", "<p>ok</p>"], content_cache=cache)
+    pipeline = ScrapePipeline(scraper, parse_pool)
+    pipeline.exec()
+    wait_for_outputs(parse_pool, 2)
+
+    assert (parse_pool.completed, parse_pool.failed) == (1, 1)
+    # 失敗したページは次回も処理し直す
+    pipeline.exec()
+    wait_for_outputs(parse_pool, 3)
+    assert parse_pool.submitted == 3
+
+
+def test_submit_waits_for_a_free_slot():
+    pool = ParsePool(workers=1, max_pending=1)
+    scraper = PageScraper([])
+    try:
+        pool.submit(scraper, "sleep:0.5")
+        with pytest.raises(TimeoutError):
+            pool.submit(scraper, "<p>late</p>", timeout=0.05)
+        # outputが終われば空きができる
+        pool.submit(scraper, "<p>late</p>", timeout=30)
+    finally:
+        pool.close()
+    assert [data for data, _ in scraper.outputs] == ["SLEEP:0.5", "<P>LATE</P>"]
@@ -0,0 +1,114 @@
+"""_summary_
+Planのbind(driverごとのCaseの再利用とParamの当てはめ)と保存・読み込みを確認する。
+bindはOperationを作成するだけなので、driverにはブラウザの代わりに空のオブジェクトを渡す。
+"""
+import threading
+
+import pytest
+
+from lib.operation import ClickUntilNotFound, Get, Input, Submit
+from lib.plan import Param, Plan, Step
+
+
+class FakeDriver:
+    pass
+
+
+LOGIN = Plan(
+    Step(Get, Param("url", "https://example.com/login")),
+    Step(Input, "//*[@name='login_id']", Param("login_id")),
+    Step(Input, "//*[@name='password']", Param("password")),
+    Step(Submit, "//form[@name='login_form']"),
+    name="login",
+)
+
+
+def test_bind_reuses_the_case_and_updates_params():
+    driver = FakeDriver()
+    first = LOGIN.bind(driver, login_id="user01", password="secret01")
+    operations = list(first.operations)
+
+    second = LOGIN.bind(driver, login_id="user02", password="secret02", url="https://example.com/")
+
+    assert second is first
+    assert second.operations == operations
+    assert [op.value for op in second.operations[1:3]] == ["user02", "secret02"]
+    assert second.operations[0].url == "https://example.com/"
+    assert all(op.driver is driver for op in second.operations)
+    assert second.name == "login"
+
+
+def test_each_driver_gets_its_own_case():
+    drivers = [FakeDriver(), FakeDriver()]
+    cases = [LOGIN.bind(driver, login_id="user", password="pw") for driver in drivers]
+
+    assert cases[0] is not cases[1]
+    assert [case.operations[0].driver for case in cases] == drivers
+
+
+def test_missing_param_raises_and_defaults_apply():
+    with pytest.raises(ValueError, match="password"):
+        LOGIN.bind(FakeDriver(), login_id="user01")
+
+    case = LOGIN.bind(FakeDriver(), login_id="user01", password="pw")
+    assert case.operations[0].url == "https://example.com/login"
+    assert LOGIN.params == ["login_id", "password", "url"]
+
+
+def test_operations_without_a_matching_attribute_are_rebuilt():
+    # ClickUntilNotFoundはmax_clicksをmax_iterationsとして保持する
+    plan = Plan(Step(ClickUntilNotFound, "//button[@id='more']", Param("max_clicks")))
+    driver = FakeDriver()
+    first = plan.bind(driver, max_clicks=3).operations[0]
+
+    second = plan.bind(driver, max_clicks=7).operations[0]
+
+    assert second is not first
+    assert (first.max_iterations, second.max_iterations) == (3, 7)
+    assert not hasattr(second, "max_clicks")
+
+
+def test_nested_plans_are_flattened():
+    search = Plan(LOGIN, Step(Input, "//input[@name='q']", Param("query")), name="search")
+
+    assert len(search.steps) == 5
+    assert search.params == ["login_id", "password", "query", "url"]
+    case = search.bind(FakeDriver(), login_id="u", password="p", query="books")
+    assert case.operations[4].value == "books"
+
+
+def test_concurrent_bind_creates_one_case_per_driver():
+    driver = FakeDriver()
+    cases = []
+    threads = [
+        threading.Thread(target=lambda: cases.append(LOGIN.bind(driver, login_id="u", password="p")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(case is cases[0] for case in cases)
+
+
+@pytest.mark.parametrize("file_name", ["login.json", "login.yaml"])
+def test_save_and_load_round_trip(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    LOGIN.save(path)
+
+    loaded = Plan.load(path)
+
+    assert loaded.to_json() == LOGIN.to_json()
+    assert loaded.params == LOGIN.params
+    case = loaded.bind(FakeDriver(), login_id="user01", password="pw")
+    assert [type(op) for op in case.operations] == [Get, Input, Input, Submit]
+    assert case.operations[0].url == "https://example.com/login"
+
+
+def test_unknown_operation_cannot_be_loaded():
+    data = LOGIN.to_json()
+    data["steps"].append({"op": "Teleport", "args": []})
+
+    with pytest.raises(ValueError, match="Teleport"):
+        Plan.from_json(data)
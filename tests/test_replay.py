@@ -0,0 +1,160 @@
+"""_summary_
+RecordingDriverで記録したCaseを、ReplayDriverでブラウザ無しに再生できることと、
+記録に無いコマンドがReplayMissになることを確認する。
+"""
+import gzip
+import json
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+
+from lib.case import Case
+from lib.operation import Click, Get, Input
+from lib.replay import RecordingDriver, ReplayArchive, ReplayDriver, ReplayMiss
+
+LOGIN_PAGE = (
+    "<html><body><form><input name='q'><a id='next' href='/items'>next</a></form>"
+    + "<p>notice</p>" * 20
+    + "</body></html>"
+)
+ITEMS_PAGE = "<html><body><table>" + "<tr><td>item</td></tr>" * 20 + "</table></body></html>"
+
+
+class FakeElement(WebElement):
+    def click(self):
+        self.parent.get(self.parent.links[self.id])
+
+    def send_keys(self, *value):
+        self.parent.typed.append("".join(value))
+
+    def is_displayed(self):
+        return True
+
+    @property
+    def text(self):
+        return self.id
+
+
+class FakeSite:
+    """ページとリンクだけを持つブラウザ。記録・再生の検証用にコマンド数を数える"""
+
+    # 読み込み済みのページを操作するだけなので、待機条件は使わない
+    skip_ready_wait = True
+
+    def __init__(self):
+        self.pages = {"https://shop.example/login": LOGIN_PAGE, "https://shop.example/items": ITEMS_PAGE}
+        self.links = {"next": "https://shop.example/items"}
+        self.current_url = None
+        self.typed = []
+        self.commands = 0
+
+    def get(self, url):
+        self.commands += 1
+        self.current_url = url
+
+    @property
+    def page_source(self):
+        self.commands += 1
+        return self.pages[self.current_url]
+
+    def find_element(self, by, value):
+        self.commands += 1
+        if value == "//a[@id='next']":
+            return FakeElement(self, "next")
+        if value == "//input[@name='q']":
+            return FakeElement(self, "q")
+        raise NoSuchElementException(value)
+
+
+def login_case(driver, query="books"):
+    return Case(
+        Get(driver, "https://shop.example/login"),
+        Input(driver, "//input[@name='q']", query),
+        Click(driver, "//a[@id='next']"),
+    )
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    site = FakeSite()
+    recorder = RecordingDriver(site)
+    html = login_case(recorder).exec_operation(recorder)
+    assert recorder.current_url == "https://shop.example/items"
+    with pytest.raises(NoSuchElementException):
+        recorder.find_element(By.XPATH, "//div[@id='missing']")
+    path = str(tmp_path / "login.replay.gz")
+    recorder.save(path)
+    return site, html, path
+
+
+def test_replay_returns_the_recorded_pages_without_a_browser(recorded):
+    site, html, path = recorded
+    commands = site.commands
+    replay = ReplayDriver.load(path)
+
+    assert login_case(replay).exec_operation(replay) == html == ITEMS_PAGE
+    assert replay.current_url == "https://shop.example/items"
+    assert replay.misses == 0
+    assert site.commands == commands
+    assert site.typed == ["books"]
+
+
+def test_recorded_errors_are_raised_again(recorded):
+    _, _, path = recorded
+    replay = ReplayDriver.load(path)
+
+    with pytest.raises(NoSuchElementException):
+        replay.find_element(By.XPATH, "//div[@id='missing']")
+    assert replay.misses == 0
+
+
+def test_commands_that_were_not_recorded_are_misses(recorded):
+    _, _, path = recorded
+    replay = ReplayDriver.load(path)
+
+    # 記録と違う値の入力
+    with pytest.raises(ReplayMiss):
+        login_case(replay, query="music").exec_operation(replay)
+    with pytest.raises(ReplayMiss):
+        replay.find_element(By.CSS_SELECTOR, "a#next")
+    with pytest.raises(AttributeError):
+        replay.execute_cdp_cmd
+    assert replay.misses == 2
+
+
+def test_responses_are_replayed_in_order_and_borrow_rewinds(recorded):
+    _, _, path = recorded
+    replay = ReplayDriver.load(path)
+    # page_sourceは記録した順に返し、使い切ったら最後の応答を返し続ける
+    assert replay.page_source == ITEMS_PAGE
+    with replay.borrow(lean_allow=("image",)) as driver:
+        assert driver is replay
+        assert login_case(driver).exec_operation(driver) == ITEMS_PAGE
+        assert driver.misses == 0
+
+
+def test_long_responses_are_stored_once(tmp_path):
+    site = FakeSite()
+    recorder = RecordingDriver(site)
+    recorder.get("https://shop.example/items")
+    for _ in range(3):
+        recorder.page_source
+    recorder.get("https://shop.example/login")
+    recorder.page_source
+    path = str(tmp_path / "pages.replay.gz")
+    recorder.save(path)
+
+    archive = ReplayArchive.load(path)
+    assert archive.stats()["blobs"] == 2
+    assert list(archive.pages()) == [ITEMS_PAGE, LOGIN_PAGE]
+
+
+def test_unsupported_archive_version_is_rejected(tmp_path):
+    path = str(tmp_path / "old.replay.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"version": 0, "responses": {}, "blobs": {}}, f)
+
+    with pytest.raises(ValueError):
+        ReplayArchive.load(path)
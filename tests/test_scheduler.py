@@ -0,0 +1,124 @@
+"""_summary_
+AsyncSchedulerの実行時刻のヒープ・重複実行の抑止・例外の扱いを、
+数十ミリ秒間隔のfakeのscraperで確認する。
+"""
+import threading
+import time
+
+import pytest
+
+from lib.scheduler import AsyncScheduler
+
+# intervalは分単位
+MS = 1 / 60 / 1000
+
+
+class RecordingScraper:
+    def __init__(self, duration=0.0, fail=False):
+        self.duration = duration
+        self.fail = fail
+        self.started = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def exec(self):
+        with self.lock:
+            self.started.append(time.monotonic())
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.duration)
+            if self.fail:
+                raise RuntimeError("scrape failed")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def run_scheduler():
+    schedulers = []
+
+    def run(scheduler, seconds):
+        thread = threading.Thread(target=scheduler.start)
+        thread.start()
+        schedulers.append((scheduler, thread))
+        time.sleep(seconds)
+        scheduler.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+
+    yield run
+    for scheduler, thread in schedulers:
+        scheduler.stop()
+        thread.join(5)
+
+
+def test_jobs_run_at_their_own_interval(run_scheduler):
+    fast, slow = RecordingScraper(), RecordingScraper()
+    scheduler = AsyncScheduler()
+    scheduler.add(50 * MS, fast)
+    scheduler.add(200 * MS, slow)
+
+    run_scheduler(scheduler, 0.53)
+
+    # 開始直後に1回ずつ実行し、その後はそれぞれの間隔で実行する
+    assert 8 <= len(fast.started) <= 12
+    assert len(slow.started) == 3
+    gaps = [b - a for a, b in zip(slow.started, slow.started[1:])]
+    assert all(0.15 < gap < 0.3 for gap in gaps)
+
+
+def test_overdue_job_runs_once_after_the_running_one_finishes(run_scheduler):
+    scraper = RecordingScraper(duration=0.25)
+    scheduler = AsyncScheduler(max_workers=4)
+    job = scheduler.add(50 * MS, scraper)
+
+    run_scheduler(scheduler, 0.6)
+
+    # 実行中に来た実行時刻はまとめて1回にし、同時には実行しない
+    assert scraper.max_active == 1
+    assert job.overlaps > job.runs
+    assert job.runs == len(scraper.started) == 3
+    gaps = [b - a for a, b in zip(scraper.started, scraper.started[1:])]
+    assert all(gap < 0.3 for gap in gaps)
+
+
+def test_failing_scraper_does_not_stop_the_others(run_scheduler):
+    failing, healthy = RecordingScraper(fail=True), RecordingScraper()
+    scheduler = AsyncScheduler()
+    scheduler.add(50 * MS, failing)
+    scheduler.add(50 * MS, healthy)
+
+    run_scheduler(scheduler, 0.23)
+
+    failing_stats, healthy_stats = scheduler.stats()
+    assert failing_stats["failures"] == failing_stats["runs"] >= 4
+    assert healthy_stats["failures"] == 0
+    assert healthy_stats["runs"] >= 4
+
+
+def test_job_added_while_running_is_scheduled(run_scheduler):
+    first, late = RecordingScraper(), RecordingScraper()
+    scheduler = AsyncScheduler()
+    scheduler.add(1000 * MS, first)
+    threading.Timer(0.1, scheduler.add, (1000 * MS, late)).start()
+
+    run_scheduler(scheduler, 0.2)
+
+    assert len(first.started) == 1
+    assert len(late.started) == 1
+    assert late.started[0] - first.started[0] >= 0.09
+
+
+def test_stop_waits_for_running_scrapers(run_scheduler):
+    scraper = RecordingScraper(duration=0.3)
+    scheduler = AsyncScheduler()
+    job = scheduler.add(1000 * MS, scraper)
+
+    run_scheduler(scheduler, 0.05)
+
+    assert job.runs == 1
+    assert not job.running
+    assert scraper.active == 0
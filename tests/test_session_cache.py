@@ -0,0 +1,159 @@
+"""_summary_
+SessionCacheの保存・復元・期限切れ・無効になったセッションの扱いを、
+cookieとstorageだけを持つfakeのdriverで確認する。
+"""
+import os
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from lib import session_cache
+from lib.session_cache import (
+    STORAGE_RESTORE_SCRIPT,
+    STORAGE_SNAPSHOT_SCRIPT,
+    SessionCache,
+    load_session_key,
+)
+
+SITE = "https://shop.example"
+
+
+class FakeSite:
+    """ログインしたセッションIDを覚えているサーバー"""
+
+    def __init__(self):
+        self.sessions = set()
+        self.logins = 0
+
+    def login(self, driver):
+        self.logins += 1
+        sid = f"sid-{self.logins}"
+        self.sessions.add(sid)
+        driver.cookies["sid"] = {"name": "sid", "value": sid}
+        driver.local["cart"] = "3 items"
+
+    def probe(self, driver):
+        cookie = driver.cookies.get("sid")
+        return cookie is not None and cookie["value"] in self.sessions
+
+
+class FakeDriver:
+    def __init__(self):
+        self.url = None
+        self.cookies = {}
+        self.local = {}
+        self.session = {}
+
+    def get(self, url):
+        self.url = url
+
+    def get_cookies(self):
+        return list(self.cookies.values())
+
+    def add_cookie(self, cookie):
+        self.cookies[cookie["name"]] = cookie
+
+    def execute_script(self, script, *args):
+        if script == STORAGE_SNAPSHOT_SCRIPT:
+            return {"origin": SITE, "local": dict(self.local), "session": dict(self.session)}
+        if script == STORAGE_RESTORE_SCRIPT:
+            self.local.update(args[0]["local"])
+            self.session.update(args[0]["session"])
+            return None
+        raise AssertionError(f"unexpected script: {script}")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SessionCache(str(tmp_path / "sessions"), key=Fernet.generate_key(), ttl=60)
+
+
+def test_second_run_restores_the_saved_session(cache):
+    site = FakeSite()
+    assert not cache.ensure(FakeDriver(), SITE, "user01", site.login, site.probe)
+
+    driver = FakeDriver()
+    assert cache.ensure(driver, SITE, "user01", site.login, site.probe)
+
+    assert site.logins == 1
+    assert driver.url == SITE + "/"
+    assert driver.local == {"cart": "3 items"}
+    assert cache.stats() == {"hits": 1, "misses": 1, "invalid": 0}
+
+
+def test_snapshot_is_encrypted_per_account(cache):
+    site = FakeSite()
+    cache.ensure(FakeDriver(), SITE, "user01", site.login, site.probe)
+
+    files = os.listdir(cache.directory)
+    assert len(files) == 1
+    with open(os.path.join(cache.directory, files[0]), "rb") as f:
+        assert b"sid-1" not in f.read()
+    assert cache.load(SITE, "user02") is None
+
+
+def test_session_rejected_by_the_site_is_replaced(cache):
+    site = FakeSite()
+    cache.ensure(FakeDriver(), SITE, "user01", site.login, site.probe)
+    # サーバー側でセッションが切れた
+    site.sessions.clear()
+
+    assert not cache.ensure(FakeDriver(), SITE, "user01", site.login, site.probe)
+
+    assert site.logins == 2
+    assert cache.stats() == {"hits": 0, "misses": 2, "invalid": 1}
+    assert cache.load(SITE, "user01")["cookies"][0]["value"] == "sid-2"
+
+
+def test_expired_snapshot_and_cookies_are_not_restored(cache, monkeypatch):
+    site = FakeSite()
+    driver = FakeDriver()
+    site.login(driver)
+    driver.cookies["promo"] = {"name": "promo", "value": "x", "expiry": time.time() - 1}
+    cache.snapshot(driver, SITE, "user01")
+
+    restored = FakeDriver()
+    assert cache.restore(restored, SITE, "user01")
+    assert list(restored.cookies) == ["sid"]
+
+    now = time.time()
+    monkeypatch.setattr(session_cache.time, "time", lambda: now + 61)
+    assert cache.load(SITE, "user01") is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_snapshot_from_another_key_is_discarded(cache):
+    site = FakeSite()
+    cache.ensure(FakeDriver(), SITE, "user01", site.login, site.probe)
+
+    other = SessionCache(cache.directory, key=Fernet.generate_key())
+
+    assert other.load(SITE, "user01") is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_failed_login_raises(cache):
+    site = FakeSite()
+    with pytest.raises(RuntimeError):
+        cache.ensure(FakeDriver(), SITE, "user01", lambda driver: None, site.probe)
+    assert not os.path.exists(cache.directory)
+
+
+def test_processes_starting_together_share_one_key(tmp_path, monkeypatch):
+    monkeypatch.delenv(session_cache.SESSION_KEY_ENV, raising=False)
+    monkeypatch.setattr(session_cache, "SESSION_KEY_FILE", str(tmp_path / "pynium" / "session.key"))
+    keys = []
+    threads = [threading.Thread(target=lambda: keys.append(load_session_key())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(keys)) == 1
+    Fernet(keys[0])
+    assert os.stat(session_cache.SESSION_KEY_FILE).st_mode & 0o777 == 0o600
+
+    monkeypatch.setenv(session_cache.SESSION_KEY_ENV, keys[0].decode())
+    assert load_session_key() == keys[0]
@@ -0,0 +1,307 @@
+"""_summary_
+SpreadsheetWriterをfakeのgspread/Drive API(testing.fake_google)で実行し、
+API呼び出し後のシート・Driveの状態を確認する。
+
+    Usage:
+        python -m pytest -q
+"""
+import gspread
+import pytest
+from googleapiclient.errors import HttpError
+
+from lib import spreadsheet_writer
+from lib.spreadsheet_writer import FOLDER_MIME_TYPE, SpreadsheetWriter
+from lib.ttl_cache import TTLCache
+from testing.fake_google import (
+    FakeBatchRequest,
+    FakeDriveService,
+    FakeGspreadClient,
+    FakeResponse,
+    http_error,
+)
+
+
+@pytest.fixture(autouse=True)
+def row_hash_dir(tmp_path, monkeypatch):
+    # upsertが保存する行のハッシュをカレントディレクトリに残さない
+    monkeypatch.setattr(spreadsheet_writer, "ROW_HASH_DIR", str(tmp_path / "sheet_hashes"))
+
+
+@pytest.fixture(autouse=True)
+def drive_caches(monkeypatch):
+    # IDキャッシュはクラスで共有されるので、テストごとに空にする
+    monkeypatch.setattr(SpreadsheetWriter, "_folder_ids", TTLCache())
+    monkeypatch.setattr(SpreadsheetWriter, "_file_ids", TTLCache())
+    monkeypatch.setattr(SpreadsheetWriter, "saved_api_calls", 0)
+
+
+def make_writer(rate_limit_every=None):
+    client = FakeGspreadClient()
+    drive = FakeDriveService(rate_limit_every=rate_limit_every)
+    writer = SpreadsheetWriter(None, "test", client=client, drive_service=drive)
+    # fakeなので待機しない
+    writer.BACKOFF_BASE = 0.0
+    return writer, client, drive
+
+
+def records(n, changed=()):
+    return [
+        {"id": i, "name": f"item{i}{'*' if i in changed else ''}", "price": i * 100}
+        for i in range(n)
+    ]
+
+
+def expected_rows(objs):
+    return [["id", "name", "price"]] + [
+        [str(obj["id"]), obj["name"], str(obj["price"])] for obj in objs
+    ]
+
+
+def rows_by_id(writer):
+    header, *rows = writer.sheet.rows
+    assert header == ["id", "name", "price"]
+    return {row[0]: row for row in rows}
+
+
+def test_write_stream_writes_all_rows_in_chunks():
+    writer, client, _ = make_writer()
+    assert writer.write_stream(iter(records(1200)), chunk_size=500) == 1200
+    assert writer.sheet.rows == expected_rows(records(1200))
+    # ヘッダーを含めて1201行を500行ずつ
+    assert client.calls["append_rows"] == 3
+
+
+def test_write_retries_quota_errors_without_duplicating_rows():
+    writer, client, _ = make_writer()
+    client.fail_every = 2
+    writer.write(records(50), chunk_size=10)
+    assert client.calls["429"] > 0
+    assert writer.sheet.rows == expected_rows(records(50))
+
+
+def test_call_with_backoff_does_not_retry_other_errors():
+    writer, _, _ = make_writer()
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise gspread.exceptions.APIError(FakeResponse(400, "Invalid value"))
+
+    with pytest.raises(gspread.exceptions.APIError):
+        writer.call_with_backoff(bad_request)
+    assert len(calls) == 1
+
+
+def test_call_with_backoff_gives_up_after_max_retries():
+    writer, client, _ = make_writer()
+    writer.MAX_RETRIES = 2
+    client.fail_every = 1
+
+    with pytest.raises(gspread.exceptions.APIError):
+        writer.write(records(3))
+    assert client.calls["429"] == 3
+    assert writer.sheet.rows == []
+
+
+def test_delete_all_spreadsheets_follows_every_page():
+    writer, _, drive = make_writer()
+    writer.PAGE_SIZE = 10
+    for i in range(35):
+        drive.add_file(f"sheet{i}")
+
+    result = writer.delete_all_spreadsheets()
+
+    assert len(result.deleted) == 35
+    assert drive.files_by_id == {}
+    assert drive.calls["files.list"] == 4
+    # 100件ずつのバッチで削除する
+    assert drive.calls["batch"] == 1
+
+
+def test_delete_all_spreadsheets_retries_rate_limited_files():
+    writer, _, drive = make_writer(rate_limit_every=7)
+    for i in range(250):
+        drive.add_file(f"sheet{i}")
+    drive.add_file("folder", mime_type=spreadsheet_writer.FOLDER_MIME_TYPE)
+
+    result = writer.delete_all_spreadsheets()
+
+    assert result.failed == {}
+    assert len(result.deleted) == 250
+    assert [file["name"] for file in drive.files_by_id.values()] == ["folder"]
+
+
+def test_delete_files_reports_files_still_rate_limited():
+    writer, _, drive = make_writer(rate_limit_every=3)
+    # リトライしないので、バッチ内の3件に1件が429のまま残る
+    writer.MAX_RETRIES = 0
+    file_ids = [drive.add_file(f"sheet{i}") for i in range(10)]
+
+    result = writer.delete_files(file_ids)
+
+    assert sorted(result.failed) == sorted(file_ids[2::3])
+    assert all(isinstance(error, HttpError) for error in result.failed.values())
+    assert all(error.resp.status == 429 for error in result.failed.values())
+    assert sorted(result.deleted) == sorted(set(file_ids) - set(file_ids[2::3]))
+    # 失敗したファイルだけがDriveに残る
+    assert sorted(drive.files_by_id) == sorted(result.failed)
+
+
+def test_delete_reports_a_failed_batch_for_every_unfinished_file(monkeypatch):
+    writer, _, drive = make_writer()
+    file_ids = [drive.add_file("same") for _ in range(3)]
+
+    def broken_batch(callback=None):
+        batch = FakeBatchRequest(drive, callback)
+
+        def execute(http=None):
+            raise http_error(400, "Bad batch")
+
+        batch.execute = execute
+        return batch
+
+    monkeypatch.setattr(drive, "new_batch_http_request", broken_batch)
+    result = writer.delete("same")
+
+    assert result.deleted == []
+    assert sorted(result.failed) == sorted(file_ids)
+    assert sorted(drive.files_by_id) == sorted(file_ids)
+
+
+def test_upsert_updates_inserts_and_deletes_rows():
+    writer, client, _ = make_writer()
+    writer.write(records(10))
+
+    data = [obj for obj in records(12, changed={3, 7}) if obj["id"] not in (1, 2, 5)]
+    client.calls.clear()
+    result = writer.upsert(data, key="id", force=True)
+
+    assert result == {"inserted": 2, "updated": 2, "deleted": 1}
+    assert rows_by_id(writer) == {row[0]: row for row in expected_rows(data)[1:]}
+    assert len(writer.sheet.rows) == len(data) + 1
+    # 読み込み1回と、batch_update・削除の書き込み(追加は削除予定の行を再利用する)
+    assert client.calls["get_all_values"] == 1
+    assert client.calls["batch_update"] == 1
+    assert client.calls["spreadsheet.batch_update"] == 1
+    assert client.calls["append_rows"] == 0
+
+
+def test_upsert_appends_rows_beyond_stale_row_count():
+    writer, client, _ = make_writer()
+    writer.write(records(5))
+    # 他のクライアントの編集等で、キャッシュされたrow_countが実際の行数と食い違っている
+    writer.sheet.row_count = len(writer.sheet.rows)
+
+    data = records(8, changed={0})
+    result = writer.upsert(data, key="id", force=True)
+
+    assert result == {"inserted": 3, "updated": 1, "deleted": 0}
+    assert writer.sheet.rows == expected_rows(data)
+    assert client.calls["append_rows"] >= 1
+
+
+def test_upsert_skips_api_calls_when_unchanged():
+    writer, client, _ = make_writer()
+    data = records(20)
+    writer.upsert(data, key="id")
+    client.calls.clear()
+
+    assert writer.upsert(data, key="id") == {"inserted": 0, "updated": 0, "deleted": 0}
+    assert sum(client.calls.values()) == 0
+    assert writer.sheet.rows == expected_rows(data)
+
+
+def test_upsert_does_not_rewrite_unchanged_float_and_bool_cells():
+    writer, client, _ = make_writer()
+    data = [
+        {"id": i, "price": float(i * 100), "rate": i / 4, "active": i % 2 == 0, "note": None}
+        for i in range(10)
+    ]
+    writer.write(data)
+    # 表示値では3.0は"3"、Trueは"TRUE"になる
+    assert writer.sheet.rows[2] == ["1", "100", "0.25", "FALSE", ""]
+
+    client.calls.clear()
+    result = writer.upsert(data, key="id", force=True)
+
+    assert result == {"inserted": 0, "updated": 0, "deleted": 0}
+    assert client.calls["batch_update"] == 0
+    assert client.calls["append_rows"] == 0
+
+    data[3]["rate"] = 0.5
+    data[4]["active"] = False
+    result = writer.upsert(data, key="id", force=True)
+    assert result == {"inserted": 0, "updated": 2, "deleted": 0}
+    assert writer.sheet.rows[4] == ["3", "300", "0.5", "FALSE", ""]
+    assert writer.sheet.rows[5] == ["4", "400", "1", "FALSE", ""]
+
+
+def test_delete_rows_by_column_value_keeps_other_rows():
+    writer, client, _ = make_writer()
+    data = records(10)
+    writer.write(data)
+
+    client.calls.clear()
+    assert writer.delete_rows_by_column_value("id", {1, 2, 3, 8}) == 4
+    assert writer.sheet.rows == expected_rows([obj for obj in data if obj["id"] not in (1, 2, 3, 8)])
+    # 連続する行もまとめて、読み込み1回と削除1回
+    assert client.calls["get_all_values"] == 1
+    assert client.calls["spreadsheet.batch_update"] == 1
+
+    assert writer.delete_rows_by_column_value("price", lambda price: int(price) >= 600) == 3
+    assert writer.sheet.rows == expected_rows([obj for obj in data if obj["id"] in (0, 4, 5)])
+
+    assert writer.delete_rows_by_column_value("name", "item4") == 1
+    assert writer.delete_rows_by_column_value("missing", "x") == 0
+    assert writer.sheet.rows == expected_rows([obj for obj in data if obj["id"] in (0, 5)])
+
+
+def test_delete_rows_by_column_value_forgets_upsert_hashes():
+    writer, client, _ = make_writer()
+    data = records(5)
+    writer.upsert(data, key="id")
+    writer.delete_rows_by_column_value("id", "2")
+
+    # 行を削除したので、同じデータのupsertはシートと突き合わせて行を戻す
+    assert writer.upsert(data, key="id") == {"inserted": 1, "updated": 0, "deleted": 0}
+    assert rows_by_id(writer) == {row[0]: row for row in expected_rows(data)[1:]}
+
+
+def test_get_folder_id_caches_every_folder_on_the_path():
+    writer, _, drive = make_writer()
+    folder_id = writer.get_folder_id("/reports/2024/daily")
+
+    assert drive.calls["files.create"] == 3
+    assert drive.files_by_id[folder_id]["name"] == "daily"
+    drive.calls.clear()
+
+    assert writer.get_folder_id("/reports/2024/daily") == folder_id
+    assert writer.get_folder_id("/reports/2024")
+    # 途中のパスもキャッシュされているので、Drive APIは呼ばない
+    assert sum(drive.calls.values()) == 0
+    assert SpreadsheetWriter.cache_stats()["saved_api_calls"] == 5
+
+
+def test_delete_folder_forgets_cached_folder_ids():
+    writer, _, drive = make_writer()
+    old_id = writer.get_folder_id("/reports/2024")
+    writer.delete_folder("2024")
+
+    new_id = writer.get_folder_id("/reports/2024")
+
+    assert new_id != old_id
+    assert drive.files_by_id[new_id]["mimeType"] == FOLDER_MIME_TYPE
+    assert old_id not in drive.files_by_id
+
+
+def test_move_to_folder_reuses_cached_file_ids():
+    writer, _, drive = make_writer()
+    file_id = drive.add_file("test")
+    writer.move_to_folder("test", "/reports")
+    drive.calls.clear()
+
+    writer.move_to_folder("test", "/archive")
+
+    assert drive.files_by_id[file_id]["parents"] == [writer.get_folder_id("/archive")]
+    # スプレッドシートのIDは検索し直さず、作成するフォルダだけを検索する
+    assert drive.calls["files.list"] == 1
@@ -0,0 +1,199 @@
+"""_summary_
+TabRunnerのタブ・フレームの切り替えと並行実行を、タブごとの状態だけを持つfakeのdriverで確認する。
+"""
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.remote.webelement import WebElement
+
+from lib.browser_profile import LeanProfile
+from lib.tab_runner import COMMITTED_SCRIPT, NAVIGATE_SCRIPT, TabElement, TabRunner
+
+
+class Window:
+    def __init__(self):
+        self.url = "about:blank"
+        self.frames = []
+        self.marker = None  # window.__pyniumTabNav
+        self.pending = None  # (url, 遷移先に替わる時刻)
+
+
+class FakeSwitchTo:
+    def __init__(self, browser):
+        self.browser = browser
+
+    def window(self, handle):
+        self.browser.current = handle
+        self.browser.window.frames = []
+        self.browser.switches += 1
+
+    def new_window(self, type_hint=None):
+        handle = f"tab-{len(self.browser.windows)}"
+        self.browser.windows[handle] = Window()
+        self.window(handle)
+
+    def frame(self, frame_reference):
+        self.browser.window.frames.append(frame_reference)
+
+    def parent_frame(self):
+        self.browser.window.frames.pop()
+
+    def default_content(self):
+        self.browser.window.frames = []
+
+
+class FakeTabBrowser:
+    """タブのURL・フレームを持ち、遷移はcommit秒後に反映されるブラウザ。
+    コマンドは必ず現在のタブ・フレームに対して実行される
+    """
+
+    def __init__(self, commit=0.05):
+        self.commit = commit
+        self.windows = {"tab-0": Window()}
+        self.current = "tab-0"
+        self.switches = 0
+        self.cdp = []
+        self.switch_to = FakeSwitchTo(self)
+        self.in_command = threading.Lock()
+
+    @property
+    def window(self):
+        return self.windows[self.current]
+
+    @property
+    def current_window_handle(self):
+        return self.current
+
+    @property
+    def window_handles(self):
+        return list(self.windows)
+
+    @property
+    def current_url(self):
+        self._advance(self.window)
+        return self.window.url
+
+    def _advance(self, window):
+        if window.pending is not None and time.monotonic() >= window.pending[1]:
+            window.url = window.pending[0]
+            window.marker = None
+            window.pending = None
+
+    def execute_script(self, script, *args):
+        # TabRunnerのロックにより、コマンドは重ならない
+        assert self.in_command.acquire(blocking=False)
+        try:
+            window = self.window
+            if script == NAVIGATE_SCRIPT:
+                url, token = args
+                window.marker = token
+                if self.commit is not None:
+                    window.pending = (url, time.monotonic() + self.commit)
+                return None
+            if script == COMMITTED_SCRIPT:
+                self._advance(window)
+                return window.marker != args[0] and "complete"
+            if script == "return frames":
+                return list(window.frames)
+            raise AssertionError(f"unexpected script: {script}")
+        finally:
+            self.in_command.release()
+
+    def find_element(self, by, value):
+        return WebElement(self, f"{self.current}:{value}")
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp.append((self.current, cmd))
+        return {}
+
+    def close(self):
+        del self.windows[self.current]
+
+
+def test_jobs_run_concurrently_in_their_own_tabs():
+    browser = FakeTabBrowser(commit=0.2)
+    runner = TabRunner(browser, tabs=3)
+
+    def job(i):
+        def run(tab):
+            tab.get(f"https://example.com/{i}")
+            return tab.current_url
+
+        return run
+
+    results = runner.run([job(i) for i in range(6)])
+
+    assert [result.value for result in results] == [f"https://example.com/{i}" for i in range(6)]
+    assert {result.tab for result in results} == {0, 1, 2}
+    # 6件の読み込み(0.2秒ずつ)が3タブで重なる
+    assert runner.elapsed < 0.2 * 6 * 0.75
+    assert "jobs 6 (failed 0)" in runner.report()
+
+
+def test_failed_job_is_reported_without_stopping_the_others():
+    runner = TabRunner(FakeTabBrowser(), tabs=2)
+
+    def fail(tab):
+        raise RuntimeError("broken page")
+
+    results = runner.run([fail, lambda tab: "ok", lambda tab: "ok"])
+
+    assert isinstance(results[0].error, RuntimeError)
+    assert [result.value for result in results[1:]] == ["ok", "ok"]
+    assert "failed 1" in runner.report()
+
+
+def test_each_tab_keeps_its_frame():
+    browser = FakeTabBrowser()
+    runner = TabRunner(browser, tabs=2)
+    first, second = runner.tabs
+    first.switch_to.frame("outer")
+    first.switch_to.frame("inner")
+
+    assert second.execute_script("return frames") == []
+    # 切り替えて戻るとフレームの位置が復元される
+    assert first.execute_script("return frames") == ["outer", "inner"]
+    first.switch_to.parent_frame()
+    assert second.execute_script("return frames") == []
+    assert first.execute_script("return frames") == ["outer"]
+    first.switch_to.default_content()
+    assert first.execute_script("return frames") == []
+
+
+def test_elements_switch_back_to_their_tab():
+    browser = FakeTabBrowser()
+    runner = TabRunner(browser, tabs=2)
+    first, second = runner.tabs
+    element = first.find_element("xpath", "//a")
+    second.execute_script("return frames")
+
+    assert isinstance(element, TabElement)
+    assert element.wrapped_element.id == f"{first.handle}://a"
+    # 要素の属性を読むと、要素のあるタブに切り替える
+    element.id
+    assert browser.current == first.handle
+
+
+def test_get_raises_when_navigation_never_commits():
+    browser = FakeTabBrowser(commit=None)
+    runner = TabRunner(browser, tabs=1, navigation_timeout=0.1, poll_interval=0.01)
+
+    with pytest.raises(TimeoutException):
+        runner.tabs[0].get("https://example.com/hang")
+
+
+def test_tabs_are_blocked_and_closed():
+    browser = FakeTabBrowser()
+    browser.lean_profile = LeanProfile()
+    runner = TabRunner(browser, tabs=3)
+
+    blocked = [handle for handle, cmd in browser.cdp if cmd == "Network.setBlockedURLs"]
+    assert blocked == ["tab-0", "tab-1", "tab-2"]
+
+    runner.close()
+    assert browser.window_handles == ["tab-0"]
+    assert browser.current == "tab-0"
+    with pytest.raises(ValueError):
+        runner.tabs[0].quit()
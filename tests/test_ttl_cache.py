@@ -0,0 +1,65 @@
+"""_summary_
+TTLCacheの有効期限と上限を超えたときの削除を、時刻を進めて確認する。
+"""
+import pytest
+
+from lib import ttl_cache
+from lib.ttl_cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("folder", "id-1")
+
+    clock[0] += 9.9
+    assert cache.get("folder") == "id-1"
+    clock[0] += 0.1
+    assert cache.get("folder", "missing") == "missing"
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_set_renews_the_expiry(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("folder", "id-1")
+    clock[0] += 8
+    cache.set("folder", "id-2")
+    clock[0] += 8
+
+    assert cache.get("folder") == "id-2"
+
+
+def test_expired_entries_are_purged_before_the_soonest_to_expire(clock):
+    cache = TTLCache(ttl=10, max_entries=3)
+    cache.set("a", 1)
+    clock[0] += 5
+    cache.set("b", 2)
+    cache.set("c", 3)
+    clock[0] += 6
+    # aは期限切れなので、上限に達してもbとcは残る
+    cache.set("d", 4)
+    assert [cache.get(key) for key in "abcd"] == [None, 2, 3, 4]
+
+    cache.set("e", 5)
+    # 期限切れが無ければ、期限の近いものから削除する
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "cde"] == [3, 4, 5]
+
+
+def test_delete_if_removes_matching_keys():
+    cache = TTLCache()
+    for key in [("creds-1", "A"), ("creds-1", "A/B"), ("creds-2", "A")]:
+        cache.set(key, key[1])
+
+    cache.delete_if(lambda key: key[0] == "creds-1")
+
+    assert len(cache) == 1
+    assert cache.get(("creds-2", "A")) == "A"